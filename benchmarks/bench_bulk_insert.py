@@ -0,0 +1,198 @@
+"""Скорость вставки событий: ORM bulk_create против COPY FROM STDIN.
+
+Пути: сервис напрямую, загрузка файла (/load-events/) и тело NDJSON с gzip (/events/ingest/).
+Отдельно замеряется работа самой БД над готовым текстом COPY (вставка, индексы, внешний
+ключ) - это потолок для любого пути через COPY. Цена каждого индекса и внешнего ключа
+видна по той же вставке без него, а рядом - время первой страницы /api/events/ без него.
+
+Запуск: python -m benchmarks.bench_bulk_insert --rows 100000
+"""
+
+import argparse
+import gzip
+import io
+import json
+import random
+
+from benchmarks.common import best_time
+from benchmarks.common import setup_django
+from benchmarks.common import test_database
+from benchmarks.common import truncate_events
+
+
+def make_events(sensor_ids, count):
+    rnd = random.Random(42)
+    return [
+        {
+            'sensor_id': rnd.choice(sensor_ids),
+            'name': f'Event {i}',
+            'temperature': round(rnd.uniform(-50, 50), 2),
+            'humidity': round(rnd.uniform(0, 100), 2),
+        }
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--sensors', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--page-size', type=int, default=100)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from django.db import connection
+    from django.db import transaction
+    from django.test import override_settings
+    from django.urls import reverse
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+
+    from sensors.app.models import Event
+    from sensors.app.models import Sensor
+    from sensors.app.services import EventColumns
+    from sensors.app.services import EventService
+    from sensors.app.services import _copy_lines
+
+    with test_database(), override_settings(RESPONSE_CACHE_TIMEOUT=0):
+        sensors = Sensor.objects.bulk_create(
+            [Sensor(name=f'Sensor {i}', sensor_type=Sensor.SensorType.TYPE_1) for i in range(args.sensors)]
+        )
+        sensor_ids = [sensor.id for sensor in sensors]
+        events = make_events(sensor_ids, args.rows)
+        payload = json.dumps(events).encode('utf-8')
+        ndjson_payload = gzip.compress(b''.join(json.dumps(event).encode('utf-8') + b'\n' for event in events))
+        client = APIClient()
+
+        def service_insert():
+            EventService.bulk_create_events(events, set(sensor_ids))
+
+        def endpoint_insert():
+            upload = SimpleUploadedFile('events.json', payload)
+            response = client.post('/load-events/', {'json_file': upload}, format='multipart')
+            assert response.status_code == 201, response.content
+
+        def ingest_insert():
+            response = client.generic(
+                'POST',
+                reverse('events-ingest'),
+                ndjson_payload,
+                content_type='application/x-ndjson',
+                HTTP_CONTENT_ENCODING='gzip',
+            )
+            assert response.status_code == 201, response.content
+
+        copy_text = _copy_lines(EventColumns.from_rows(events), timezone.now().isoformat())
+        columns = ', '.join(
+            connection.ops.quote_name(Event._meta.get_field(name).column) for name in EventService.COPY_FIELDS
+        )
+        copy_sql = f'COPY {connection.ops.quote_name(Event._meta.db_table)} ({columns}) FROM STDIN'
+
+        def server_copy():
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.copy_expert(copy_sql, io.StringIO(copy_text))
+                connection.check_constraints()
+
+        def fill_events():
+            # события раз в 10 секунд, чтобы порядок по created_at был как у живой таблицы
+            truncate_events()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    INSERT INTO {connection.ops.quote_name(Event._meta.db_table)}
+                        (sensor_id, name, temperature, humidity, created_at)
+                    SELECT (%s::bigint[])[1 + n %% %s], 'Event ' || n, 20.0, 50.0, now() - n * interval '10 seconds'
+                    FROM generate_series(1, %s) AS n
+                    """,
+                    [sensor_ids, len(sensor_ids), args.rows],
+                )
+                cursor.execute('ANALYZE')
+
+        def first_page():
+            response = client.get(reverse('events-list'), {'pagination': 'cursor', 'page_size': args.page_size})
+            assert response.status_code == 200, response.content
+
+        def measure():
+            copy_time = best_time(server_copy, args.repeat, setup=truncate_events)
+            fill_events()
+            return copy_time, best_time(first_page, args.repeat)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT c.relname, pg_get_indexdef(i.indexrelid)
+                FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE i.indrelid = %s::regclass AND NOT i.indisprimary
+                """,
+                [Event._meta.db_table],
+            )
+            indexes = cursor.fetchall()
+            cursor.execute(
+                """
+                SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+                WHERE conrelid = %s::regclass AND contype = 'f'
+                """,
+                [Event._meta.db_table],
+            )
+            foreign_keys = cursor.fetchall()
+        table = connection.ops.quote_name(Event._meta.db_table)
+        # (что убрать, как вернуть) для каждого индекса и внешнего ключа, таблица после замера прежняя
+        variants = [
+            (
+                name,
+                f'DROP INDEX {connection.ops.quote_name(name)}',
+                definition.replace(' ON ONLY ', ' ON '),
+            )
+            for name, definition in indexes
+        ] + [
+            (
+                name,
+                f'ALTER TABLE {table} DROP CONSTRAINT {connection.ops.quote_name(name)}',
+                f'ALTER TABLE {table} ADD CONSTRAINT {connection.ops.quote_name(name)} {definition}',
+            )
+            for name, definition in foreign_keys
+        ]
+        server_time, page_time = measure()
+        costs = {}
+        for name, drop_sql, restore_sql in variants:
+            with connection.cursor() as cursor:
+                cursor.execute(drop_sql)
+            try:
+                costs[name] = measure()
+            finally:
+                truncate_events()
+                with connection.cursor() as cursor:
+                    cursor.execute(restore_sql)
+
+        results = {}
+        for mode, copy_min_batch in (('orm', None), ('copy', 1)):
+            with override_settings(EVENTS_COPY_MIN_BATCH=copy_min_batch):
+                results[mode] = {
+                    'service': best_time(service_insert, args.repeat, setup=truncate_events),
+                    'endpoint': best_time(endpoint_insert, args.repeat, setup=truncate_events),
+                    'ingest': best_time(ingest_insert, args.repeat, setup=truncate_events),
+                }
+
+    print(f'rows={args.rows}')
+    for path in ('service', 'endpoint', 'ingest'):
+        orm_rate = args.rows / results['orm'][path]
+        copy_rate = args.rows / results['copy'][path]
+        print(
+            f'{path:<9} orm: {orm_rate:>10,.0f} rows/s   copy: {copy_rate:>10,.0f} rows/s   '
+            f'speedup: x{copy_rate / orm_rate:.1f}'
+        )
+    server_rate = args.rows / server_time
+    orm_rate = args.rows / results['orm']['endpoint']
+    print(f'db only  copy: {server_rate:>10,.0f} rows/s   ceiling vs endpoint orm: x{server_rate / orm_rate:.1f}')
+    print(f'\n{"without":<48} {"db only copy":>14} {"first page":>12}')
+    print(f'{"-":<48} {server_rate:>9,.0f} r/s {page_time * 1000:>9.1f} ms')
+    for name, (copy_time, name_page_time) in costs.items():
+        print(f'{name:<48} {args.rows / copy_time:>9,.0f} r/s {name_page_time * 1000:>9.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Масштабирование загрузки NDJSON файла по числу процессов (ParallelEventLoader).
+
+Файл пишется во временный каталог, загружается с каждым числом процессов в пустую
+таблицу, печатаются строки в секунду и ускорение относительно одного процесса.
+Ускорение ограничено числом ядер машины и пропускной способностью PostgreSQL.
+
+Запуск: python -m benchmarks.bench_parallel_load --rows 1000000 --workers 1 2 4 8
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+
+from benchmarks.common import best_time
+from benchmarks.common import setup_django
+from benchmarks.common import test_database
+from benchmarks.common import truncate_events
+
+
+def write_events(path, sensor_ids, count):
+    rnd = random.Random(42)
+    with open(path, 'w', encoding='utf-8') as file:
+        for i in range(count):
+            event = {
+                'sensor_id': rnd.choice(sensor_ids),
+                'name': f'Event {i}',
+                'temperature': round(rnd.uniform(-50, 50), 2),
+                'humidity': round(rnd.uniform(0, 100), 2),
+            }
+            file.write(json.dumps(event) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--sensors', type=int, default=100)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--chunk-size', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from sensors.app.models import Sensor
+    from sensors.app.parallel import ParallelEventLoader
+
+    print(f'rows={args.rows} cpus={os.cpu_count()}')
+    with test_database(), tempfile.TemporaryDirectory() as tmp:
+        sensors = Sensor.objects.bulk_create(
+            [Sensor(name=f'Sensor {i}', sensor_type=Sensor.SensorType.TYPE_1) for i in range(args.sensors)]
+        )
+        path = os.path.join(tmp, 'events.ndjson')
+        write_events(path, [sensor.id for sensor in sensors], args.rows)
+
+        def load(workers):
+            loader = ParallelEventLoader.create(workers, chunk_size=args.chunk_size)
+            result = loader.load_path(path, ndjson=True)
+            assert result['created'] == args.rows, result
+
+        base_rate = None
+        for workers in args.workers:
+            elapsed = best_time(lambda workers=workers: load(workers), args.repeat, setup=truncate_events)
+            rate = args.rows / elapsed
+            base_rate = base_rate or rate
+            print(f'workers={workers:<3} {rate:>12,.0f} rows/s   speedup: x{rate / base_rate:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Скорость списков событий: EventSerializer + JSONRenderer против values_list + orjson.
+
+Замеряется весь запрос GET /api/events/ при разных размерах страницы, кэш ответов выключен.
+
+Запуск: python -m benchmarks.bench_serialization --rows 10000 --page-sizes 20 1000 10000
+"""
+
+import argparse
+import random
+
+from benchmarks.common import best_time
+from benchmarks.common import setup_django
+from benchmarks.common import test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--page-sizes', type=int, nargs='+', default=[20, 1_000, 10_000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.test import override_settings
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    from sensors.app.models import Sensor
+    from sensors.app.services import EventService
+
+    rnd = random.Random(42)
+    with test_database(), override_settings(RESPONSE_CACHE_TIMEOUT=0):
+        sensor = Sensor.objects.create(name='Sensor', sensor_type=Sensor.SensorType.TYPE_1)
+        events = [
+            {
+                'sensor_id': sensor.id,
+                'name': f'Event {i}',
+                'temperature': round(rnd.uniform(-50, 50), 2),
+                'humidity': round(rnd.uniform(0, 100), 2),
+            }
+            for i in range(args.rows)
+        ]
+        EventService.bulk_create_events(events, {sensor.id})
+        client = APIClient()
+        url = reverse('events-list')
+
+        def fetch(page_size):
+            response = client.get(url, {'page_size': page_size})
+            assert response.status_code == 200, response.content
+            return response.content
+
+        print(f'{"page size":>10} {"drf, ms":>10} {"fast, ms":>10} {"speedup":>8}')
+        for page_size in args.page_sizes:
+            timings = {}
+            contents = {}
+            for mode, fast in (('drf', False), ('fast', True)):
+                with override_settings(EVENTS_FAST_SERIALIZATION=fast):
+                    contents[mode] = fetch(page_size)
+                    timings[mode] = best_time(lambda page_size=page_size: fetch(page_size), args.repeat)
+            assert contents['drf'] == contents['fast']
+            print(
+                f'{page_size:>10} {timings["drf"] * 1000:>10.1f} {timings["fast"] * 1000:>10.1f} '
+                f'{timings["drf"] / timings["fast"]:>7.1f}x'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import os
+import random
+import time
+
+from contextlib import contextmanager
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sensors.settings')
+    import django
+
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    """Временная тестовая БД, чтобы бенчмарки не трогали рабочие данные"""
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    from django.test.utils import teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def make_raw_events(sensor_ids, count, error_ratio=0.0, seed=42):
+    """Синтетические события для датчиков sensor_ids, доля error_ratio - с ошибками валидации"""
+    rnd = random.Random(seed)
+    broken = [
+        {'name': 'Без датчика', 'temperature': 20.0},
+        {'sensor_id': sensor_ids[0], 'name': 'Жара', 'temperature': 500.0},
+        {'sensor_id': sensor_ids[0], 'name': 'Без параметров'},
+        {'sensor_id': 'abc', 'name': 'Строка', 'humidity': 10.0},
+    ]
+    return [
+        rnd.choice(broken)
+        if rnd.random() < error_ratio
+        else {
+            'sensor_id': rnd.choice(sensor_ids),
+            'name': f'Event {i}',
+            'temperature': round(rnd.uniform(-50, 50), 2),
+            'humidity': round(rnd.uniform(0, 100), 2),
+        }
+        for i in range(count)
+    ]
+
+
+def truncate_events():
+    from django.db import connection
+
+    from sensors.app.models import Event
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'TRUNCATE {connection.ops.quote_name(Event._meta.db_table)}')
+
+
+def best_time(func, repeat=3, setup=None):
+    """Лучшее время из repeat запусков, setup выполняется перед каждым и не замеряется"""
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
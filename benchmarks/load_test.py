@@ -0,0 +1,141 @@
+"""Нагрузочный тест: синхронные вьюсеты DRF против async-представлений под Uvicorn.
+
+Поднимает Uvicorn на временной тестовой БД и для каждой пары эндпоинтов держит
+заданное число соединений keep-alive, считая запросы в секунду и p99 задержки.
+Кэш ответов выключен, чтобы запросы доходили до БД.
+
+Запуск: python -m benchmarks.load_test --concurrency 1 16 64 --duration 10
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+from itertools import chain
+
+from benchmarks.common import setup_django
+from benchmarks.common import test_database
+
+
+async def read_response(reader):
+    status_line = await reader.readline()
+    status = int(status_line.split()[1])
+    headers = {}
+    while (line := await reader.readline()) not in (b'\r\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while size := int((await reader.readline()).strip(), 16):
+            await reader.readexactly(size + 2)
+        await reader.readline()
+    return status
+
+
+async def client(port, path, deadline):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    request = f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n'.encode('ascii')
+    latencies = []
+    try:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            writer.write(request)
+            status = await read_response(reader)
+            assert status == 200, f'{path}: HTTP {status}'
+            latencies.append(time.perf_counter() - started)
+    finally:
+        writer.close()
+    return latencies
+
+
+async def run_load(port, path, concurrency, duration):
+    deadline = time.perf_counter() + duration
+    results = await asyncio.gather(*(client(port, path, deadline) for _ in range(concurrency)))
+    latencies = sorted(chain.from_iterable(results))
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return len(latencies) / duration, p99
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, database_name):
+    env = dict(os.environ, POSTGRES_DB=database_name, RESPONSE_CACHE_TIMEOUT='0')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'sensors.asgi:application', '--port', str(port), '--log-level', 'warning'],
+        env=env,
+    )
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError('Uvicorn не запустился')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64])
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.db import connection
+
+    from sensors.app.models import Sensor
+    from sensors.app.services import EventService
+
+    rnd = random.Random(42)
+    with test_database():
+        sensor = Sensor.objects.create(name='Sensor', sensor_type=Sensor.SensorType.TYPE_1)
+        events = [
+            {
+                'sensor_id': sensor.id,
+                'name': f'Event {i}',
+                'temperature': round(rnd.uniform(-50, 50), 2),
+                'humidity': None,
+            }
+            for i in range(args.rows)
+        ]
+        EventService.bulk_create_events(events, {sensor.id})
+        # сервер открывает свои соединения, тестовую БД держать не нужно
+        connection.close()
+
+        endpoints = [
+            ('events', f'/events/?page_size={args.page_size}'),
+            ('sensor', f'/sensors/{sensor.id}/'),
+            ('sensor events', f'/sensors/{sensor.id}/events/?page_size={args.page_size}'),
+        ]
+        port = free_port()
+        server = start_server(port, connection.settings_dict['NAME'])
+        try:
+            print(f'{"endpoint":<14} {"clients":>7} {"sync rps":>9} {"async rps":>9} {"sync p99":>9} {"async p99":>9}')
+            for name, path in endpoints:
+                for concurrency in args.concurrency:
+                    sync_rps, sync_p99 = asyncio.run(run_load(port, path, concurrency, args.duration))
+                    async_rps, async_p99 = asyncio.run(run_load(port, f'/async{path}', concurrency, args.duration))
+                    print(
+                        f'{name:<14} {concurrency:>7} {sync_rps:>9.0f} {async_rps:>9.0f} '
+                        f'{sync_p99 * 1000:>7.1f}ms {async_p99 * 1000:>7.1f}ms'
+                    )
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""Набор бенчмарков горячих путей: разбор, валидация, вставка и чтение событий.
+
+Генерирует N датчиков и M событий (доля --error-ratio - с ошибками валидации) во
+временной тестовой БД и замеряет каждый случай лучшим из --repeat запусков. Результаты
+печатаются таблицей и с --output сохраняются в JSON. С --baseline каждый случай
+сравнивается с сохранённым ранее файлом: замедление больше --tolerance считается
+регрессией, и команда завершается с кодом 1.
+
+Запуск:
+    python -m benchmarks.suite --sensors 100 --events 100000 --output baseline.json
+    python -m benchmarks.suite --sensors 100 --events 100000 --baseline baseline.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+
+from datetime import UTC
+from datetime import datetime
+
+from benchmarks.common import best_time
+from benchmarks.common import make_raw_events
+from benchmarks.common import setup_django
+from benchmarks.common import test_database
+from benchmarks.common import truncate_events
+
+
+def git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def compare(results, baseline, tolerance):
+    """Строки сравнения с базой и признак регрессии хотя бы одного случая"""
+    lines = []
+    regressed = False
+    for name, result in results.items():
+        base = baseline['results'].get(name)
+        if base is None:
+            lines.append(f'{name:<24} нет в базе')
+            continue
+        ratio = result['seconds'] / base['seconds']
+        status = 'ok'
+        if ratio > 1 + tolerance:
+            status = 'РЕГРЕССИЯ'
+            regressed = True
+        elif ratio < 1 - tolerance:
+            status = 'быстрее'
+        lines.append(
+            f'{name:<24} {base["seconds"] * 1000:>10.1f} {result["seconds"] * 1000:>10.1f} x{ratio:<6.2f} {status}'
+        )
+    return lines, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sensors', type=int, default=100)
+    parser.add_argument('--events', type=int, default=100_000)
+    parser.add_argument('--error-ratio', type=float, default=0.05)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='+', help='Запустить только случаи с этими именами')
+    parser.add_argument('--output', help='Файл для результатов в JSON')
+    parser.add_argument('--baseline', help='Файл результатов прошлого запуска для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Допустимое замедление относительно базы')
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.db import connection
+    from django.test import override_settings
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    from sensors.app.models import Sensor
+    from sensors.app.services import EventDataParser
+    from sensors.app.services import EventDataValidator
+    from sensors.app.services import EventService
+
+    results = {}
+
+    def run(name, func, rows, setup=None):
+        if args.only and name not in args.only:
+            return
+        seconds = best_time(func, args.repeat, setup=setup)
+        results[name] = {'seconds': seconds, 'rows': rows, 'rows_per_s': rows / seconds if seconds else None}
+        print(f'{name:<24} {seconds * 1000:>10.1f} ms {results[name]["rows_per_s"] or 0:>14,.0f} rows/s')
+
+    with test_database(), override_settings(RESPONSE_CACHE_TIMEOUT=0):
+        sensors = Sensor.objects.bulk_create(
+            [Sensor(name=f'Sensor {i}', sensor_type=Sensor.SensorType.TYPE_1) for i in range(args.sensors)]
+        )
+        sensor_ids = [sensor.id for sensor in sensors]
+        raw_events = make_raw_events(sensor_ids, args.events, args.error_ratio)
+        json_payload = json.dumps(raw_events).encode('utf-8')
+        ndjson_payload = b''.join(json.dumps(event).encode('utf-8') + b'\n' for event in raw_events)
+        events, _ = EventDataValidator.validate_events(raw_events)
+
+        def insert():
+            EventService.bulk_create_events(events, set(sensor_ids))
+
+        run('parse_json', lambda: list(EventDataParser.iter_json_array(io.BytesIO(json_payload))), args.events)
+        run('parse_ndjson', lambda: list(EventDataParser.iter_ndjson(io.BytesIO(ndjson_payload))), args.events)
+        run('validate_scalar', lambda: EventDataValidator.validate_events(raw_events), args.events)
+        run('bulk_insert', insert, len(events), setup=truncate_events)
+
+        # случаи чтения идут по одной и той же заполненной таблице
+        truncate_events()
+        insert()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        client = APIClient()
+        sensor_id = sensor_ids[0]
+        sensor_events = sum(1 for event in events if event['sensor_id'] == sensor_id)
+
+        def get(url, params=None):
+            response = client.get(url, params)
+            assert response.status_code == 200, response.content
+            return response.json()
+
+        def list_filtered():
+            params = {'sensor_id': sensor_id, 'temperature_min': -10, 'temperature_max': 30}
+            get(reverse('events-list'), {**params, 'page_size': args.page_size})
+
+        def list_last_page():
+            url = reverse('sensors-events', args=[sensor_id])
+            get(url, {'page_size': args.page_size, 'page': max((sensor_events - 1) // args.page_size + 1, 1)})
+
+        def walk_cursor_pages():
+            url = reverse('sensors-events', args=[sensor_id])
+            data = get(url, {'pagination': 'cursor', 'page_size': args.page_size})
+            while data['next']:
+                data = get(data['next'])
+
+        run('list_filtered', list_filtered, args.page_size)
+        run('sensor_events_last_page', list_last_page, args.page_size)
+        run('sensor_events_cursor', walk_cursor_pages, sensor_events)
+
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW server_version')
+            postgres_version = cursor.fetchone()[0]
+
+    report = {
+        'created_at': datetime.now(UTC).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'environment': {
+            'python': platform.python_version(),
+            'postgres': postgres_version,
+            'cpus': os.cpu_count(),
+        },
+        'params': {
+            'sensors': args.sensors,
+            'events': args.events,
+            'error_ratio': args.error_ratio,
+            'page_size': args.page_size,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+            file.write('\n')
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+        if baseline['params'] != report['params']:
+            print(f'Параметры базы отличаются: {baseline["params"]}')
+        print(f'\nсравнение с {args.baseline} ({baseline.get("commit")}), допуск {args.tolerance:.0%}')
+        print(f'{"case":<24} {"base, ms":>10} {"now, ms":>10}')
+        lines, regressed = compare(results, baseline, args.tolerance)
+        print('\n'.join(lines))
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
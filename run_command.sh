@@ -6,5 +6,7 @@ ruff check . && echo "✓ Linting done"
 mypy . && echo "✓ Type checking done"
 
 python manage.py migrate
+python manage.py event_partitions
+python manage.py recover_import_jobs
 
 uvicorn sensors.asgi:application --host 0.0.0.0 --port 8080 --reload
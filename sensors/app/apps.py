@@ -4,3 +4,25 @@ from django.apps import AppConfig
 class SensorsAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sensors.app'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_delete
+        from django.db.models.signals import post_save
+
+        from sensors.app.cache import forget_sensor
+        from sensors.app.cache import invalidate_response_cache
+        from sensors.app.cache import remember_sensor
+        from sensors.app.metrics import install_query_timer
+        from sensors.app.models import Event
+        from sensors.app.models import Sensor
+        from sensors.app.profiling import install_sql_capture
+
+        # одиночные записи из API, админки и shell; массовые пути сбрасывают кэш явно
+        for model in (Sensor, Event):
+            post_save.connect(invalidate_response_cache, sender=model)
+            post_delete.connect(invalidate_response_cache, sender=model)
+        post_save.connect(remember_sensor, sender=Sensor)
+        post_delete.connect(forget_sensor, sender=Sensor)
+        connection_created.connect(install_query_timer)
+        connection_created.connect(install_sql_capture)
@@ -0,0 +1,136 @@
+"""Async-версии горячих эндпоинтов для запуска под Uvicorn (sensors/asgi.py).
+
+Ответы совпадают с синхронными вьюсетами, кроме браузерного API и кэша ответов.
+Async ORM в Django 5.2 выполняет каждый запрос через sync_to_async(thread_sensitive=True),
+то есть все запросы к БД процесса идут по очереди в одном потоке. Поэтому работа с БД
+здесь идёт не через async ORM, а целиком в пуле из ASYNC_DB_THREADS потоков (in_db_thread),
+у каждого потока своё соединение: медленный запрос к БД или загрузка файла не задерживают
+остальные, а цикл событий не занят ожиданием медленного клиента.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET
+from django.views.decorators.http import require_POST
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework.exceptions import APIException
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.parsers import MultiPartParser
+from rest_framework.request import Request
+
+from sensors.app.models import Event
+from sensors.app.models import Sensor
+from sensors.app.pagination import EventPagination
+from sensors.app.renderers import ORJSONRenderer
+from sensors.app.serializers import EventRowSerializer
+from sensors.app.serializers import EventSerializer
+from sensors.app.serializers import SensorSerializer
+from sensors.app.views import EventViewSet
+from sensors.app.views import load_events as load_events_sync
+
+
+# потоки для работы с БД; соединения Django принадлежат потоку, так что у каждого своё
+_db_executor = ThreadPoolExecutor(max_workers=settings.ASYNC_DB_THREADS, thread_name_prefix='async-db')
+
+
+def in_db_thread(func):
+    """Awaitable-версия func, которая выполняется в потоке _db_executor.
+
+    Соединение потока закрывается до и после вызова, если оно сломано или устарело
+    (CONN_MAX_AGE), как в начале и в конце обычного запроса.
+    """
+
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False, executor=_db_executor)
+
+
+def json_response(data, status=200):
+    return HttpResponse(ORJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def async_api_view(view):
+    """Оборачивает запрос в DRF Request и превращает APIException в JSON-ответ, как DRF"""
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(Request(request, parsers=[MultiPartParser()]), *args, **kwargs)
+        except APIException as exc:
+            detail = exc.detail if isinstance(exc.detail, list | dict) else {'detail': exc.detail}
+            return json_response(detail, status=exc.status_code)
+
+    return wrapper
+
+
+def paginated_events(request, queryset):
+    paginator = EventPagination()
+    if settings.EVENTS_FAST_SERIALIZATION:
+        page = paginator.paginate_queryset(EventRowSerializer.queryset(queryset), request)
+        data = EventRowSerializer.data(page)
+    else:
+        page = paginator.paginate_queryset(queryset, request)
+        data = EventSerializer(page, many=True).data
+    return paginator.get_paginated_response(data).data
+
+
+@in_db_thread
+def events_page(request):
+    queryset = EventViewSet.queryset.all()
+    for backend in (DjangoFilterBackend(), OrderingFilter()):
+        queryset = backend.filter_queryset(request, queryset, EventViewSet)
+    return paginated_events(request, queryset)
+
+
+@in_db_thread
+def sensor_data(pk):
+    try:
+        return SensorSerializer(Sensor.objects.select_related('state').get(pk=pk)).data
+    except Sensor.DoesNotExist:
+        raise NotFound() from None
+
+
+@in_db_thread
+def sensor_events_page(request, pk):
+    if not Sensor.objects.filter(pk=pk).exists():
+        raise NotFound()
+    return paginated_events(request, Event.objects.filter(sensor_id=pk).order_by('-created_at', '-id'))
+
+
+@require_GET
+@async_api_view
+async def event_list(request):
+    return json_response(await events_page(request))
+
+
+@require_GET
+@async_api_view
+async def sensor_detail(request, pk):
+    return json_response(await sensor_data(pk))
+
+
+@require_GET
+@async_api_view
+async def sensor_events(request, pk):
+    return json_response(await sensor_events_page(request, pk))
+
+
+@csrf_exempt
+@require_POST
+@async_api_view
+async def load_events(request):
+    # разбор multipart тоже в потоке: файл может быть большим
+    data, status_code = await in_db_thread(lambda: load_events_sync(request.data))()
+    return json_response(data, status=status_code)
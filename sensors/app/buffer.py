@@ -0,0 +1,106 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from sensors.app.cache import sensor_id_cache
+from sensors.app.services import EventService
+
+
+logger = logging.getLogger(__name__)
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_write_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = EventWriteBuffer(
+                batch_size=settings.EVENTS_WRITE_BEHIND_BATCH_SIZE,
+                interval=settings.EVENTS_WRITE_BEHIND_INTERVAL,
+                max_size=settings.EVENTS_WRITE_BEHIND_MAX_QUEUE,
+            )
+            _buffer.start()
+            atexit.register(_buffer.close)
+        return _buffer
+
+
+class EventWriteBuffer:
+    """Очередь одиночных событий в памяти процесса, которая пишется в БД пачками.
+
+    Фоновый поток забирает до batch_size событий или всё накопленное за interval
+    секунд и пишет их через EventService.bulk_create_events. Очередь ограничена
+    max_size: put() возвращает False, когда она заполнена. Неподтверждённые события
+    теряются при аварийном завершении процесса. При штатной остановке close()
+    дописывает остаток.
+    """
+
+    def __init__(self, batch_size, interval, max_size):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue = queue.Queue[dict](maxsize=max_size)
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='event-write-buffer', daemon=True)
+        self.thread.start()
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            return False
+        return True
+
+    def flush(self):
+        """Пишет всё, что сейчас в очереди, в текущем потоке"""
+        while batch := self._take(block=False):
+            self._write(batch)
+
+    def close(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+
+    def _run(self):
+        while not self.stopped.is_set():
+            batch = self._take(block=True)
+            if batch:
+                # соединение потока живёт между пачками, как между запросами
+                close_old_connections()
+                self._write(batch)
+
+    def _take(self, block):
+        return list(self._drain(block))
+
+    def _drain(self, block):
+        """До batch_size событий; с block=True ждёт новые не дольше interval"""
+        deadline = time.monotonic() + self.interval
+        for _ in range(self.batch_size):
+            try:
+                if block:
+                    yield self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                else:
+                    yield self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def _write(self, batch):
+        try:
+            sensor_ids = {event['sensor_id'] for event in batch}
+            existing_ids = sensor_id_cache.existing(sensor_ids)
+            _, sensor_errors, _ = EventService.bulk_create_events(batch, existing_ids)
+        except Exception as e:
+            logger.exception(f'Ошибка записи буфера событий, потеряно {len(batch)}: {e!s}')
+            return
+        for error in sensor_errors:
+            logger.warning(error)
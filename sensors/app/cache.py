@@ -0,0 +1,260 @@
+import hashlib
+import threading
+import time
+
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from sensors.app.models import Sensor
+from sensors.app.routers import reads_from_replica
+
+
+class ResponseCache:
+    """Кэш ответов списков и карточек датчиков и событий.
+
+    Ключ строится из пути, нормализованных параметров запроса и версии данных.
+    Любая запись датчиков или событий увеличивает версию после коммита, поэтому
+    старые ключи просто перестают читаться и вытесняются по таймауту. Версия
+    хранится в том же кэше, так что ETag сверяется без обращения к БД.
+    """
+
+    VERSION_KEY = 'response:version'
+
+    @staticmethod
+    def cache():
+        return caches[settings.RESPONSE_CACHE_ALIAS]
+
+    @staticmethod
+    def enabled():
+        return bool(settings.RESPONSE_CACHE_TIMEOUT)
+
+    @staticmethod
+    def version():
+        cache = ResponseCache.cache()
+        version = cache.get(ResponseCache.VERSION_KEY)
+        if version is None:
+            # после вытеснения версия не начинается заново, иначе совпали бы старые ETag
+            cache.add(ResponseCache.VERSION_KEY, time.time_ns(), timeout=None)
+            version = cache.get(ResponseCache.VERSION_KEY)
+        return version
+
+    @staticmethod
+    def bump():
+        cache = ResponseCache.cache()
+        try:
+            cache.incr(ResponseCache.VERSION_KEY)
+        except ValueError:
+            cache.add(ResponseCache.VERSION_KEY, time.time_ns(), timeout=None)
+
+    @staticmethod
+    def invalidate():
+        """Сбрасывает кэш после коммита текущей транзакции (сразу - вне транзакции)"""
+        if ResponseCache.enabled():
+            transaction.on_commit(ResponseCache.bump)
+
+    @staticmethod
+    def request_key(request):
+        """Хэш пути, формата ответа и параметров запроса без учёта их порядка и пустых значений"""
+        params = sorted(
+            f'{name}={value}' for name, values in request.query_params.lists() for value in values if value != ''
+        )
+        raw = '\n'.join([request.path, request.accepted_renderer.format, *params])
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def etag_matches(request, etag):
+        etags = parse_etags(request.headers.get('If-None-Match', ''))
+        return '*' in etags or etag.removeprefix('W/') in {tag.removeprefix('W/') for tag in etags}
+
+    @staticmethod
+    def response(request, build):
+        """Ответ из кэша, 304 по If-None-Match или build() с сохранением данных в кэш.
+
+        Ответ, прочитанный с реплики, не кэшируется и уходит без ETag: реплика может
+        отставать от версии данных, и устаревший ответ достался бы под новой версией всем,
+        в том числе клиенту, который только что записал и читает с основной БД.
+        """
+        if not ResponseCache.enabled():
+            return build()
+
+        cache = ResponseCache.cache()
+        request_key = ResponseCache.request_key(request)
+        version = ResponseCache.version()
+        etag = f'"{version}-{request_key}"'
+        if ResponseCache.etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        key = f'response:{version}:{request_key}'
+        data = cache.get(key)
+        if data is None:
+            response = build()
+            if response.status_code != status.HTTP_200_OK or reads_from_replica():
+                return response
+            cache.set(key, response.data, timeout=settings.RESPONSE_CACHE_TIMEOUT)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        return response
+
+
+def cache_response(view_method):
+    """Декоратор метода вьюсета: ответ через ResponseCache"""
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        return ResponseCache.response(request, lambda: view_method(self, request, *args, **kwargs))
+
+    return wrapper
+
+
+def invalidate_response_cache(sender, **kwargs):
+    ResponseCache.invalidate()
+
+
+class SensorIdCache:
+    """Существующие ID датчиков: LRU с TTL в памяти процесса, при желании поверх кэша Django.
+
+    Датчики создаются редко, а проверяются при каждой записи события. Найденные ID
+    запоминаются на SENSOR_ID_CACHE_TTL секунд, отсутствующие не запоминаются, поэтому
+    датчик, созданный другим процессом, виден сразу. Первое обращение прогревает кэш
+    одним запросом. Создание датчика добавляет ID после коммита, удаление убирает его
+    сразу. Другие процессы узнают об удалении через SENSOR_ID_CACHE_ALIAS или по TTL.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.warmed = False
+
+    @staticmethod
+    def enabled():
+        return bool(settings.SENSOR_ID_CACHE_TTL)
+
+    @staticmethod
+    def shared():
+        alias = settings.SENSOR_ID_CACHE_ALIAS
+        return caches[alias] if alias else None
+
+    @staticmethod
+    def shared_key(sensor_id):
+        return f'sensor:{sensor_id}'
+
+    def existing(self, sensor_ids):
+        """Подмножество sensor_ids, для которых есть датчик"""
+        sensor_ids = set(sensor_ids)
+        if not self.enabled():
+            return self._query(sensor_ids)
+        if not self.warmed:
+            self.warm()
+
+        found = self._lookup(sensor_ids)
+        missing = sensor_ids - found
+        shared = self.shared()
+        if missing and shared is not None:
+            keys = shared.get_many([self.shared_key(sensor_id) for sensor_id in missing])
+            from_shared = {sensor_id for sensor_id in missing if self.shared_key(sensor_id) in keys}
+            self._remember(from_shared)
+            found |= from_shared
+            missing -= from_shared
+        if missing:
+            from_db = self._query(missing)
+            self._store(from_db)
+            found |= from_db
+        return found
+
+    def warm(self):
+        """Загружает самые новые датчики, сколько поместится в кэш"""
+        sensor_ids = Sensor.objects.order_by('-id').values_list('id', flat=True)[: settings.SENSOR_ID_CACHE_MAX_SIZE]
+        sensor_ids = set(sensor_ids)
+        with self.lock:
+            self._put(sensor_ids)
+            # флаг ставится вместе с данными: clear() во время запроса не оставит пустой кэш прогретым
+            self.warmed = True
+
+    def add(self, sensor_ids):
+        """Запоминает созданные датчики после коммита текущей транзакции"""
+        if self.enabled():
+            sensor_ids = set(sensor_ids)
+            transaction.on_commit(lambda: self._store(sensor_ids))
+
+    def store(self, sensor_ids):
+        """Запоминает датчики, которые уже закоммичены"""
+        if self.enabled():
+            self._store(set(sensor_ids))
+
+    def discard(self, sensor_ids):
+        sensor_ids = set(sensor_ids)
+        with self.lock:
+            for sensor_id in sensor_ids:
+                self.entries.pop(sensor_id, None)
+        shared = self.shared()
+        if shared is not None:
+            shared.delete_many([self.shared_key(sensor_id) for sensor_id in sensor_ids])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.warmed = False
+
+    @staticmethod
+    def _query(sensor_ids):
+        if not sensor_ids:
+            return set()
+        return set(Sensor.objects.filter(id__in=sensor_ids).values_list('id', flat=True))
+
+    def _lookup(self, sensor_ids):
+        now = time.monotonic()
+        found = set()
+        with self.lock:
+            for sensor_id in sensor_ids:
+                expires = self.entries.get(sensor_id)
+                if expires is None:
+                    continue
+                if expires < now:
+                    del self.entries[sensor_id]
+                    continue
+                self.entries.move_to_end(sensor_id)
+                found.add(sensor_id)
+        return found
+
+    def _remember(self, sensor_ids):
+        with self.lock:
+            self._put(sensor_ids)
+
+    def _put(self, sensor_ids):
+        """Добавляет ID в LRU, вызывается под self.lock"""
+        expires = time.monotonic() + settings.SENSOR_ID_CACHE_TTL
+        max_size = settings.SENSOR_ID_CACHE_MAX_SIZE
+        for sensor_id in sensor_ids:
+            self.entries[sensor_id] = expires
+            self.entries.move_to_end(sensor_id)
+        while len(self.entries) > max_size:
+            self.entries.popitem(last=False)
+
+    def _store(self, sensor_ids):
+        self._remember(sensor_ids)
+        shared = self.shared()
+        if shared is not None and sensor_ids:
+            shared.set_many(
+                {self.shared_key(sensor_id): True for sensor_id in sensor_ids},
+                timeout=settings.SENSOR_ID_CACHE_TTL,
+            )
+
+
+sensor_id_cache = SensorIdCache()
+
+
+def remember_sensor(sender, instance, created, **kwargs):
+    if created:
+        sensor_id_cache.add({instance.pk})
+
+
+def forget_sensor(sender, instance, **kwargs):
+    sensor_id_cache.discard({instance.pk})
@@ -0,0 +1,106 @@
+from django.conf import settings
+from django.db import connection
+from django.db import transaction
+from django.utils import timezone
+
+from sensors.app.cache import ResponseCache
+from sensors.app.models import Event
+from sensors.app.models import EventRollup
+
+
+def truncate(value, interval):
+    """Начало интервала minute/hour/day, в который попадает value, в текущем часовом поясе"""
+    value = timezone.localtime(value).replace(second=0, microsecond=0)
+    if interval in ('hour', 'day'):
+        value = value.replace(minute=0)
+    if interval == 'day':
+        value = value.replace(hour=0)
+    return value
+
+
+class EventCompactionService:
+    """Свёртка старых событий в агрегаты EventRollup по датчику и интервалу.
+
+    События старше cutoff удаляются пачками по batch_size от самых старых, и каждая
+    пачка в той же транзакции сливается с агрегатами через INSERT ... ON CONFLICT DO
+    UPDATE. cutoff выравнивается по интервалу, а created_at назначает сервер, поэтому
+    события пачки всегда не раньше уже свёрнутых - последнее значение интервала берётся
+    из новой пачки. Сводка датчиков не меняется: свёрнутые события в ней учтены.
+    """
+
+    @staticmethod
+    def cutoff(older_than, interval, now=None):
+        return truncate((now or timezone.now()) - older_than, interval)
+
+    @staticmethod
+    def compact(older_than, batch_size=None, interval=None, now=None, on_batch=None):
+        """Сворачивает события старше older_than (timedelta): (удалено событий, записано агрегатов)"""
+        batch_size = batch_size or settings.EVENTS_COMPACT_BATCH_SIZE
+        interval = interval or settings.EVENTS_ROLLUP_INTERVAL
+        cutoff = EventCompactionService.cutoff(older_than, interval, now)
+        compacted = upserted = 0
+        try:
+            while True:
+                deleted, rollups = EventCompactionService.compact_batch(cutoff, batch_size, interval)
+                compacted += deleted
+                upserted += rollups
+                if on_batch:
+                    on_batch(compacted, upserted)
+                if deleted < batch_size:
+                    return compacted, upserted
+        finally:
+            if compacted:
+                ResponseCache.invalidate()
+
+    @staticmethod
+    @transaction.atomic
+    def compact_batch(cutoff, batch_size, interval):
+        quote = connection.ops.quote_name
+        events = quote(Event._meta.db_table)
+        rollups = quote(EventRollup._meta.db_table)
+        fields = ('temperature', 'humidity')
+        aggregates = ', '.join(
+            f'COUNT({field}), SUM({field}), MIN({field}), MAX({field}), '
+            f'(ARRAY_AGG({field} ORDER BY created_at DESC, id DESC) FILTER (WHERE {field} IS NOT NULL))[1], '
+            f'MAX(created_at) FILTER (WHERE {field} IS NOT NULL)'
+            for field in fields
+        )
+        columns = ', '.join(
+            f'{field}_count, {field}_sum, {field}_min, {field}_max, {field}_last, {field}_last_at' for field in fields
+        )
+        updates = ', '.join(
+            f'{field}_count = {rollups}.{field}_count + EXCLUDED.{field}_count, '
+            f'{field}_sum = COALESCE({rollups}.{field}_sum + EXCLUDED.{field}_sum, '
+            f'{rollups}.{field}_sum, EXCLUDED.{field}_sum), '
+            f'{field}_min = LEAST({rollups}.{field}_min, EXCLUDED.{field}_min), '
+            f'{field}_max = GREATEST({rollups}.{field}_max, EXCLUDED.{field}_max), '
+            f'{field}_last = COALESCE(EXCLUDED.{field}_last, {rollups}.{field}_last), '
+            f'{field}_last_at = COALESCE(EXCLUDED.{field}_last_at, {rollups}.{field}_last_at)'
+            for field in fields
+        )
+        sql = (
+            f'WITH batch AS ('
+            f'DELETE FROM {events} WHERE created_at < %(cutoff)s AND id IN ('
+            f'SELECT id FROM {events} WHERE created_at < %(cutoff)s ORDER BY created_at, id LIMIT %(limit)s) '
+            f'RETURNING id, sensor_id, created_at, temperature, humidity), '
+            f'upserted AS ('
+            f'INSERT INTO {rollups} (sensor_id, bucket, count, first_at, last_at, {columns}) '
+            f'SELECT sensor_id, DATE_TRUNC(%(interval)s, created_at AT TIME ZONE %(tz)s) AT TIME ZONE %(tz)s, '
+            f'COUNT(*), MIN(created_at), MAX(created_at), {aggregates} '
+            f'FROM batch GROUP BY 1, 2 '
+            f'ON CONFLICT (sensor_id, bucket) DO UPDATE SET '
+            f'count = {rollups}.count + EXCLUDED.count, '
+            f'first_at = LEAST({rollups}.first_at, EXCLUDED.first_at), '
+            f'last_at = GREATEST({rollups}.last_at, EXCLUDED.last_at), {updates} '
+            f'RETURNING 1) '
+            f'SELECT (SELECT COUNT(*) FROM batch), (SELECT COUNT(*) FROM upserted)'
+        )
+        params = {
+            'cutoff': cutoff,
+            'limit': batch_size,
+            'interval': interval,
+            'tz': timezone.get_current_timezone_name(),
+        }
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchone()
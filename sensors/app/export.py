@@ -0,0 +1,52 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+from sensors.app.serializers import EventRowSerializer
+
+
+class EventExportService:
+    """Потоковая выгрузка событий рендерером с render_rows (NDJSON, CSV).
+
+    Строки читаются серверным курсором порциями по EVENTS_EXPORT_CHUNK_SIZE, каждая
+    порция сразу уходит клиенту, поэтому память не зависит от объёма выгрузки.
+    """
+
+    @staticmethod
+    def chunks(queryset, renderer):
+        chunk_size = settings.EVENTS_EXPORT_CHUNK_SIZE
+        rows = EventRowSerializer.queryset(queryset).iterator(chunk_size=chunk_size)
+        batch = []
+        header = True
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                yield renderer.render_rows(EventRowSerializer.data(batch), header)
+                batch, header = [], False
+        if batch or header:
+            yield renderer.render_rows(EventRowSerializer.data(batch), header)
+
+    @staticmethod
+    async def achunks(queryset, renderer):
+        """chunks() для ASGI: порции читаются в потоке БД, не блокируя цикл событий"""
+        iterator = EventExportService.chunks(queryset, renderer)
+        next_chunk = sync_to_async(lambda: next(iterator, None), thread_sensitive=True)
+        while (chunk := await next_chunk()) is not None:
+            yield chunk
+
+    @staticmethod
+    def response(request, queryset, renderer):
+        # строки читаются уже после выхода из middleware, поэтому БД для чтения выбирается сейчас
+        queryset = queryset.using(queryset.db)
+        # под ASGI синхронный итератор был бы сначала целиком прочитан в память
+        if isinstance(request, ASGIRequest):
+            content = EventExportService.achunks(queryset, renderer)
+        else:
+            content = EventExportService.chunks(queryset, renderer)
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="events.{renderer.format}"'
+        return response
@@ -1,6 +1,7 @@
 import django_filters
 
 from sensors.app.models import Event
+from sensors.app.models import EventRollup
 
 
 class EventFilter(django_filters.FilterSet):
@@ -9,6 +10,8 @@ class EventFilter(django_filters.FilterSet):
     temperature_max = django_filters.NumberFilter(field_name='temperature', lookup_expr='lte')
     humidity_min = django_filters.NumberFilter(field_name='humidity', lookup_expr='gte')
     humidity_max = django_filters.NumberFilter(field_name='humidity', lookup_expr='lte')
+    created_after = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='gte')
+    created_before = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='lt')
 
     class Meta:
         model = Event
@@ -18,4 +21,25 @@ class EventFilter(django_filters.FilterSet):
             'temperature_max',
             'humidity_min',
             'humidity_max',
+            'created_after',
+            'created_before',
         ]
+
+
+class EventRollupFilter(django_filters.FilterSet):
+    """Фильтры EventFilter, которые применимы к свёрнутым событиям: интервал берётся по его началу"""
+
+    # по значениям агрегаты не отфильтровать - с этими фильтрами свёрнутые события не учитываются
+    VALUE_FILTERS = ('temperature_min', 'temperature_max', 'humidity_min', 'humidity_max')
+
+    sensor_id = django_filters.NumberFilter(field_name='sensor_id')
+    created_after = django_filters.IsoDateTimeFilter(field_name='bucket', lookup_expr='gte')
+    created_before = django_filters.IsoDateTimeFilter(field_name='bucket', lookup_expr='lt')
+
+    class Meta:
+        model = EventRollup
+        fields = ['sensor_id', 'created_after', 'created_before']
+
+    @classmethod
+    def applies(cls, params):
+        return not any(params.get(name) not in (None, '') for name in cls.VALUE_FILTERS)
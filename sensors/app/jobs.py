@@ -0,0 +1,138 @@
+import logging
+import os
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from tempfile import NamedTemporaryFile
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db import connection
+from django.db import transaction
+from django.utils import timezone
+
+from sensors.app import metrics
+from sensors.app.exceptions import ParseError
+from sensors.app.models import ImportJob
+from sensors.app.parallel import ParallelEventLoader
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.EVENTS_IMPORT_WORKERS,
+                thread_name_prefix='import-job',
+            )
+        return _executor
+
+
+class ImportJobService:
+    @staticmethod
+    def submit(upload, auto_create_sensors=False, workers=1):
+        """Сохраняет загрузку на диск и ставит задачу импорта в очередь пула"""
+        os.makedirs(settings.EVENTS_IMPORT_SPOOL_DIR, exist_ok=True)
+        with NamedTemporaryFile(dir=settings.EVENTS_IMPORT_SPOOL_DIR, suffix='.json', delete=False) as spool:
+            for chunk in upload.chunks():
+                spool.write(chunk)
+
+        job = ImportJob.objects.create(
+            file_path=spool.name,
+            auto_create_sensors=auto_create_sensors,
+            workers=workers,
+        )
+        transaction.on_commit(lambda: get_executor().submit(ImportJobService.run, job.id))
+        return job
+
+    @staticmethod
+    def fail_interrupted():
+        """Завершает задачи, прерванные остановкой процесса, и возвращает их число.
+
+        Задачи живут только в пуле потоков процесса, поэтому после перезапуска или деплоя
+        задачи в pending и running уже никто не выполнит. Вызывается при старте, пока
+        задачи не выполняет ни один процесс. Записанные порции остаются в БД, и запуск с
+        начала дал бы дубли, поэтому задачи не перезапускаются, а переводятся в failed,
+        а их файлы удаляются.
+        """
+        with transaction.atomic():
+            jobs = list(
+                ImportJob.objects.select_for_update()
+                .filter(state__in=[ImportJob.State.PENDING, ImportJob.State.RUNNING])
+                .values_list('id', 'file_path')
+            )
+            ImportJob.objects.filter(id__in=[job_id for job_id, _ in jobs]).update(
+                state=ImportJob.State.FAILED,
+                detail='Загрузка прервана перезапуском сервера',
+                finished_at=timezone.now(),
+            )
+        for _, file_path in jobs:
+            with suppress(FileNotFoundError):
+                os.remove(file_path)
+        return len(jobs)
+
+    @staticmethod
+    def run(job_id):
+        close_old_connections()
+        try:
+            ImportJobService._run(job_id)
+        except Exception as e:
+            logger.exception(f'Ошибка фоновой загрузки {job_id}: {e!s}')
+            ImportJob.objects.filter(id=job_id).update(
+                state=ImportJob.State.FAILED,
+                detail='Внутренняя ошибка',
+                finished_at=timezone.now(),
+            )
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _run(job_id):
+        job = ImportJob.objects.get(id=job_id)
+        job.state = ImportJob.State.RUNNING
+        job.started_at = timezone.now()
+        job.save(update_fields=['state', 'started_at'])
+
+        def on_progress(loader):
+            ImportJob.objects.filter(id=job_id).update(
+                rows_processed=loader.total_input,
+                rows_failed=loader.rows_failed,
+            )
+
+        loader = ParallelEventLoader.create(
+            job.workers,
+            on_progress=on_progress,
+            auto_create_sensors=job.auto_create_sensors,
+        )
+        started = time.perf_counter()
+        try:
+            result = loader.load_path(job.file_path)
+        except ParseError as e:
+            metrics.record_failed_load('import')
+            job.state = ImportJob.State.FAILED
+            job.detail = str(e)
+        except Exception as e:
+            metrics.record_failed_load('import')
+            logger.error(f'Ошибка загрузки: {e!s}')
+            job.state = ImportJob.State.FAILED
+            job.detail = 'Внутренняя ошибка'
+        else:
+            metrics.record_load('import', result, time.perf_counter() - started)
+            job.state = ImportJob.State.DONE
+            job.result = result
+        finally:
+            if os.path.exists(job.file_path):
+                os.remove(job.file_path)
+
+        job.rows_processed = loader.total_input
+        job.rows_failed = loader.rows_failed
+        job.finished_at = timezone.now()
+        job.save(update_fields=['state', 'detail', 'result', 'rows_processed', 'rows_failed', 'finished_at'])
@@ -0,0 +1,70 @@
+import time
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import connections
+
+from sensors.app.compaction import EventCompactionService
+from sensors.app.services import EventAggregationService
+
+
+class Command(BaseCommand):
+    help = 'Сворачивает старые события в агрегаты по датчику и интервалу и удаляет исходные строки'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days',
+            type=int,
+            default=settings.EVENTS_COMPACT_AFTER_DAYS,
+            help='Сворачивать события старше указанного числа дней',
+        )
+        parser.add_argument(
+            '--interval',
+            choices=EventAggregationService.BUCKETS,
+            default=settings.EVENTS_ROLLUP_INTERVAL,
+            help='Интервал агрегатов',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.EVENTS_COMPACT_BATCH_SIZE,
+            help='Сколько событий удалять за одну транзакцию',
+        )
+        parser.add_argument(
+            '--every',
+            type=float,
+            default=None,
+            help='Повторять свёртку каждые N секунд, не завершаясь (фоновый процесс вместо cron)',
+        )
+
+    def handle(self, *args, **options):
+        if options['older_than_days'] < 1:
+            raise CommandError('Возраст событий должен быть не меньше дня')
+        if options['batch_size'] < 1:
+            raise CommandError('Размер пачки должен быть не меньше 1')
+        if options['every'] is None:
+            self.compact(options)
+            return
+        while True:
+            self.compact(options)
+            # соединение не должно висеть открытым между запусками
+            connections.close_all()
+            time.sleep(options['every'])
+
+    def compact(self, options):
+        def on_batch(compacted, rollups):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  свёрнуто {compacted}, агрегатов {rollups}')
+
+        started = time.perf_counter()
+        compacted, rollups = EventCompactionService.compact(
+            timedelta(days=options['older_than_days']),
+            batch_size=options['batch_size'],
+            interval=options['interval'],
+            on_batch=on_batch,
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'Свёрнуто событий: {compacted}, обновлено агрегатов: {rollups}, {elapsed:.1f} с')
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from sensors.app.partitions import EventPartitionService
+
+
+class Command(BaseCommand):
+    help = 'Создаёт помесячные партиции событий заранее и удаляет партиции старше срока хранения'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ahead',
+            type=int,
+            default=settings.EVENTS_PARTITION_AHEAD_MONTHS,
+            help='На сколько месяцев вперёд создавать партиции',
+        )
+        parser.add_argument(
+            '--retention-months',
+            type=int,
+            default=settings.EVENTS_RETENTION_MONTHS,
+            help='Удалять партиции, целиком старше указанного числа месяцев',
+        )
+        parser.add_argument(
+            '--archive-dir',
+            default=settings.EVENTS_ARCHIVE_DIR,
+            help='Каталог, куда партиции выгружаются в CSV.gz перед удалением',
+        )
+
+    def handle(self, *args, **options):
+        if not EventPartitionService.is_partitioned():
+            raise CommandError('Таблица событий не секционирована')
+        if options['retention_months'] is not None and options['retention_months'] < 1:
+            raise CommandError('Срок хранения должен быть не меньше месяца')
+
+        created, dropped = EventPartitionService.maintain(
+            ahead_months=options['ahead'],
+            retention_months=options['retention_months'],
+            archive_dir=options['archive_dir'],
+        )
+        for name in created:
+            self.stdout.write(f'Создана партиция {name}')
+        for name in dropped:
+            self.stdout.write(f'Удалена партиция {name}')
+        if not created and not dropped:
+            self.stdout.write('Партиции в актуальном состоянии')
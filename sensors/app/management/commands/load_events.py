@@ -0,0 +1,177 @@
+import glob
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import transaction
+
+from sensors.app.exceptions import ParseError
+from sensors.app.parallel import ParallelEventLoader
+
+
+NDJSON_SUFFIXES = ('.ndjson', '.jsonl')
+EVENT_FILE_SUFFIXES = ('.json', *NDJSON_SUFFIXES)
+PROGRESS_INTERVAL = 5
+
+
+def is_ndjson(path):
+    return path.lower().removesuffix('.gz').endswith(NDJSON_SUFFIXES)
+
+
+def is_event_file(path):
+    return path.lower().removesuffix('.gz').endswith(EVENT_FILE_SUFFIXES)
+
+
+def expand_paths(patterns):
+    """Файлы по аргументам: каталоги обходятся рекурсивно, шаблоны раскрываются через glob"""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.extend(
+                sorted(
+                    os.path.join(root, name)
+                    for root, _, names in os.walk(pattern)
+                    for name in names
+                    if is_event_file(name)
+                )
+            )
+        elif glob.has_magic(pattern):
+            matches = sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+            if not matches:
+                raise CommandError(f'{pattern}: нет подходящих файлов')
+            paths.extend(matches)
+        else:
+            paths.append(pattern)
+    # один файл, попавший под несколько аргументов, грузится один раз
+    return list(dict.fromkeys(paths))
+
+
+class Checkpoint:
+    """Файл с позициями загрузки: {абсолютный путь: {done, items, size, mtime}}.
+
+    Позиция сохраняется после коммита каждой порции, файл заменяется атомарно. Запись
+    о файле, который с тех пор изменился (размер или время изменения), не используется.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as file:
+                    self.entries = json.load(file)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'{path}: не удалось прочитать контрольную точку: {e}') from e
+
+    def get(self, path):
+        """(загружен ли файл целиком, сколько первых элементов уже записано)"""
+        entry = self.entries.get(os.path.abspath(path))
+        if entry is None or [entry['size'], entry['mtime']] != self._stat(path):
+            return False, 0
+        return entry['done'], entry['items']
+
+    def save(self, path, items, done=False):
+        if not self.path:
+            return
+        size, mtime = self._stat(path)
+        self.entries[os.path.abspath(path)] = {'done': done, 'items': items, 'size': size, 'mtime': mtime}
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.entries, file, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _stat(path):
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+
+class Command(BaseCommand):
+    help = 'Загружает события из JSON и NDJSON файлов (в том числе .gz), при --workers > 1 - несколькими процессами'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='+',
+            help='Файлы, каталоги или шаблоны glob: JSON (массив событий), NDJSON (.ndjson, .jsonl), можно .gz',
+        )
+        parser.add_argument('--workers', type=int, default=1, help='Число процессов загрузки')
+        parser.add_argument('--chunk-size', type=int, default=None, help='Событий в одной транзакции')
+        parser.add_argument(
+            '--auto-create-sensors',
+            action='store_true',
+            help='Создавать неизвестные датчики вместо пропуска их событий',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл контрольной точки: загруженные файлы пропускаются, прерванный продолжается с места остановки',
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('Число процессов должно быть не меньше 1')
+        if options['chunk_size'] is not None and options['chunk_size'] < 1:
+            raise CommandError('Размер порции должен быть не меньше 1')
+        paths = expand_paths(options['paths'])
+        if not paths:
+            raise CommandError('Нет файлов для загрузки')
+        checkpoint = Checkpoint(options['checkpoint'])
+
+        started = time.perf_counter()
+        total_input = created = 0
+        for path in paths:
+            result = self.load(path, checkpoint, options)
+            if result is not None:
+                total_input += result['total_input']
+                created += result['created']
+        if len(paths) > 1:
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'Итого файлов {len(paths)}: строк {total_input}, записано {created}, '
+                f'{total_input / elapsed if elapsed else 0:.0f} строк/с'
+            )
+
+    def load(self, path, checkpoint, options):
+        done, skip = checkpoint.get(path) if os.path.isfile(path) else (False, 0)
+        if done:
+            self.stdout.write(f'{path}: уже загружен, пропущен')
+            return None
+
+        started = last_report = time.perf_counter()
+
+        def on_progress(loader):
+            nonlocal last_report
+            position = loader.position
+            # позиция сохраняется, только если порция действительно записана
+            transaction.on_commit(lambda: checkpoint.save(path, position))
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                self.stdout.write(f'{path}: строк {position}, {loader.total_input / (now - started):.0f} строк/с')
+
+        if skip:
+            self.stdout.write(f'{path}: продолжение со строки {skip + 1}')
+        try:
+            loader = ParallelEventLoader.create(
+                options['workers'],
+                chunk_size=options['chunk_size'],
+                on_progress=on_progress,
+                auto_create_sensors=options['auto_create_sensors'],
+            )
+            result = loader.load_path(path, ndjson=is_ndjson(path), skip=skip)
+            checkpoint.save(path, loader.position, done=True)
+        except (OSError, EOFError, ParseError) as e:
+            raise CommandError(f'{path}: {e}') from e
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{path}: строк {result["total_input"]}, записано {result["created"]}, '
+            f'повторов {result["duplicates"]}, ошибок {result["parse_errors"]}, '
+            f'без датчика {result["skipped_events_to_missing_sensor"]}, '
+            f'{result["total_input"] / elapsed if elapsed else 0:.0f} строк/с'
+        )
+        for error in result['error_details'][: options['verbosity'] * 10]:
+            self.stderr.write(error)
+        return result
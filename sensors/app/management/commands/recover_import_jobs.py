@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from sensors.app.jobs import ImportJobService
+
+
+class Command(BaseCommand):
+    help = 'Переводит в failed фоновые загрузки, прерванные перезапуском, и удаляет их файлы'
+
+    def handle(self, *args, **options):
+        failed = ImportJobService.fail_interrupted()
+        self.stdout.write(f'Прерванных задач: {failed}')
@@ -0,0 +1,198 @@
+import threading
+import time
+
+from bisect import bisect_left
+from contextvars import ContextVar
+
+
+# счётчики SQL-запросов текущего запроса: [число, секунды], None вне запроса
+_request_queries = ContextVar[list | None]('request_queries', default=None)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values, strict=True)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    """Метрика с метками в памяти процесса; значения меток передаются по порядку labels"""
+
+    kind = ''
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self.lock:
+            values = self._snapshot()
+        for labels, value in sorted(values.items()):
+            lines.extend(self._samples(labels, value))
+        return lines
+
+    def _snapshot(self):
+        return dict(self.values)
+
+    def _samples(self, labels, value):
+        return [f'{self.name}{_format_labels(self.labels, labels)} {value}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        with self.lock:
+            self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        with self.lock:
+            state = self.values.get(labels)
+            if state is None:
+                # число наблюдений по корзинам (последняя - +Inf) и их сумма
+                state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][bisect_left(self.buckets, value)] += 1
+            state[1] += value
+
+    def _snapshot(self):
+        return {labels: (list(counts), total) for labels, (counts, total) in self.values.items()}
+
+    def _samples(self, labels, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, '+Inf'), counts, strict=True):
+            cumulative += count
+            le = f'le="{bound}"'
+            lines.append(f'{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}')
+        lines.append(f'{self.name}_sum{_format_labels(self.labels, labels)} {total}')
+        lines.append(f'{self.name}_count{_format_labels(self.labels, labels)} {cumulative}')
+        return lines
+
+
+REQUESTS = Counter(
+    'sensors_http_requests_total', 'Запросы по представлению, методу и коду ответа', ('view', 'method', 'status')
+)
+REQUEST_DURATION = Histogram(
+    'sensors_http_request_duration_seconds', 'Время ответа представления', ('view', 'method'), LATENCY_BUCKETS
+)
+REQUEST_QUERIES = Histogram(
+    'sensors_http_request_db_queries', 'SQL-запросов на один запрос', ('view', 'method'), QUERY_COUNT_BUCKETS
+)
+REQUEST_DB_DURATION = Histogram(
+    'sensors_http_request_db_duration_seconds', 'Время SQL-запросов на один запрос', ('view', 'method'), LATENCY_BUCKETS
+)
+LOADS = Counter('sensors_events_loads_total', 'Загрузки событий по источнику и исходу', ('source', 'outcome'))
+ROWS_PARSED = Counter('sensors_events_rows_parsed_total', 'Прочитанные из загрузок события', ('source',))
+ROWS_REJECTED = Counter(
+    'sensors_events_rows_rejected_total', 'Отклонённые события: ошибки валидации и неизвестные датчики', ('source',)
+)
+ROWS_INSERTED = Counter('sensors_events_rows_inserted_total', 'Записанные в БД события', ('source',))
+ROWS_DUPLICATE = Counter('sensors_events_rows_duplicate_total', 'Повторы по event_key', ('source',))
+LOAD_DURATION = Counter('sensors_events_load_duration_seconds_total', 'Время загрузок событий', ('source',))
+LOAD_RATE = Gauge(
+    'sensors_events_last_load_rows_per_second', 'Скорость последней загрузки, строк в секунду', ('source',)
+)
+
+REGISTRY = (
+    REQUESTS,
+    REQUEST_DURATION,
+    REQUEST_QUERIES,
+    REQUEST_DB_DURATION,
+    LOADS,
+    ROWS_PARSED,
+    ROWS_REJECTED,
+    ROWS_INSERTED,
+    ROWS_DUPLICATE,
+    LOAD_DURATION,
+    LOAD_RATE,
+)
+
+
+def render():
+    """Все метрики процесса в текстовом формате Prometheus"""
+    return '\n'.join(line for metric in REGISTRY for line in metric.render()) + '\n'
+
+
+def query_timer(execute, sql, params, many, context):
+    """execute_wrapper соединений: считает SQL-запросы и их время для текущего запроса"""
+    stats = _request_queries.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats[0] += 1
+        stats[1] += time.perf_counter() - started
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """Обработчик connection_created: каждое новое соединение считает запросы"""
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_timer)
+
+
+def track_queries():
+    """Начинает счёт SQL-запросов в текущем контексте, возвращает [число, секунды] и токен"""
+    stats = [0, 0.0]
+    return stats, _request_queries.set(stats)
+
+
+def stop_tracking(token):
+    _request_queries.reset(token)
+
+
+def record_request(view, method, status, duration, stats):
+    REQUESTS.inc(view, method, str(status))
+    REQUEST_DURATION.observe(duration, view, method)
+    REQUEST_QUERIES.observe(stats[0], view, method)
+    REQUEST_DB_DURATION.observe(stats[1], view, method)
+
+
+def record_load(source, result, duration):
+    """Счётчики успешной загрузки событий по результату EventLoader.result()"""
+    LOADS.inc(source, 'ok')
+    ROWS_PARSED.inc(source, amount=result['total_input'])
+    ROWS_REJECTED.inc(source, amount=result['parse_errors'] + result['skipped_events_to_missing_sensor'])
+    ROWS_INSERTED.inc(source, amount=result['created'])
+    ROWS_DUPLICATE.inc(source, amount=result['duplicates'])
+    LOAD_DURATION.inc(source, amount=duration)
+    if duration > 0:
+        LOAD_RATE.set(result['total_input'] / duration, source)
+
+
+def record_failed_load(source):
+    LOADS.inc(source, 'failed')
@@ -0,0 +1,108 @@
+import time
+
+from asgiref.sync import iscoroutinefunction
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from sensors.app.metrics import record_request
+from sensors.app.metrics import stop_tracking
+from sensors.app.metrics import track_queries
+from sensors.app.routers import start_read_routing
+from sensors.app.routers import stop_read_routing
+
+
+def view_label(request):
+    """Имя маршрута (events-list, sensors-events) вместо пути, чтобы число меток было ограничено"""
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unmatched'
+
+
+class MetricsMiddleware:
+    """Время ответа, число и время SQL-запросов каждого запроса по маршруту.
+
+    Работает и с синхронными, и с async-представлениями: счётчик запросов к БД живёт в
+    contextvar, который sync_to_async передаёт в поток с соединением. Запросы при чтении
+    потокового ответа (выгрузка событий) уже не попадают в счёт.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token = track_queries()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_tracking(token)
+        record_request(view_label(request), request.method, response.status_code, time.perf_counter() - started, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats, token = track_queries()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_tracking(token)
+        record_request(view_label(request), request.method, response.status_code, time.perf_counter() - started, stats)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """Чтение безопасных запросов с реплик DATABASE_REPLICAS с липкостью после записи.
+
+    После запроса с записью клиент получает cookie на REPLICA_STICKY_SECONDS, и пока она
+    жива, его запросы читают с основной БД - так он видит свои изменения, даже если
+    реплика отстаёт. Без реплик в настройках middleware не подключается.
+    """
+
+    sync_capable = True
+    async_capable = True
+    STICKY_COOKIE = 'read_primary'
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        routing, token = start_read_routing(self._read_method(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_read_routing(token)
+        return self._stick(request, response, routing)
+
+    async def __acall__(self, request):
+        routing, token = start_read_routing(self._read_method(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_read_routing(token)
+        return self._stick(request, response, routing)
+
+    def _read_method(self, request):
+        # клиент недавно писал: читаем как при записи, с основной БД
+        return None if self.STICKY_COOKIE in request.COOKIES else request.method
+
+    def _stick(self, request, response, routing):
+        if routing.wrote or request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            response.set_cookie(
+                self.STICKY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax'
+            )
+        return response
@@ -0,0 +1,63 @@
+# Generated by Django 5.2 on 2026-10-18 10:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0003_event_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SensorState",
+            fields=[
+                (
+                    "sensor",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="state",
+                        serialize=False,
+                        to="app.sensor",
+                    ),
+                ),
+                ("event_count", models.BigIntegerField(default=0)),
+                ("first_seen", models.DateTimeField(blank=True, null=True)),
+                ("last_seen", models.DateTimeField(blank=True, null=True)),
+                ("last_temperature", models.FloatField(blank=True, null=True)),
+                ("last_humidity", models.FloatField(blank=True, null=True)),
+                ("temperature_min", models.FloatField(blank=True, null=True)),
+                ("temperature_max", models.FloatField(blank=True, null=True)),
+                ("humidity_min", models.FloatField(blank=True, null=True)),
+                ("humidity_max", models.FloatField(blank=True, null=True)),
+            ],
+        ),
+        # сводка по уже загруженным событиям
+        migrations.RunSQL(
+            sql="""
+            INSERT INTO app_sensorstate (
+                sensor_id, event_count, first_seen, last_seen, last_temperature, last_humidity,
+                temperature_min, temperature_max, humidity_min, humidity_max
+            )
+            SELECT
+                sensor_id,
+                COUNT(*),
+                MIN(created_at),
+                MAX(created_at),
+                (ARRAY_AGG(temperature ORDER BY created_at DESC, id DESC)
+                    FILTER (WHERE temperature IS NOT NULL))[1],
+                (ARRAY_AGG(humidity ORDER BY created_at DESC, id DESC)
+                    FILTER (WHERE humidity IS NOT NULL))[1],
+                MIN(temperature),
+                MAX(temperature),
+                MIN(humidity),
+                MAX(humidity)
+            FROM app_event
+            GROUP BY sensor_id
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,113 @@
+# Generated by Django 5.2 on 2026-10-18 11:00
+
+from datetime import UTC, datetime
+
+from django.db import migrations
+
+# Сколько месяцев вперёд создаются партиции при переходе, дальше - команда event_partitions
+AHEAD_MONTHS = 3
+
+
+def _month_start(value):
+    return value.astimezone(UTC).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _add_month(month):
+    return month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1)
+
+
+def _rebuild_event_table(schema_editor, partitioned):
+    """Пересоздаёт app_event секционированной по created_at (или обратно обычной).
+
+    Индексы и ограничения читаются из каталога до пересоздания и восстанавливаются
+    с прежними именами; первичный ключ секционированной таблицы - (id, created_at).
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    quote = schema_editor.quote_name
+    table = "app_event"
+    old_table = f"{table}_old"
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s "
+            "AND indexname <> %s",
+            [table, f"{table}_pkey"],
+        )
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype IN ('c', 'f') ORDER BY conname",
+            [table],
+        )
+        constraints = cursor.fetchall()
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        (sequence,) = cursor.fetchone()
+        cursor.execute(f"SELECT MIN(created_at), MAX(id) FROM {quote(table)}")
+        first_created_at, max_id = cursor.fetchone()
+
+        cursor.execute(f"ALTER TABLE {quote(table)} RENAME TO {quote(old_table)}")
+        cursor.execute(f"ALTER SEQUENCE {sequence} RENAME TO {quote(f'{old_table}_id_seq')}")
+
+        if partitioned:
+            cursor.execute(
+                f"CREATE TABLE {quote(table)} (LIKE {quote(old_table)}) PARTITION BY RANGE (created_at)"
+            )
+            cursor.execute(f"CREATE SEQUENCE {quote(f'{table}_id_seq')} OWNED BY {quote(table)}.id")
+            cursor.execute(
+                f"ALTER TABLE {quote(table)} ALTER COLUMN id SET DEFAULT nextval(%s)",
+                [f"{table}_id_seq"],
+            )
+            cursor.execute(f"CREATE TABLE {quote(f'{table}_default')} PARTITION OF {quote(table)} DEFAULT")
+            month = _month_start(first_created_at or datetime.now(UTC))
+            last_month = _month_start(datetime.now(UTC))
+            for _ in range(AHEAD_MONTHS):
+                last_month = _add_month(last_month)
+            while month <= last_month:
+                next_month = _add_month(month)
+                cursor.execute(
+                    f"CREATE TABLE {quote(f'{table}_p{month:%Y_%m}')} PARTITION OF {quote(table)} "
+                    f"FOR VALUES FROM (%s) TO (%s)",
+                    [month.isoformat(), next_month.isoformat()],
+                )
+                month = next_month
+        else:
+            cursor.execute(f"CREATE TABLE {quote(table)} (LIKE {quote(old_table)})")
+
+        cursor.execute(f"INSERT INTO {quote(table)} SELECT * FROM {quote(old_table)}")
+        cursor.execute(f"DROP TABLE {quote(old_table)} CASCADE")
+
+        if partitioned:
+            cursor.execute("SELECT setval(%s, %s, false)", [f"{table}_id_seq", (max_id or 0) + 1])
+            cursor.execute(f"ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(f'{table}_pkey')} PRIMARY KEY (id, created_at)")
+        else:
+            cursor.execute(
+                f"ALTER TABLE {quote(table)} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY "
+                f"(START WITH {(max_id or 0) + 1})"
+            )
+            cursor.execute(f"ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(f'{table}_pkey')} PRIMARY KEY (id)")
+        for index in indexes:
+            cursor.execute(index)
+        for name, definition in constraints:
+            cursor.execute(f"ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}")
+
+
+def partition_events(apps, schema_editor):
+    _rebuild_event_table(schema_editor, partitioned=True)
+
+
+def unpartition_events(apps, schema_editor):
+    _rebuild_event_table(schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    atomic = True
+
+    dependencies = [
+        ("app", "0004_sensorstate"),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_events, unpartition_events),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 11:30
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0005_partition_events"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="event",
+            name="sensor",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="events",
+                to="app.sensor",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="event",
+            index=django.contrib.postgres.indexes.BrinIndex(
+                autosummarize=True, fields=["created_at"], name="app_event_created_brin"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0006_event_created_brin"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importjob",
+            name="auto_create_sensors",
+            field=models.BooleanField(default=False),
+        ),
+    ]
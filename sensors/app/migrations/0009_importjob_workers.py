@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0008_eventkey"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importjob",
+            name="workers",
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2 on 2026-10-18 13:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0009_importjob_workers"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EventRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("bucket", models.DateTimeField()),
+                ("count", models.BigIntegerField()),
+                ("first_at", models.DateTimeField()),
+                ("last_at", models.DateTimeField()),
+                ("temperature_count", models.BigIntegerField(default=0)),
+                ("temperature_sum", models.FloatField(blank=True, null=True)),
+                ("temperature_min", models.FloatField(blank=True, null=True)),
+                ("temperature_max", models.FloatField(blank=True, null=True)),
+                ("temperature_last", models.FloatField(blank=True, null=True)),
+                ("temperature_last_at", models.DateTimeField(blank=True, null=True)),
+                ("humidity_count", models.BigIntegerField(default=0)),
+                ("humidity_sum", models.FloatField(blank=True, null=True)),
+                ("humidity_min", models.FloatField(blank=True, null=True)),
+                ("humidity_max", models.FloatField(blank=True, null=True)),
+                ("humidity_last", models.FloatField(blank=True, null=True)),
+                ("humidity_last_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "sensor",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="rollups",
+                        to="app.sensor",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [models.Index(fields=["bucket"], name="app_eventro_bucket_b6c520_idx")],
+                "constraints": [
+                    models.UniqueConstraint(fields=("sensor", "bucket"), name="event_rollup_unique"),
+                ],
+            },
+        ),
+    ]
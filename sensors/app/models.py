@@ -1,3 +1,6 @@
+import uuid
+
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
 from django.db.models import Q
 
@@ -15,7 +18,8 @@ class Sensor(models.Model):
 
 
 class Event(models.Model):
-    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name='events')
+    # поиск по датчику покрывает индекс (sensor, -created_at, -id), отдельный индекс FK не нужен
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name='events', db_index=False)
     name = models.CharField(max_length=255, null=True, blank=True)
     temperature = models.FloatField(null=True, blank=True)
     humidity = models.FloatField(null=True, blank=True)
@@ -23,9 +27,11 @@ class Event(models.Model):
 
     class Meta:
         indexes = [
-            models.Index(fields=['sensor', '-created_at']),
-            models.Index(fields=['temperature']),
-            models.Index(fields=['humidity']),
+            # keyset-пагинация по (created_at, id), в том числе по одному датчику
+            models.Index(fields=['sensor', '-created_at', '-id']),
+            models.Index(fields=['-created_at', '-id']),
+            # окна по времени на дописываемой по порядку таблице: индекс в несколько страниц
+            BrinIndex(fields=['created_at'], name='app_event_created_brin', autosummarize=True),
         ]
         constraints = [
             models.CheckConstraint(
@@ -34,3 +40,93 @@ class Event(models.Model):
             ),
             models.CheckConstraint(check=Q(humidity__gte=0) & Q(humidity__lte=100), name='humidity_range'),
         ]
+
+
+class EventKey(models.Model):
+    """Ключи событий, переданные клиентом, для идемпотентной загрузки.
+
+    События секционированы по created_at, которое назначает сервер, поэтому уникальность
+    ключа держит отдельная несекционированная таблица.
+    """
+
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name='+', db_index=False)
+    key = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['sensor', 'key'], name='event_key_unique'),
+        ]
+
+
+class EventRollup(models.Model):
+    """Агрегаты свёрнутых старых событий датчика за интервал EVENTS_ROLLUP_INTERVAL.
+
+    Сумма и число непустых значений хранятся отдельно, чтобы среднее при слиянии
+    интервалов оставалось точным, first_at и last_at - время крайних событий, а
+    *_last_at - время события, от которого взято последнее непустое значение поля.
+    """
+
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name='rollups', db_index=False)
+    bucket = models.DateTimeField()
+    count = models.BigIntegerField()
+    first_at = models.DateTimeField()
+    last_at = models.DateTimeField()
+    temperature_count = models.BigIntegerField(default=0)
+    temperature_sum = models.FloatField(null=True, blank=True)
+    temperature_min = models.FloatField(null=True, blank=True)
+    temperature_max = models.FloatField(null=True, blank=True)
+    temperature_last = models.FloatField(null=True, blank=True)
+    temperature_last_at = models.DateTimeField(null=True, blank=True)
+    humidity_count = models.BigIntegerField(default=0)
+    humidity_sum = models.FloatField(null=True, blank=True)
+    humidity_min = models.FloatField(null=True, blank=True)
+    humidity_max = models.FloatField(null=True, blank=True)
+    humidity_last = models.FloatField(null=True, blank=True)
+    humidity_last_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # окна по времени без датчика; с датчиком работает уникальный индекс
+            models.Index(fields=['bucket']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['sensor', 'bucket'], name='event_rollup_unique'),
+        ]
+
+
+class SensorState(models.Model):
+    """Сводка по событиям датчика, обновляется вместе с записью событий"""
+
+    sensor = models.OneToOneField(Sensor, on_delete=models.CASCADE, primary_key=True, related_name='state')
+    event_count = models.BigIntegerField(default=0)
+    first_seen = models.DateTimeField(null=True, blank=True)
+    last_seen = models.DateTimeField(null=True, blank=True)
+    last_temperature = models.FloatField(null=True, blank=True)
+    last_humidity = models.FloatField(null=True, blank=True)
+    temperature_min = models.FloatField(null=True, blank=True)
+    temperature_max = models.FloatField(null=True, blank=True)
+    humidity_min = models.FloatField(null=True, blank=True)
+    humidity_max = models.FloatField(null=True, blank=True)
+
+
+class ImportJob(models.Model):
+    class State:
+        PENDING = 'pending'
+        RUNNING = 'running'
+        DONE = 'done'
+        FAILED = 'failed'
+        STATES = ((PENDING, 'В очереди'), (RUNNING, 'Выполняется'), (DONE, 'Завершена'), (FAILED, 'Ошибка'))
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    state = models.CharField(max_length=16, choices=State.STATES, default=State.PENDING)
+    file_path = models.CharField(max_length=1024)
+    auto_create_sensors = models.BooleanField(default=False)
+    workers = models.PositiveSmallIntegerField(default=1)
+    rows_processed = models.BigIntegerField(default=0)
+    rows_failed = models.BigIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    detail = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
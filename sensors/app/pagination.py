@@ -0,0 +1,158 @@
+import base64
+
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param
+from rest_framework.utils.urls import replace_query_param
+
+
+class EventPageNumberPagination(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 10_000
+
+
+class EventCursorPagination(BasePagination):
+    """Keyset-пагинация событий по (created_at, id).
+
+    Следующая страница выбирается условием по последней строке предыдущей, а не OFFSET,
+    поэтому любая страница стоит как первая, а COUNT(*) не выполняется. Курсор задаёт
+    позицию только в порядке (created_at, id), поэтому ?ordering= принимается лишь по
+    created_at (по убыванию или по возрастанию), другая сортировка - ошибка 400.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering_param = api_settings.ORDERING_PARAM
+    max_page_size = 10_000
+    invalid_cursor_message = 'Неверный курсор'
+    invalid_ordering_message = 'С pagination=cursor сортировка возможна только по created_at или -created_at'
+    # допустимые значения ?ordering= и направление: True - по убыванию
+    orderings = {'': True, '-created_at': True, '-created_at,-id': True, 'created_at': False, 'created_at,id': False}
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request)))
+
+    def page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        descending = self.get_descending(request)
+        self.position, self.reverse = self.decode_cursor(request)
+
+        # ссылка previous обходит страницы в обратную сторону
+        ascending = self.reverse == descending
+        queryset = queryset.order_by(*(('created_at', 'id') if ascending else ('-created_at', '-id')))
+        if self.position:
+            created_at, pk = self.position
+            lookup = 'gt' if ascending else 'lt'
+            # нестрогое условие по created_at попадает в Index Cond, OR с id проверяется только на границе
+            queryset = queryset.filter(
+                Q(**{f'created_at__{lookup}e': created_at}),
+                Q(**{f'created_at__{lookup}': created_at}) | Q(created_at=created_at, **{f'id__{lookup}': pk}),
+            )
+        # одна лишняя строка показывает, есть ли страница дальше в направлении обхода
+        return queryset[: self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = self.position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.position is not None
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+        if page_size <= 0:
+            return api_settings.PAGE_SIZE
+        return min(page_size, self.max_page_size)
+
+    def get_descending(self, request):
+        ordering = request.query_params.get(self.ordering_param, '').replace(' ', '')
+        if ordering not in self.orderings:
+            raise ValidationError({self.ordering_param: self.invalid_ordering_message})
+        return self.orderings[ordering]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            created_at, pk, reverse = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii').split('|')
+            return (datetime.fromisoformat(created_at), int(pk)), reverse == '1'
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message) from None
+
+    def encode_cursor(self, event, reverse):
+        cursor = f'{event.created_at.isoformat()}|{event.id}|{int(reverse)}'
+        encoded = base64.urlsafe_b64encode(cursor.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'previous': self.get_previous_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class EventPagination(BasePagination):
+    """Пагинация списков событий: страницы с номерами или keyset по курсору.
+
+    Режим выбирается параметром ?pagination=page|cursor, по умолчанию - EVENTS_PAGINATION.
+    """
+
+    query_param = 'pagination'
+    modes = ('page', 'cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.select_paginator(request).paginate_queryset(queryset, request, view)
+
+    def select_paginator(self, request):
+        mode = request.query_params.get(self.query_param) or settings.EVENTS_PAGINATION
+        if mode not in self.modes:
+            raise ValidationError({self.query_param: f'Неизвестный режим пагинации: {mode}'})
+        paginator_class = EventCursorPagination if mode == 'cursor' else EventPageNumberPagination
+        self.paginator = paginator_class()
+        return self.paginator
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return EventPageNumberPagination().get_paginated_response_schema(schema)
@@ -0,0 +1,219 @@
+import io
+import multiprocessing
+import os
+import re
+
+from concurrent.futures import ALL_COMPLETED
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+from contextlib import suppress
+from itertools import islice
+
+from django.db import connections
+
+from sensors.app.cache import ResponseCache
+from sensors.app.services import EventDataParser
+from sensors.app.services import EventLoader
+from sensors.app.worker import init_worker
+from sensors.app.worker import settings_snapshot
+
+
+_BLANK_LINE = re.compile(rb'^[ \t\r\x0b\x0c]*$', re.MULTILINE)
+
+
+def _count_lines(data):
+    """(строк, непустых строк) в куске NDJSON так, как их считает EventDataParser.iter_ndjson"""
+    lines = data.count(b'\n')
+    blank = len(_BLANK_LINE.findall(data))
+    if data.endswith(b'\n') or not data:
+        # $ совпадает ещё и в самом конце данных, где строки уже нет
+        blank -= 1
+    else:
+        lines += 1
+    return lines, lines - blank
+
+
+def _loader_state(loader):
+    return {
+        'total_input': loader.total_input,
+        'valid_events': loader.valid_events,
+        'created': loader.created,
+        'sensors_created': loader.sensors_created,
+        'duplicates': loader.duplicates,
+        'parse_errors': loader.parse_errors,
+        'sensor_errors': loader.sensor_errors,
+    }
+
+
+def _load_ndjson_range(path, start, end, first_line, offset, skip, options):
+    """Задача процесса: строки NDJSON из [start, end) файла, кроме первых skip, в одной транзакции"""
+    try:
+        with open(path, 'rb') as file:
+            file.seek(start)
+            data = io.BytesIO(file.read(end - start))
+        loader = EventLoader(offset=offset + skip, **options)
+        loader.load_items(islice(EventDataParser.iter_ndjson(data, first_line=first_line), skip, None))
+        return _loader_state(loader)
+    finally:
+        connections.close_all()
+
+
+def _load_items(items, offset, options):
+    """Задача процесса: элементы, разобранные родительским процессом, в одной транзакции"""
+    try:
+        loader = EventLoader(offset=offset, **options)
+        loader.load_items(items)
+        return _loader_state(loader)
+    finally:
+        connections.close_all()
+
+
+class ParallelEventLoader(EventLoader):
+    """Загрузка большого файла пулом процессов: валидация и запись идут параллельно.
+
+    NDJSON делится по границам строк на куски - примерно по четыре на процесс, но от
+    MIN_RANGE_SIZE до RANGE_SIZE байт. Каждый процесс сам читает свой кусок и пишет
+    через своё соединение с БД. Номера строк и элементов в ошибках считаются заранее
+    по всему файлу, поэтому совпадают с EventLoader. Элементы JSON массива и сжатых
+    файлов разбирает родительский процесс, а в пул уходят пачками по TASK_ROWS: без
+    полного разбора границы элементов в байтах не найти.
+
+    Каждый кусок коммитится отдельно, как EventLoader(atomic=False): при ошибке
+    разбора уже записанные куски остаются. position - конец непрерывного начала файла,
+    все куски которого записаны. Процессы запускаются через spawn, а не fork: пул
+    создаётся и из многопоточного сервера (фоновые задачи), где дочерний процесс после
+    fork мог бы навсегда повиснуть на блокировке, захваченной чужим потоком. Настройки
+    передаются процессам снимком и применяются до django.setup().
+    """
+
+    RANGE_SIZE = 16 * 1024 * 1024
+    MIN_RANGE_SIZE = 1024 * 1024
+    TASK_ROWS = 50_000
+
+    def __init__(self, workers, chunk_size=None, on_progress=None, auto_create_sensors=False):
+        super().__init__(chunk_size=chunk_size, atomic=False, on_progress=on_progress)
+        self.workers = workers
+        self.options = {'chunk_size': self.chunk_size, 'auto_create_sensors': auto_create_sensors}
+        self.failed = 0
+        # итоги и концы (номер элемента после последнего) кусков по их номерам
+        self.states = {}
+        self.ends = {}
+        self.tasks_done = 0
+        self.committed = 0
+
+    @staticmethod
+    def create(workers, chunk_size=None, on_progress=None, auto_create_sensors=False):
+        """ParallelEventLoader для нескольких процессов, EventLoader с коммитом по порциям - для одного"""
+        if workers > 1:
+            return ParallelEventLoader(workers, chunk_size, on_progress, auto_create_sensors)
+        return EventLoader(chunk_size, atomic=False, on_progress=on_progress, auto_create_sensors=auto_create_sensors)
+
+    @property
+    def rows_failed(self):
+        # списки ошибок собираются по порядку кусков в конце, а прогресс нужен сразу
+        return self.failed
+
+    @property
+    def position(self):
+        return self.committed
+
+    def load_path(self, path, ndjson=False, skip=0):
+        self.offset = self.committed = skip
+        if ndjson and not os.fspath(path).endswith('.gz'):
+            return self._run(self._range_tasks(path, skip))
+        return self._run(self._stream_tasks(path, ndjson, skip))
+
+    def _range_tasks(self, path, skip):
+        """Куски NDJSON по байтам: (конец куска, задача, аргументы задачи)"""
+        size = os.path.getsize(path)
+        range_size = min(self.RANGE_SIZE, max(size // (self.workers * 4), self.MIN_RANGE_SIZE))
+        with open(path, 'rb') as file:
+            start = 0
+            first_line = 1
+            offset = 0
+            while start < size:
+                file.seek(min(start + range_size, size))
+                file.readline()
+                end = min(file.tell(), size)
+                file.seek(start)
+                lines, items = _count_lines(file.read(end - start))
+                if offset + items > skip:
+                    range_skip = max(skip - offset, 0)
+                    task_args = (path, start, end, first_line, offset, range_skip, self.options)
+                    yield offset + items, _load_ndjson_range, *task_args
+                start = end
+                first_line += lines
+                offset += items
+
+    def _stream_tasks(self, path, ndjson, skip):
+        """Пачки элементов, разобранных здесь же: (конец пачки, задача, аргументы задачи)"""
+        with EventDataParser.open_path(path) as file:
+            items = EventDataParser.iter_ndjson(file) if ndjson else EventDataParser.iter_json_array(file)
+            items = islice(items, skip, None)
+            offset = skip
+            while batch := list(islice(items, self.TASK_ROWS)):
+                yield offset + len(batch), _load_items, batch, offset, self.options
+                offset += len(batch)
+
+    def _run(self, tasks):
+        # соединения родителя не должны достаться дочерним процессам
+        connections.close_all()
+        pending = {}
+        context = multiprocessing.get_context('spawn')
+        try:
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=init_worker,
+                initargs=(settings_snapshot(),),
+            ) as pool:
+                try:
+                    for number, (end, task, *args) in enumerate(tasks):
+                        self.ends[number] = end
+                        pending[pool.submit(task, *args)] = number
+                        if len(pending) >= self.workers * 2:
+                            self._collect(pending)
+                    while pending:
+                        self._collect(pending)
+                except BaseException:
+                    for future in pending:
+                        future.cancel()
+                    # уже запущенные куски дописываются и тоже учитываются в position
+                    with suppress(Exception):
+                        self._collect(pending, ALL_COMPLETED)
+                    raise
+        finally:
+            # процессы сбрасывают только свой кэш ответов
+            ResponseCache.invalidate()
+
+        for number in sorted(self.states):
+            self.parse_errors.extend(self.states[number]['parse_errors'])
+            self.sensor_errors.extend(self.states[number]['sensor_errors'])
+        return self.result()
+
+    def _collect(self, pending, return_when=FIRST_COMPLETED):
+        """Ждёт задачи и учитывает итоги успешных, ошибка упавшей поднимается после этого"""
+        done, _ = wait(pending, return_when=return_when)
+        errors = []
+        for future in done:
+            number = pending.pop(future)
+            if future.cancelled():
+                continue
+            if (error := future.exception()) is not None:
+                errors.append(error)
+                continue
+            state = self.states[number] = future.result()
+            self.total_input += state['total_input']
+            self.valid_events += state['valid_events']
+            self.created += state['created']
+            self.sensors_created += state['sensors_created']
+            self.duplicates += state['duplicates']
+            self.failed += len(state['parse_errors']) + len(state['sensor_errors'])
+        while self.tasks_done in self.states:
+            self.committed = self.ends[self.tasks_done]
+            self.tasks_done += 1
+        if self.on_progress:
+            self.on_progress(self)
+        if errors:
+            raise errors[0]
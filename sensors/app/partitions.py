@@ -0,0 +1,145 @@
+import gzip
+import os
+import re
+
+from datetime import UTC
+from datetime import datetime
+
+from django.db import connection
+from django.db import transaction
+from django.utils import timezone
+
+from sensors.app.cache import ResponseCache
+from sensors.app.models import Event
+from sensors.app.models import EventKey
+from sensors.app.models import SensorState
+
+
+def month_start(value):
+    return value.astimezone(UTC).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+class EventPartitionService:
+    """Помесячные партиции таблицы событий: app_event_pYYYY_MM и app_event_default
+    для строк вне созданных диапазонов. Партиции создаются заранее, а старые
+    отсоединяются и удаляются целиком - стоимость не зависит от объёма истории.
+    """
+
+    @staticmethod
+    def table():
+        return Event._meta.db_table
+
+    @staticmethod
+    def default_partition():
+        return f'{EventPartitionService.table()}_default'
+
+    @staticmethod
+    def partition_name(month):
+        return f'{EventPartitionService.table()}_p{month:%Y_%m}'
+
+    @staticmethod
+    def is_partitioned():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))',
+                [EventPartitionService.table()],
+            )
+            return cursor.fetchone()[0]
+
+    @staticmethod
+    def partitions():
+        """Помесячные партиции по возрастанию: [(месяц, имя)]"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT child.relname FROM pg_inherits '
+                'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+                'WHERE pg_inherits.inhparent = to_regclass(%s)',
+                [EventPartitionService.table()],
+            )
+            names = [row[0] for row in cursor.fetchall()]
+
+        pattern = re.compile(rf'^{re.escape(EventPartitionService.table())}_p(\d{{4}})_(\d{{2}})$')
+        partitions = []
+        for name in names:
+            match = pattern.match(name)
+            if match:
+                month = datetime(int(match[1]), int(match[2]), 1, tzinfo=UTC)
+                partitions.append((month, name))
+        return sorted(partitions)
+
+    @staticmethod
+    @transaction.atomic
+    def create_partition(month):
+        """Создаёт партицию месяца, перенося в неё уже попавшие в default строки"""
+        quote = connection.ops.quote_name
+        table = EventPartitionService.table()
+        name = EventPartitionService.partition_name(month)
+        bounds = [month.isoformat(), add_months(month, 1).isoformat()]
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE TABLE {quote(name)} (LIKE {quote(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+            cursor.execute(
+                f'WITH moved AS (DELETE FROM {quote(EventPartitionService.default_partition())} '
+                f'WHERE created_at >= %s AND created_at < %s RETURNING *) '
+                f'INSERT INTO {quote(name)} SELECT * FROM moved',
+                bounds,
+            )
+            cursor.execute(
+                f'ALTER TABLE {quote(table)} ATTACH PARTITION {quote(name)} FOR VALUES FROM (%s) TO (%s)', bounds
+            )
+        return name
+
+    @staticmethod
+    @transaction.atomic
+    def drop_partition(name, archive_dir=None):
+        """Отсоединяет и удаляет партицию, при archive_dir сначала выгружает её в CSV.gz.
+
+        Счётчики событий в сводке датчиков уменьшаются на число удалённых строк,
+        остальные поля сводки остаются накопленными за всё время.
+        """
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {quote(EventPartitionService.table())} DETACH PARTITION {quote(name)}')
+            archive_path = None
+            if archive_dir:
+                os.makedirs(archive_dir, exist_ok=True)
+                archive_path = os.path.join(archive_dir, f'{name}.csv.gz')
+                with gzip.open(archive_path, 'wt', encoding='utf-8') as archive:
+                    cursor.copy_expert(f'COPY {quote(name)} TO STDOUT WITH (FORMAT csv, HEADER)', archive)
+            cursor.execute(
+                f'UPDATE {quote(SensorState._meta.db_table)} AS state '
+                f'SET event_count = state.event_count - dropped.count '
+                f'FROM (SELECT sensor_id, COUNT(*) AS count FROM {quote(name)} GROUP BY sensor_id) AS dropped '
+                f'WHERE state.sensor_id = dropped.sensor_id'
+            )
+            cursor.execute(f'DROP TABLE {quote(name)}')
+        ResponseCache.invalidate()
+        return archive_path
+
+    @staticmethod
+    def maintain(ahead_months, retention_months=None, archive_dir=None, now=None):
+        """Создаёт партиции на ahead_months вперёд и удаляет те, что целиком старше retention_months.
+
+        Вместе с партициями удаляются ключи событий старше срока хранения.
+        """
+        current = month_start(now or timezone.now())
+        existing = dict(EventPartitionService.partitions())
+        created = []
+        for offset in range(ahead_months + 1):
+            month = add_months(current, offset)
+            if month not in existing:
+                created.append(EventPartitionService.create_partition(month))
+
+        dropped = []
+        if retention_months is not None:
+            cutoff = add_months(current, -retention_months)
+            for month, name in sorted(existing.items()):
+                if add_months(month, 1) <= cutoff:
+                    EventPartitionService.drop_partition(name, archive_dir)
+                    dropped.append(name)
+            EventKey.objects.filter(created_at__lt=cutoff).delete()
+        return created, dropped
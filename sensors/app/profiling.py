@@ -0,0 +1,232 @@
+import cProfile
+import io
+import itertools
+import logging
+import pstats
+import random
+import re
+import threading
+import time
+
+from collections import deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from asgiref.sync import markcoroutinefunction
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError
+from django.db import connections
+from django.db import transaction
+from django.utils import timezone
+
+from sensors.app.middleware import view_label
+
+
+logger = logging.getLogger(__name__)
+
+# SQL-запросы профилируемого запроса: [(алиас БД, sql, параметры, many, секунды)], None вне профилирования
+_captured_queries = ContextVar[list | None]('captured_queries', default=None)
+
+
+def capture_sql(execute, sql, params, many, context):
+    """execute_wrapper соединений: запоминает SQL и его время, пока запрос профилируется"""
+    queries = _captured_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if len(queries) < settings.PROFILING_MAX_QUERIES:
+            queries.append((context['connection'].alias, sql, params, many, time.perf_counter() - started))
+
+
+def install_sql_capture(sender, connection, **kwargs):
+    """Обработчик connection_created, как metrics.install_query_timer"""
+    if capture_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(capture_sql)
+
+
+class ProfileBuffer:
+    """Последние профили медленных запросов в памяти процесса, не больше size"""
+
+    def __init__(self, size):
+        self.entries = deque[dict](maxlen=size)
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def add(self, entry):
+        with self.lock:
+            entry['id'] = next(self.ids)
+            self.entries.append(entry)
+
+    def list(self):
+        with self.lock:
+            return list(reversed(self.entries))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_profile_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = ProfileBuffer(settings.PROFILING_BUFFER_SIZE)
+        return _buffer
+
+
+class SlowRequestProfiler:
+    """Профиль запросов дольше PROFILING_THRESHOLD_MS или случайной доли PROFILING_SAMPLE_RATE.
+
+    Пока профилирование включено, SQL каждого запроса запоминается, а представление
+    выполняется под cProfile. Профиль сохраняется, только если запрос оказался медленным
+    или попал в выборку: для самых долгих SELECT строится план (explain_query), результат
+    попадает в ProfileBuffer. cProfile работает только в
+    одном запросе за раз и только в потоке запроса, поэтому у async-представлений и
+    параллельных запросов Python-профиля нет, а SQL и планы есть.
+    """
+
+    sync_capable = True
+    async_capable = True
+    # сами профили и метрики не профилируются, иначе их опрос вытеснит остальное из буфера
+    EXCLUDED_VIEWS = ('slow-requests', 'metrics')
+    # один cProfile на процесс: с Python 3.12 профилировщики разных потоков мешают друг другу
+    cprofile_lock = threading.Lock()
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _captured_queries.set([])
+        queries = _captured_queries.get()
+        profiler = self._start_profiler()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            duration = time.perf_counter() - started
+            self._stop_profiler(profiler)
+            _captured_queries.reset(token)
+        if self._should_record(request, duration):
+            get_profile_buffer().add(self._entry(request, response, duration, queries, profiler))
+        return response
+
+    async def __acall__(self, request):
+        token = _captured_queries.set([])
+        queries = _captured_queries.get()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            duration = time.perf_counter() - started
+            _captured_queries.reset(token)
+        if self._should_record(request, duration):
+            entry = await sync_to_async(self._entry)(request, response, duration, queries, None)
+            get_profile_buffer().add(entry)
+        return response
+
+    def _start_profiler(self):
+        if not self.cprofile_lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # профилировщик уже запущен кем-то ещё в этом процессе
+            self.cprofile_lock.release()
+            return None
+        return profiler
+
+    def _stop_profiler(self, profiler):
+        if profiler is not None:
+            profiler.disable()
+            self.cprofile_lock.release()
+
+    def _should_record(self, request, duration):
+        if view_label(request) in self.EXCLUDED_VIEWS:
+            return False
+        return duration * 1000 >= settings.PROFILING_THRESHOLD_MS or random.random() < settings.PROFILING_SAMPLE_RATE
+
+    @staticmethod
+    def _entry(request, response, duration, queries, profiler):
+        slowest = sorted(range(len(queries)), key=lambda index: queries[index][4], reverse=True)
+        explain = set(slowest[: settings.PROFILING_EXPLAIN_QUERIES])
+        return {
+            'created_at': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'view': view_label(request),
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 3),
+            'slow': duration * 1000 >= settings.PROFILING_THRESHOLD_MS,
+            'queries': [
+                {
+                    'sql': sql,
+                    'params': _format_params(params),
+                    'duration_ms': round(seconds * 1000, 3),
+                    'explain': explain_query(alias, sql, params) if index in explain and not many else None,
+                }
+                for index, (alias, sql, params, many, seconds) in enumerate(queries)
+            ],
+            'profile': format_profile(profiler) if profiler is not None else None,
+        }
+
+
+def _format_params(params):
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: str(value) for key, value in params.items()}
+    return [str(value) for value in params]
+
+
+# SELECT ... FOR UPDATE / FOR NO KEY UPDATE / FOR SHARE / FOR KEY SHARE
+_LOCKING_CLAUSE = re.compile(r'\bFOR\s+(?:NO\s+KEY\s+)?UPDATE\b|\bFOR\s+(?:KEY\s+)?SHARE\b', re.IGNORECASE)
+
+
+def explain_query(alias, sql, params):
+    """План SELECT, None для остальных запросов и для SELECT, блокирующих строки.
+
+    По умолчанию это EXPLAIN, который запрос не выполняет. С PROFILING_EXPLAIN_ANALYZE -
+    EXPLAIN (ANALYZE, BUFFERS) с фактическим временем: он выполняет запрос ещё раз в потоке
+    запроса, до отправки ответа, поэтому идёт в транзакции, которая откатывается.
+    """
+    connection = connections[alias]
+    if (
+        connection.vendor != 'postgresql'
+        or not sql.lstrip().upper().startswith('SELECT')
+        or _LOCKING_CLAUSE.search(sql)
+    ):
+        return None
+    options = ' (ANALYZE, BUFFERS)' if settings.PROFILING_EXPLAIN_ANALYZE else ''
+    try:
+        with transaction.atomic(using=alias), connection.cursor() as cursor:
+            cursor.execute(f'SET LOCAL statement_timeout = {int(settings.PROFILING_EXPLAIN_TIMEOUT_MS)}')
+            cursor.execute(f'EXPLAIN{options} {sql}', params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+            transaction.set_rollback(True, using=alias)
+    except DatabaseError as e:
+        logger.warning(f'EXPLAIN не выполнен: {e!s}')
+        return f'EXPLAIN не выполнен: {e!s}'
+    return plan
+
+
+def format_profile(profiler, limit=30):
+    """Первые limit функций профиля по накопленному времени в текстовом виде pstats"""
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+    return stream.getvalue()
@@ -0,0 +1,74 @@
+import csv
+import io
+
+import orjson
+
+from django.conf import settings
+from rest_framework.renderers import BaseRenderer
+from rest_framework.renderers import JSONRenderer
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson для больших списков событий.
+
+    Вывод совпадает с JSONRenderer: компактный UTF-8 с экранированием U+2028/U+2029.
+    Отступы (?indent в Accept) и выключенный EVENTS_FAST_SERIALIZATION уходят в JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            not settings.EVENTS_FAST_SERIALIZATION
+            or self.get_indent(accepted_media_type or '', renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        ret = orjson.dumps(data, default=self.encoder_class().default)
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Выгрузка событий: объект JSON на строку. render() нужен для ответов с ошибками"""
+
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return self.render_rows(data if isinstance(data, list) else [data], header=True)
+
+    def render_rows(self, rows, header):
+        return b''.join(orjson.dumps(row) + b'\n' for row in rows)
+
+
+class CSVRenderer(BaseRenderer):
+    """Выгрузка событий в CSV с заголовком. Ошибки выводятся строками (поле, сообщение)"""
+
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+    fields = ('id', 'name', 'temperature', 'humidity', 'created_at', 'sensor')
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        errors = data.items() if isinstance(data, dict) else [('detail', data)]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(['field', 'detail'])
+        for field, messages in errors:
+            for message in messages if isinstance(messages, list) else [messages]:
+                writer.writerow([field, message])
+        return buffer.getvalue().encode(self.charset)
+
+    def render_rows(self, rows, header):
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=self.fields, lineterminator='\n')
+        if header:
+            writer.writeheader()
+        writer.writerows(rows)
+        return buffer.getvalue().encode(self.charset)
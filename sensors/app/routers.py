@@ -0,0 +1,67 @@
+import random
+
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db import connections
+
+
+class ReadRouting:
+    """Реплика, с которой читает текущий запрос; после первой записи чтение уходит на основную БД"""
+
+    def __init__(self, replica):
+        self.replica = replica
+        self.wrote = False
+
+
+# маршрутизация чтения текущего запроса, None вне запросов: команды и фоновые задачи читают с основной БД
+_read_routing = ContextVar[ReadRouting | None]('read_routing', default=None)
+
+
+def start_read_routing(request_method):
+    """Безопасные запросы читают с одной случайной реплики, остальные - с основной БД"""
+    replica = None
+    if request_method in ('GET', 'HEAD', 'OPTIONS') and settings.DATABASE_REPLICAS:
+        replica = random.choice(settings.DATABASE_REPLICAS)
+    routing = ReadRouting(replica)
+    return routing, _read_routing.set(routing)
+
+
+def stop_read_routing(token):
+    _read_routing.reset(token)
+
+
+def reads_from_replica():
+    """Читает ли текущий запрос с реплики, которая может отставать от основной БД"""
+    routing = _read_routing.get()
+    return routing is not None and routing.replica is not None and not routing.wrote
+
+
+class ReplicaRouter:
+    """Запись и миграции - на основную БД, чтение в запросах из ReplicaRoutingMiddleware - на реплику.
+
+    Внутри транзакции и после записи в том же запросе чтение остаётся на основной БД,
+    иначе оно не увидело бы только что записанные строки.
+    """
+
+    def db_for_read(self, model, **hints):
+        routing = _read_routing.get()
+        if routing is None or routing.replica is None or routing.wrote:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return routing.replica
+
+    def db_for_write(self, model, **hints):
+        routing = _read_routing.get()
+        if routing is not None:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # на репликах те же данные, что и на основной БД
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
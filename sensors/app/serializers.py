@@ -1,15 +1,39 @@
 import logging
 
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
 
+from sensors.app.cache import sensor_id_cache
 from sensors.app.models import Event
+from sensors.app.models import ImportJob
 from sensors.app.models import Sensor
+from sensors.app.models import SensorState
+from sensors.app.services import EventAggregationService
+from sensors.app.services import SensorStateService
 
 
 logger = logging.getLogger(__name__)
 
 
+class SensorStateSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SensorState
+        exclude = ['sensor']
+
+
+class SensorSummarySerializer(serializers.ModelSerializer):
+    name = serializers.CharField(source='sensor.name', read_only=True)
+    sensor_type = serializers.IntegerField(source='sensor.sensor_type', read_only=True)
+
+    class Meta:
+        model = SensorState
+        fields = ['sensor_id', 'name', 'sensor_type', *SensorStateService.STATE_FIELDS]
+
+
 class SensorSerializer(serializers.ModelSerializer):
+    state = SensorStateSerializer(read_only=True)
+
     class Meta:
         model = Sensor
         fields = '__all__'
@@ -28,17 +52,36 @@ class SensorSerializer(serializers.ModelSerializer):
         return value.strip()
 
 
+class SensorIdField(serializers.PrimaryKeyRelatedField):
+    """Ссылка на датчик, которая проверяется по sensor_id_cache, обычно без запроса к БД"""
+
+    default_error_messages = {
+        **serializers.PrimaryKeyRelatedField.default_error_messages,
+        'does_not_exist': 'Датчик с ID {pk_value} не существует',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in sensor_id_cache.existing({pk}):
+            self.fail('does_not_exist', pk_value=data)
+        # для сохранения события нужен только первичный ключ датчика
+        return Sensor(pk=pk)
+
+
 class EventSerializer(serializers.ModelSerializer):
+    sensor = SensorIdField(queryset=Sensor.objects.all())
+
     class Meta:
         model = Event
-        fields = '__all__'
+        # явный порядок: объявленное поле sensor при '__all__' встало бы после id
+        fields = ['id', 'name', 'temperature', 'humidity', 'created_at', 'sensor']
         read_only_fields = ['id', 'created_at']
 
-    def validate_sensor_id(self, value):
-        if not Sensor.objects.filter(id=value).exists():
-            raise serializers.ValidationError(f'Датчик с ID {value} не существует')
-        return value
-
     def validate_temperature(self, value):
         if value is not None:
             if not isinstance(value, (int, float)):
@@ -73,20 +116,126 @@ class EventSerializer(serializers.ModelSerializer):
         return data
 
 
+class QueuedEventSerializer(EventSerializer):
+    """EventSerializer для отложенной записи: событие уходит в очередь, а не в БД.
+    События датчиков, удалённых до записи пачки, отбрасываются"""
+
+    def to_row(self):
+        """Событие в формате EventDataValidator для EventService.bulk_create_events"""
+        return {
+            'sensor_id': self.validated_data['sensor'].pk,
+            'name': self.validated_data['name'],
+            'temperature': self.validated_data.get('temperature'),
+            'humidity': self.validated_data.get('humidity'),
+        }
+
+
+class EventRowSerializer:
+    """Вывод списков событий без ModelSerializer: строки values_list сразу в словари.
+
+    Результат совпадает с EventSerializer (включая порядок полей: связи у ModelSerializer идут
+    последними), но без экземпляров модели и обхода полей DRF.
+    """
+
+    FIELDS = ('id', 'sensor_id', 'name', 'temperature', 'humidity', 'created_at')
+
+    @staticmethod
+    def queryset(queryset):
+        return queryset.values_list(*EventRowSerializer.FIELDS, named=True)
+
+    @staticmethod
+    def data(rows):
+        tz = timezone.get_current_timezone() if settings.USE_TZ else None
+        return [
+            {
+                'id': event_id,
+                'name': name,
+                'temperature': temperature,
+                'humidity': humidity,
+                'created_at': _isoformat(created_at, tz),
+                'sensor': sensor_id,
+            }
+            for event_id, sensor_id, name, temperature, humidity, created_at in rows
+        ]
+
+
+def _format_size(size):
+    """Размер в байтах для сообщений: 10MB, 1.5KB, 10 байт"""
+    for unit, factor in (('MB', 1024 * 1024), ('KB', 1024)):
+        if size >= factor:
+            return f'{round(size / factor, 1):g}{unit}'
+    return f'{size} байт'
+
+
+def _isoformat(value, tz):
+    """Как DateTimeField.to_representation: в текущем часовом поясе, UTC как Z"""
+    if value is None:
+        return None
+    if tz is not None:
+        value = value.astimezone(tz)
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+class EventAggregateQuerySerializer(serializers.Serializer):
+    bucket = serializers.ChoiceField(choices=EventAggregationService.BUCKETS, default='hour')
+
+
+class EventBucketSerializer(serializers.Serializer):
+    bucket = serializers.DateTimeField()
+    count = serializers.IntegerField()
+    temperature_min = serializers.FloatField(allow_null=True)
+    temperature_max = serializers.FloatField(allow_null=True)
+    temperature_avg = serializers.FloatField(allow_null=True)
+    temperature_last = serializers.FloatField(allow_null=True)
+    humidity_min = serializers.FloatField(allow_null=True)
+    humidity_max = serializers.FloatField(allow_null=True)
+    humidity_avg = serializers.FloatField(allow_null=True)
+    humidity_last = serializers.FloatField(allow_null=True)
+
+
 class LoadEventsSerializer(serializers.Serializer):
     json_file = serializers.FileField(
         validators=[],
         required=True,
         write_only=True,
     )
+    background = serializers.BooleanField(required=False, default=False)
+    auto_create_sensors = serializers.BooleanField(required=False, default=False)
+    workers = serializers.IntegerField(required=False, default=1, min_value=1)
+
+    def validate_workers(self, value):
+        if value > settings.EVENTS_IMPORT_MAX_PROCESSES:
+            raise serializers.ValidationError(f'Не больше {settings.EVENTS_IMPORT_MAX_PROCESSES} процессов')
+        return value
 
     def validate(self, attrs):
+        if attrs['workers'] > 1 and not attrs['background']:
+            raise serializers.ValidationError({'workers': 'Несколько процессов доступно только с background=true'})
+
         f = attrs['json_file']
         name = (f.name or '').lower()
         if not name.endswith('.json'):
             raise serializers.ValidationError({'json_file': 'Ожидается .json файл'})
 
-        if f.size > 5 * 1024 * 1024:
-            raise serializers.ValidationError({'json_file': 'Файл слишком большой (макс. 5MB)'})
+        max_size = settings.EVENTS_UPLOAD_MAX_SIZE
+        if max_size is not None and f.size > max_size:
+            raise serializers.ValidationError({'json_file': f'Файл слишком большой (макс. {_format_size(max_size)})'})
 
         return attrs
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    rows_per_second = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportJob
+        exclude = ['file_path']
+
+    def get_rows_per_second(self, job):
+        if not job.started_at:
+            return None
+        elapsed = ((job.finished_at or timezone.now()) - job.started_at).total_seconds()
+        return round(job.rows_processed / elapsed, 1) if elapsed > 0 else None
@@ -1,219 +1,1074 @@
+import gzip
 import json
+import os
+import re
 
+from contextlib import contextmanager
+from contextlib import nullcontext
+from contextlib import suppress
 from io import TextIOWrapper
+from itertools import islice
+from itertools import repeat
+from operator import itemgetter
 
+import numpy as np
+import orjson
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import IntegrityError
+from django.db import connection
 from django.db import transaction
+from django.db.backends.postgresql.psycopg_any import errors
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+from django.db.models import Avg
+from django.db.models import Count
+from django.db.models import FloatField
+from django.db.models import Func
+from django.db.models import Max
+from django.db.models import Min
+from django.db.models import Q
+from django.db.models import Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
 
+from sensors.app.cache import ResponseCache
+from sensors.app.cache import sensor_id_cache
 from sensors.app.exceptions import ParseError
 from sensors.app.models import Event
+from sensors.app.models import EventKey
+from sensors.app.models import EventRollup
 from sensors.app.models import Sensor
+from sensors.app.models import SensorState
 
 
-class EventDataParser:
-    @staticmethod
-    def parse_json_file(file):
-        try:
-            data = json.load(TextIOWrapper(file, encoding='utf-8'))
-        except json.JSONDecodeError as e:
-            raise ParseError(f'Невалидный JSON: {e}') from e
-
-        if not isinstance(data, list):
-            raise ParseError('JSON должен быть массивом')
+class _JSONArrayReader:
+    """Потоковый разбор JSON массива.
 
-        return EventDataValidator.validate_events(data)
+    Объекты, целиком лежащие в буфере, декодируются одним вызовом orjson. Если кусок
+    не разобрался (битый элемент, NaN, объект на границе чтения и т.п.), элементы до
+    следующего чтения декодируются по одному через json, и ошибки те же, что без orjson.
+    """
 
+    WHITESPACE = ' \t\n\r'
+    # последний в буфере конец объекта, за которым начинается следующий
+    LAST_OBJECT_BOUNDARY = re.compile(r'.*(}[ \t\n\r]*,[ \t\n\r]*{)', re.DOTALL)
+    # целые вне int64 orjson превращает в float, а json оставляет int: куски с 19 цифрами подряд
+    # разбираются по одному. Цифры заменяются нулями - это быстрее, чем искать регулярным выражением
+    DIGITS_TO_ZERO = str.maketrans('123456789', '000000000')
+    LONG_NUMBER = '0' * 19
 
-class EventDataValidator:
-    @staticmethod
-    def validate_events(raw_events):
-        if not isinstance(raw_events, list):
-            return [], ['JSON должен быть массивом событий']
-
-        result = []
-        errors = []
-        for idx, item in enumerate(raw_events, start=1):
-            if not isinstance(item, dict):
-                errors.append(f'#{idx}: элемент не объект')
-                continue
-            sensor_id = item.get('sensor_id')
-            name = item.get('name')
-            temperature = item.get('temperature')
-            humidity = item.get('humidity')
+    def __init__(self, reader, read_size, max_item_size):
+        self.reader = reader
+        self.read_size = read_size
+        self.max_item_size = max_item_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        # сколько символов и строк уже отброшено из буфера, для позиций в ошибках
+        self.offset = 0
+        self.lines = 0
+        self.line_start = 0
+        self.eof = False
+        # число чтений и на каком из них пакетный разбор не удался
+        self.reads = 0
+        self.batch_failed_at = -1
 
-            if not sensor_id:
-                errors.append(f'#{idx}: отсутствует поле sensor_id')
-                continue
+    def __iter__(self):
+        if self._peek() != '[':
+            # не массив или битый JSON: текст ошибки формирует обычный парсер
+            try:
+                json.loads(self.buf + self.reader.read())
+            except json.JSONDecodeError as e:
+                raise ParseError(f'Невалидный JSON: {e}') from e
+            raise ParseError('JSON должен быть массивом')
 
-            if not temperature and not humidity:
-                errors.append(f'#{idx}: событие без параметров (отсутствуют temperature и humidity)')
-                continue
+        self.pos += 1
+        if self._peek() == ']':
+            self.pos += 1
+        else:
+            while True:
+                yield from self._decode_batch()
+                yield self._decode()
+                char = self._peek()
+                if char == ',':
+                    self.pos += 1
+                    continue
+                if char == ']':
+                    self.pos += 1
+                    break
+                raise self._error("Expecting ',' delimiter", self.pos)
 
-            try:
-                sensor_id = int(sensor_id)
-            except Exception:
-                errors.append(f'#{idx}: sensor_id не целое число')
-                continue
-            if sensor_id <= 0:
-                errors.append(f'#{idx}: sensor_id должен быть > 0')
-                continue
+        if self._peek():
+            raise self._error('Extra data', self.pos)
 
-            name_str = str(name).strip()
-            if not name_str:
-                errors.append(f'#{idx}: name пустой')
-                continue
+    def _read(self):
+        if self.eof:
+            return False
+        chunk = self.reader.read(self.read_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.reads += 1
+        if self.pos > self.read_size:
+            dropped = self.buf[: self.pos]
+            self.lines += dropped.count('\n')
+            newline = dropped.rfind('\n')
+            if newline != -1:
+                self.line_start = self.offset + newline + 1
+            self.offset += self.pos
+            self.buf = self.buf[self.pos :]
+            self.pos = 0
+        self.buf += chunk
+        return True
 
-            if temperature:
-                try:
-                    temperature = float(temperature)
-                except Exception:
-                    errors.append(f'#{idx}: temperature не число')
-                    continue
+    def _peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in self.WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._read():
+                return ''
 
-                if not (-100.0 <= temperature <= 200.0):
-                    errors.append(f'#{idx}: temperature вне диапазона [-100; 200]')
-                    continue
+    def _decode_batch(self):
+        """Объекты от текущей позиции до последней границы объектов в буфере; объект после неё разбирает _decode"""
+        if self._peek() != '{' or self.reads == self.batch_failed_at:
+            return []
+        boundary = self.LAST_OBJECT_BOUNDARY.match(self.buf, self.pos)
+        if boundary is None:
+            return []
+        # граница могла найтись внутри строки - тогда кусок не разберётся и сработает запасной путь
+        text = self.buf[self.pos : boundary.start(1) + 1]
+        values = None
+        if self.LONG_NUMBER not in text.translate(self.DIGITS_TO_ZERO):
+            with suppress(orjson.JSONDecodeError):
+                values = orjson.loads(f'[{text}]')
+        if values is None:
+            self.batch_failed_at = self.reads
+            return []
+        self.pos = boundary.end(1) - 1
+        return values
 
-            if humidity:
-                try:
-                    humidity = float(humidity)
-                except Exception:
-                    errors.append(f'#{idx}: humidity не число')
+    def _decode(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                # элемент мог оборваться на границе чтения - дочитываем, но не бесконечно
+                if len(self.buf) - self.pos < self.max_item_size and self._read():
                     continue
+                raise self._error(e.msg, e.pos) from e
+            # значение готово, только когда за ним в буфере виден разделитель: число на границе
+            # чтения ("12." + "5") raw_decode вернул бы обрезанным
+            after = end
+            while after < len(self.buf) and self.buf[after] in self.WHITESPACE:
+                after += 1
+            complete = after < len(self.buf) and self.buf[after] in ',]'
+            if not complete and len(self.buf) - self.pos < self.max_item_size and self._read():
+                continue
+            self.pos = end
+            return value
 
-                if not (0.0 <= humidity <= 100.0):
-                    errors.append(f'#{idx}: humidity вне диапазона [0; 100]')
-                    continue
+    def _error(self, msg, pos):
+        lineno = self.lines + self.buf.count('\n', 0, pos) + 1
+        newline = self.buf.rfind('\n', 0, pos)
+        colno = pos - newline if newline != -1 else self.offset + pos - self.line_start + 1
+        return ParseError(f'Невалидный JSON: {msg}: line {lineno} column {colno} (char {self.offset + pos})')
 
-            result.append(
-                {
-                    'sensor_id': sensor_id,
-                    'name': name_str,
-                    'temperature': temperature,
-                    'humidity': humidity,
-                }
-            )
-        return result, errors
 
+class EventDataParser:
+    READ_SIZE = 64 * 1024
+    MAX_ITEM_SIZE = 1024 * 1024
 
-class SensorService:
     @staticmethod
-    @transaction.atomic
-    def get_or_create_sensors(sensor_ids, default_type):
-        existing_sensors = Sensor.objects.filter(id__in=sensor_ids)
-        existing_map = {sensor.id: sensor for sensor in existing_sensors}
-        missing_ids = sensor_ids - set(existing_map.keys())
-
-        if missing_ids:
-            sensors_to_create = [
-                Sensor(
-                    id=sensor_id,
-                    name=f'auto_sensor_{sensor_id}',
-                    sensor_type=default_type,
-                )
-                for sensor_id in sorted(missing_ids)
-            ]
-            created_sensors = Sensor.objects.bulk_create(sensors_to_create)
-            for sensor in created_sensors:
-                existing_map[sensor.id] = sensor
-
-        return existing_map
+    def iter_json_array(file, read_size=READ_SIZE, max_item_size=MAX_ITEM_SIZE):
+        """Отдаёт элементы JSON массива по одному, не загружая файл в память целиком"""
+        reader = TextIOWrapper(file, encoding='utf-8')
+        try:
+            yield from _JSONArrayReader(reader, read_size, max_item_size)
+        except UnicodeDecodeError as e:
+            raise ParseError(f'Невалидный JSON: {e}') from e
+        finally:
+            reader.detach()
 
+    @staticmethod
+    def open_path(path):
+        """Файл событий с диска, .gz распаковывается на лету"""
+        return gzip.open(path, 'rb') if os.fspath(path).endswith('.gz') else open(path, 'rb')
 
-class EventService:
     @staticmethod
-    @transaction.atomic
-    def bulk_create_events(validated_data, sensors_map):
-        events_to_create = []
-        missing_sensor_errors = []
+    def iter_ndjson(file, max_item_size=MAX_ITEM_SIZE, first_line=1):
+        """Отдаёт объекты NDJSON по одному на строку, пустые строки пропускаются.
 
-        for row in validated_data:
-            sensor_id = row['sensor_id']
-            sensor = sensors_map.get(sensor_id)
-            if sensor:
-                events_to_create.append(
-                    Event(
-                        sensor=sensor,
-                        name=row['name'],
-                        temperature=row['temperature'],
-                        humidity=row['humidity'],
-                    )
-                )
-            else:
-                missing_sensor_errors.append(f"Датчик ID {sensor_id} не существует. Событие '{row['name']}' пропущено.")
+        first_line - номер первой строки в ошибках, когда file - часть большего файла.
+        """
+        for lineno, line in enumerate(iter(lambda: file.readline(max_item_size + 1), b''), start=first_line):
+            if len(line) > max_item_size:
+                raise ParseError(f'Невалидный JSON: строка {lineno} длиннее {max_item_size} байт')
+            if line.strip():
+                try:
+                    yield orjson.loads(line)
+                except orjson.JSONDecodeError as e:
+                    raise ParseError(f'Невалидный JSON: строка {lineno}: {e}') from e
 
-        if events_to_create:
-            Event.objects.bulk_create(events_to_create, batch_size=100)
 
-        return len(events_to_create), missing_sensor_errors
+class EventDataValidator:
+    EVENT_KEY_MAX_LENGTH = 255
 
+    @staticmethod
+    def validate_events(raw_events, start=1):
+        if not isinstance(raw_events, list):
+            return [], ['JSON должен быть массивом событий']
 
-def parse_json_events(data):
-    if not isinstance(data, list):
-        return [], ['JSON должен быть массивом событий']
+        result = []
+        errors = []
+        for idx, item in enumerate(raw_events, start=start):
+            event, error = EventDataValidator.validate_event(idx, item)
+            if error:
+                errors.append(error)
+            else:
+                result.append(event)
+        return result, errors
 
-    result = []
-    errors = []
-    for idx, item in enumerate(data, start=1):
+    @staticmethod
+    def validate_event(idx, item):
         if not isinstance(item, dict):
-            errors.append(f'#{idx}: элемент не объект')
-            continue
+            return None, f'#{idx}: элемент не объект'
         sensor_id = item.get('sensor_id')
         name = item.get('name')
         temperature = item.get('temperature')
         humidity = item.get('humidity')
 
         if not sensor_id:
-            errors.append(f'#{idx}: отсутствует поле sensor_id')
-            continue
+            return None, f'#{idx}: отсутствует поле sensor_id'
 
         if not temperature and not humidity:
-            errors.append(f'#{idx}: событие без параметров (отсутствуют temperature и humidity)')
-            continue
+            return None, f'#{idx}: событие без параметров (отсутствуют temperature и humidity)'
 
-        # sensor_id
         try:
             sensor_id = int(sensor_id)
         except Exception:
-            errors.append(f'#{idx}: sensor_id не целое число')
-            continue
+            return None, f'#{idx}: sensor_id не целое число'
         if sensor_id <= 0:
-            errors.append(f'#{idx}: sensor_id должен быть > 0')
-            continue
+            return None, f'#{idx}: sensor_id должен быть > 0'
 
-        # name
         name_str = str(name).strip()
         if not name_str:
-            errors.append(f'#{idx}: name пустой')
-            continue
+            return None, f'#{idx}: name пустой'
+
+        event_key = item.get('event_key')
+        if event_key is not None:
+            if not isinstance(event_key, (str, int)) or isinstance(event_key, bool):
+                return None, f'#{idx}: event_key не строка'
+            event_key = str(event_key).strip()
+            if not 0 < len(event_key) <= EventDataValidator.EVENT_KEY_MAX_LENGTH:
+                return None, f'#{idx}: event_key пустой или длиннее {EventDataValidator.EVENT_KEY_MAX_LENGTH} символов'
 
-        # temperature / humidity
         if temperature:
             try:
                 temperature = float(temperature)
             except Exception:
-                errors.append(f'#{idx}: temperature не число')
-                continue
+                return None, f'#{idx}: temperature не число'
 
             if not (-100.0 <= temperature <= 200.0):
-                errors.append(f'#{idx}: temperature вне диапазона [-100; 200]')
-                continue
+                return None, f'#{idx}: temperature вне диапазона [-100; 200]'
+
         if humidity:
             try:
                 humidity = float(humidity)
             except Exception:
-                errors.append(f'#{idx}: humidity не число')
-                continue
+                return None, f'#{idx}: humidity не число'
 
             if not (0.0 <= humidity <= 100.0):
-                errors.append(f'#{idx}: humidity вне диапазона [0; 100]')
-                continue
+                return None, f'#{idx}: humidity вне диапазона [0; 100]'
+
+        return {
+            'sensor_id': sensor_id,
+            'name': name_str,
+            'temperature': temperature,
+            'humidity': humidity,
+            'event_key': event_key,
+        }, None
+
+
+def _number_column(values):
+    """Числовой столбец и маска пустых значений для temperature/humidity.
 
-        result.append(
+    Пустым считается None и прочие ложные не-числа ('' и т.п.), ноль - обычное значение.
+    """
+    null = np.fromiter(
+        (value is None or (not value and not isinstance(value, (int, float))) for value in values),
+        dtype=bool,
+        count=len(values),
+    )
+    column = np.fromiter(
+        (np.nan if is_null else value for value, is_null in zip(values, null.tolist(), strict=True)),
+        dtype=np.float64,
+        count=len(values),
+    )
+    return column, null
+
+
+class EventColumns:
+    """Провалидированные события по столбцам NumPy для COPY и сводки датчиков.
+
+    Пустые temperature/humidity хранятся как NaN вместе с маской, чтобы столбцы
+    оставались числовыми. Для вставки через COPY строки форматируются сразу по столбцам.
+    Необязательный event_key - столбец объектов, None там, где ключа нет.
+    """
+
+    def __init__(self, sensor_id, name, temperature, temperature_null, humidity, humidity_null, event_key=None):
+        self.sensor_id = sensor_id
+        self.name = name
+        self.temperature = temperature
+        self.temperature_null = temperature_null
+        self.humidity = humidity
+        self.humidity_null = humidity_null
+        self.event_key = np.full(len(sensor_id), None, dtype=object) if event_key is None else event_key
+
+    @classmethod
+    def from_rows(cls, rows):
+        temperature, temperature_null = _number_column([row['temperature'] for row in rows])
+        humidity, humidity_null = _number_column([row['humidity'] for row in rows])
+        return cls(
+            sensor_id=np.fromiter((row['sensor_id'] for row in rows), dtype=np.int64, count=len(rows)),
+            name=np.fromiter((row['name'] for row in rows), dtype=object, count=len(rows)),
+            temperature=temperature,
+            temperature_null=temperature_null,
+            humidity=humidity,
+            humidity_null=humidity_null,
+            event_key=np.fromiter((row.get('event_key') for row in rows), dtype=object, count=len(rows)),
+        )
+
+    def __len__(self):
+        return len(self.sensor_id)
+
+    def __getitem__(self, index):
+        return EventColumns(
+            sensor_id=self.sensor_id[index],
+            name=self.name[index],
+            temperature=self.temperature[index],
+            temperature_null=self.temperature_null[index],
+            humidity=self.humidity[index],
+            humidity_null=self.humidity_null[index],
+            event_key=self.event_key[index],
+        )
+
+
+class SensorService:
+    # сколько создание датчиков ждёт чужую незакоммиченную строку с тем же ID
+    CREATE_LOCK_TIMEOUT_MS = 10_000
+
+    @staticmethod
+    @contextmanager
+    def side_connection():
+        """Отдельное соединение с той же БД для транзакций мимо текущей, закрывается на выходе.
+
+        Подключение открывается при первом запросе, поэтому неиспользованное соединение ничего не стоит.
+        """
+        side = connection.copy()
+        try:
+            yield side
+        finally:
+            side.close()
+
+    @staticmethod
+    def get_or_create_sensors(sensor_ids, default_type, side=None):
+        """Создаёт недостающие датчики и возвращает множество ID созданных.
+
+        Уже существующие датчики в ответ не попадают, и объекты Sensor не возвращаются:
+        загрузке нужны только ID, а объекты стоили бы лишнего запроса.
+
+        Датчики создаются на отдельном соединении в короткой транзакции, которая
+        коммитится сразу, независимо от транзакции загрузки. Соединение side из
+        side_connection() переиспользуется между вызовами, без него открывается своё. Иначе новые строки
+        оставались бы незакоммиченными до конца загрузки, и параллельная загрузка с теми
+        же новыми ID ждала бы её целиком, а при разном порядке ID - взаимоблокировалась.
+        INSERT ... ON CONFLICT DO NOTHING идёт по возрастанию ID. Явные ID обходят
+        последовательность, поэтому она сдвигается за самый большой из них - под
+        advisory-блокировкой и только вперёд.
+        """
+        # видимые текущему соединению датчики, в том числе его незакоммиченные, не трогаем:
+        # отдельное соединение ждало бы коммита этой же транзакции
+        missing_ids = sorted(set(sensor_ids) - sensor_id_cache.existing(sensor_ids))
+        if not missing_ids:
+            return set()
+
+        table = connection.ops.quote_name(Sensor._meta.db_table)
+        insert = f"""
+            INSERT INTO {table} (id, name, sensor_type, created_at)
+            SELECT id, 'auto_sensor_' || id, %s, %s FROM unnest(%s::bigint[]) AS id
+            ORDER BY id
+            ON CONFLICT (id) DO NOTHING
+            RETURNING id
+        """
+        advance = """
+            SELECT setval(sequence, %s) FROM pg_get_serial_sequence(%s, 'id') AS sequence
+            WHERE %s > COALESCE(pg_sequence_last_value(sequence), 0)
+        """
+        lock = "SELECT pg_advisory_xact_lock(pg_get_serial_sequence(%s, 'id')::regclass::oid::bigint)"
+        with nullcontext(side) if side is not None else SensorService.side_connection() as side:
+            try:
+                side.set_autocommit(False)
+                with side.cursor() as cursor:
+                    cursor.execute(f'SET LOCAL lock_timeout = {int(SensorService.CREATE_LOCK_TIMEOUT_MS)}')
+                    cursor.execute(insert, [default_type, timezone.now(), missing_ids])
+                    created_ids = {row[0] for row in cursor.fetchall()}
+                    if created_ids:
+                        cursor.execute(lock, [table])
+                        cursor.execute(advance, [max(created_ids), table, max(created_ids)])
+                side.commit()
+            except Exception:
+                side.rollback()
+                raise
+
+        # датчики уже закоммичены, даже если загрузка потом откатится
+        sensor_id_cache.store(missing_ids)
+        if created_ids and ResponseCache.enabled():
+            ResponseCache.bump()
+        return created_ids
+
+
+class EventService:
+    COPY_FIELDS = ('sensor', 'name', 'temperature', 'humidity', 'created_at')
+    # сколько строк форматируется в текст COPY за одно чтение
+    COPY_WRITE_ROWS = 1000
+
+    @staticmethod
+    @transaction.atomic
+    def bulk_create_events(validated_data, sensors_map, states=None):
+        """validated_data - список словарей от EventDataValidator.
+
+        Сводка датчиков обновляется сразу, а с states (PendingSensorStates) откладывается
+        до states.apply(). Возвращает (число созданных, ошибки по неизвестным датчикам,
+        число повторов event_key).
+
+        sensors_map обычно берётся из sensor_id_cache, и датчик могли удалить, пока он
+        там числится. Тогда запись упирается во внешний ключ: пачка откатывается до
+        точки сохранения, удалённые датчики убираются из кэша, а их события пропускаются
+        как события неизвестных датчиков.
+        """
+        try:
+            with checked_transaction():
+                rows_to_create, missing_sensor_errors, duplicates = EventService.select_events(
+                    validated_data, sensors_map
+                )
+                if rows_to_create:
+                    created_at = timezone.now()
+                    if EventService.can_copy(len(rows_to_create)):
+                        # COPY и сводка датчиков работают по столбцам, порция собирается в них один раз
+                        rows_to_create = EventColumns.from_rows(rows_to_create)
+                    EventService.insert_events(rows_to_create, created_at)
+                    if states is None:
+                        SensorStateService.apply_events(rows_to_create, created_at)
+        except IntegrityError as e:
+            if not is_foreign_key_violation(e):
+                raise
+            deleted_ids = set(sensors_map) - set(
+                Sensor.objects.filter(id__in=list(sensors_map)).values_list('id', flat=True)
+            )
+            if not deleted_ids:
+                raise
+            sensor_id_cache.discard(deleted_ids)
+            return EventService.bulk_create_events(validated_data, set(sensors_map) - deleted_ids, states)
+
+        if len(rows_to_create):
+            # отложенная сводка пополняется только после проверки внешних ключей, откат её не вернёт
+            if states is not None:
+                states.add(rows_to_create, created_at)
+            ResponseCache.invalidate()
+        return len(rows_to_create), missing_sensor_errors, duplicates
+
+    @staticmethod
+    def select_events(validated_data, sensors_map):
+        """События известных датчиков без повторов event_key: (события, ошибки, число повторов)"""
+        rows_to_create = []
+        missing_sensor_errors = []
+        for row in validated_data:
+            sensor_id = row['sensor_id']
+            if sensor_id in sensors_map:
+                rows_to_create.append(row)
+            else:
+                missing_sensor_errors.append(f"Датчик ID {sensor_id} не существует. Событие '{row['name']}' пропущено.")
+
+        rows_to_create, duplicates = EventService.deduplicate(rows_to_create)
+        return rows_to_create, missing_sensor_errors, duplicates
+
+    @staticmethod
+    def insert_events(events, created_at):
+        if isinstance(events, EventColumns):
+            EventService.copy_events(events, created_at)
+            return
+        Event.objects.bulk_create(
+            [
+                Event(
+                    sensor_id=row['sensor_id'],
+                    name=row['name'],
+                    temperature=row['temperature'],
+                    humidity=row['humidity'],
+                )
+                for row in events
+            ],
+            batch_size=100,
+        )
+
+    @staticmethod
+    def deduplicate(events):
+        """Отбрасывает повторы event_key внутри пачки и записанные ранее: (события, число повторов).
+
+        Ключи занимаются в EventKey в той же транзакции, что и запись событий, поэтому
+        параллельная загрузка тех же ключей дождётся её коммита и получит повторы.
+        """
+        sensor_ids = [row['sensor_id'] for row in events]
+        keys = [row.get('event_key') for row in events]
+        if keys.count(None) == len(keys):
+            return events, 0
+
+        # обход с конца оставляет для каждой пары номер её первого вхождения
+        pairs = list(enumerate(zip(sensor_ids, keys, strict=True)))
+        first_index = {pair: index for index, pair in reversed(pairs) if pair[1] is not None}
+        claimed = {first_index[pair] for pair in EventService.claim_keys(list(first_index))}
+        keep = [key is None or index in claimed for index, key in enumerate(keys)]
+        duplicates = keep.count(False)
+        if not duplicates:
+            return events, 0
+        return [row for row, kept in zip(events, keep, strict=True) if kept], duplicates
+
+    @staticmethod
+    def claim_keys(pairs):
+        """Записывает пары (sensor_id, event_key) и возвращает те, что раньше не встречались"""
+        table = connection.ops.quote_name(EventKey._meta.db_table)
+        sql = (
+            f'INSERT INTO {table} (sensor_id, key, created_at) '
+            f'SELECT sensor_id, key, %s FROM unnest(%s::bigint[], %s::text[]) AS pair (sensor_id, key) '
+            f'ON CONFLICT (sensor_id, key) DO NOTHING RETURNING sensor_id, key'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [timezone.now(), [pair[0] for pair in pairs], [pair[1] for pair in pairs]])
+            return set(map(tuple, cursor.fetchall()))
+
+    @staticmethod
+    def can_copy(rows_count):
+        return (
+            connection.vendor == 'postgresql'
+            and not is_psycopg3
+            and settings.EVENTS_COPY_MIN_BATCH is not None
+            and rows_count >= settings.EVENTS_COPY_MIN_BATCH
+        )
+
+    @staticmethod
+    def copy_events(rows, created_at=None):
+        """Вставка событий одним COPY FROM STDIN вместо INSERT по пачкам.
+
+        Текст COPY не собирается заранее: блоки строк форматируются из столбцов по мере того,
+        как psycopg2 их читает и отправляет.
+        """
+        if not isinstance(rows, EventColumns):
+            rows = EventColumns.from_rows(rows)
+        created_at = (created_at or timezone.now()).isoformat()
+        columns = ', '.join(
+            connection.ops.quote_name(Event._meta.get_field(name).column) for name in EventService.COPY_FIELDS
+        )
+        sql = f'COPY {connection.ops.quote_name(Event._meta.db_table)} ({columns}) FROM STDIN'
+
+        with connection.cursor() as cursor, connection.wrap_database_errors:
+            cursor.copy_expert(sql, _CopyReader(rows, created_at))
+        return len(rows)
+
+
+class _CopyReader:
+    """Файл для copy_expert, который отдаёт текст COPY блоками по EventService.COPY_WRITE_ROWS строк"""
+
+    def __init__(self, rows, created_at):
+        step = EventService.COPY_WRITE_ROWS
+        self.blocks = (_copy_lines(rows[start : start + step], created_at) for start in range(0, len(rows), step))
+
+    def read(self, size=-1):
+        # psycopg2 отправляет столько, сколько вернул read, поэтому блок не режется по size
+        return next(self.blocks, '')
+
+
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _copy_lines(columns, created_at):
+    """Текст COPY для пачки событий, каждый столбец форматируется целиком"""
+    return ''.join(
+        map(
+            '\t'.join,
+            zip(
+                map(str, columns.sensor_id.tolist()),
+                _copy_texts(columns.name.tolist()),
+                _copy_numbers(columns.temperature, columns.temperature_null),
+                _copy_numbers(columns.humidity, columns.humidity_null),
+                repeat(f'{created_at}\n'),
+            ),
+        )
+    )
+
+
+def _copy_texts(values):
+    # спецсимволы в именах редки: проверяем весь блок разом и экранируем только при необходимости
+    joined = ''.join(values)
+    if any(char in joined for char in '\\\t\n\r'):
+        return [value.translate(_COPY_ESCAPES) for value in values]
+    return values
+
+
+def _copy_numbers(values, null):
+    texts = list(map(repr, values.tolist()))
+    for idx in np.flatnonzero(null).tolist():
+        texts[idx] = '\\N'
+    return texts
+
+
+class SensorStateService:
+    STATE_FIELDS = (
+        'event_count',
+        'first_seen',
+        'last_seen',
+        'last_temperature',
+        'last_humidity',
+        'temperature_min',
+        'temperature_max',
+        'humidity_min',
+        'humidity_max',
+    )
+    # сколько датчиков обновляется одним INSERT ... ON CONFLICT
+    UPSERT_BATCH_SIZE = 1000
+
+    @staticmethod
+    def apply_events(events, created_at):
+        """Добавляет в сводку датчиков пачку только что записанных событий.
+
+        Агрегаты по пачке считаются по столбцам и сливаются с сохранёнными одним
+        INSERT ... ON CONFLICT DO UPDATE, без чтения таблицы событий.
+        """
+        SensorStateService.write(SensorStateService.deltas(events, created_at))
+
+    @staticmethod
+    def deltas(events, created_at):
+        """Строки сводки (sensor_id, *STATE_FIELDS) по пачке событий, по возрастанию sensor_id"""
+        if not isinstance(events, EventColumns):
+            events = EventColumns.from_rows(events)
+        if not len(events):
+            return []
+
+        sensor_ids, groups = np.unique(events.sensor_id, return_inverse=True)
+        columns = {'event_count': np.bincount(groups)}
+        for field in ('temperature', 'humidity'):
+            values = getattr(events, field)
+            present = ~getattr(events, f'{field}_null')
+            minimum = np.full(len(sensor_ids), np.nan)
+            maximum = np.full(len(sensor_ids), np.nan)
+            # fmin/fmax пропускают NaN, которым помечены пустые значения
+            np.fmin.at(minimum, groups, values)
+            np.fmax.at(maximum, groups, values)
+            last_idx = np.full(len(sensor_ids), -1)
+            np.maximum.at(last_idx, groups[present], np.flatnonzero(present))
+            columns[f'last_{field}'] = np.where(last_idx >= 0, values[last_idx], np.nan)
+            columns[f'{field}_min'] = minimum
+            columns[f'{field}_max'] = maximum
+
+        return [
+            (sensor_id, count, created_at, created_at, *(None if np.isnan(value) else value for value in stats))
+            for sensor_id, count, *stats in zip(
+                sensor_ids.tolist(),
+                columns['event_count'].tolist(),
+                columns['last_temperature'].tolist(),
+                columns['last_humidity'].tolist(),
+                columns['temperature_min'].tolist(),
+                columns['temperature_max'].tolist(),
+                columns['humidity_min'].tolist(),
+                columns['humidity_max'].tolist(),
+                strict=True,
+            )
+        ]
+
+    @staticmethod
+    def write(rows):
+        """Сливает строки сводки с сохранёнными. Строки блокируются по возрастанию sensor_id,
+        поэтому параллельные записи одних и тех же датчиков не блокируют друг друга по кругу
+        """
+        rows = sorted(rows, key=itemgetter(0))
+        for start in range(0, len(rows), SensorStateService.UPSERT_BATCH_SIZE):
+            SensorStateService._upsert(rows[start : start + SensorStateService.UPSERT_BATCH_SIZE])
+
+    @staticmethod
+    def merge(old, new):
+        """Одна строка сводки из двух, как ON CONFLICT в _upsert; new - более поздние события"""
+        sensor_id, count, first_seen, last_seen, *values = new
+        _, old_count, old_first_seen, old_last_seen, *old_values = old
+        last = [
+            value if value is not None else old_value
+            for value, old_value in zip(values[:2], old_values[:2], strict=False)
+        ]
+        limits = [
+            pick((value for value in pair if value is not None), default=None)
+            for pick, pair in zip((min, max, min, max), zip(old_values[2:], values[2:], strict=True), strict=True)
+        ]
+        return (
+            sensor_id,
+            old_count + count,
+            min(old_first_seen, first_seen),
+            max(old_last_seen, last_seen),
+            *last,
+            *limits,
+        )
+
+    @staticmethod
+    def apply_event(event):
+        SensorStateService.apply_events(
+            [
+                {
+                    'sensor_id': event.sensor_id,
+                    'name': event.name,
+                    'temperature': event.temperature,
+                    'humidity': event.humidity,
+                }
+            ],
+            event.created_at,
+        )
+
+    @staticmethod
+    def _upsert(rows):
+        table = connection.ops.quote_name(SensorState._meta.db_table)
+        names = ('sensor_id', *SensorStateService.STATE_FIELDS)
+        columns = ', '.join(connection.ops.quote_name(name) for name in names)
+        placeholders = ', '.join([f'({", ".join(["%s"] * len(names))})'] * len(rows))
+        updates = {
+            'event_count': f'{table}.event_count + EXCLUDED.event_count',
+            'first_seen': f'LEAST({table}.first_seen, EXCLUDED.first_seen)',
+            'last_seen': f'GREATEST({table}.last_seen, EXCLUDED.last_seen)',
+            'last_temperature': f'COALESCE(EXCLUDED.last_temperature, {table}.last_temperature)',
+            'last_humidity': f'COALESCE(EXCLUDED.last_humidity, {table}.last_humidity)',
+            'temperature_min': f'LEAST({table}.temperature_min, EXCLUDED.temperature_min)',
+            'temperature_max': f'GREATEST({table}.temperature_max, EXCLUDED.temperature_max)',
+            'humidity_min': f'LEAST({table}.humidity_min, EXCLUDED.humidity_min)',
+            'humidity_max': f'GREATEST({table}.humidity_max, EXCLUDED.humidity_max)',
+        }
+        sql = (
+            f'INSERT INTO {table} ({columns}) VALUES {placeholders} '
+            f'ON CONFLICT (sensor_id) DO UPDATE SET {", ".join(f"{name} = {value}" for name, value in updates.items())}'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [value for row in rows for value in row])
+
+    @staticmethod
+    @transaction.atomic
+    def rebuild(sensor_ids):
+        """Пересчитывает сводку датчиков по событиям и EventRollup - после изменения или удаления событий"""
+        sensor_ids = set(sensor_ids)
+        events = (
+            Event.objects.filter(sensor_id__in=sensor_ids)
+            .order_by()
+            .values('sensor_id')
+            .annotate(
+                event_count=Count('id'),
+                first_seen=Min('created_at'),
+                last_seen=Max('created_at'),
+                last_temperature=_last_value('temperature'),
+                last_humidity=_last_value('humidity'),
+                temperature_min=Min('temperature'),
+                temperature_max=Max('temperature'),
+                humidity_min=Min('humidity'),
+                humidity_max=Max('humidity'),
+            )
+        )
+        rollups = (
+            EventRollup.objects.filter(sensor_id__in=sensor_ids)
+            .order_by()
+            .values('sensor_id')
+            .annotate(
+                event_count=Sum('count'),
+                first_seen=Min('first_at'),
+                last_seen=Max('last_at'),
+                last_temperature=_last_value('temperature_last', order_by=('-temperature_last_at',)),
+                last_humidity=_last_value('humidity_last', order_by=('-humidity_last_at',)),
+                temperature_min=Min('temperature_min'),
+                temperature_max=Max('temperature_max'),
+                humidity_min=Min('humidity_min'),
+                humidity_max=Max('humidity_max'),
+            )
+        )
+        states = {row['sensor_id']: row for row in rollups}
+        for row in events:
+            old = states.get(row['sensor_id'])
+            states[row['sensor_id']] = row if old is None else SensorStateService._combine(old, row)
+        SensorState.objects.filter(sensor_id__in=sensor_ids).delete()
+        SensorState.objects.bulk_create([SensorState(**row) for row in states.values()])
+
+    @staticmethod
+    def _combine(old, new):
+        """Сводка по двум наборам событий, где new - более поздние"""
+        combined = {'sensor_id': new['sensor_id'], 'event_count': old['event_count'] + new['event_count']}
+        for name, pick in (
+            ('first_seen', min),
+            ('last_seen', max),
+            ('temperature_min', min),
+            ('temperature_max', max),
+            ('humidity_min', min),
+            ('humidity_max', max),
+        ):
+            combined[name] = pick((value for value in (old[name], new[name]) if value is not None), default=None)
+        for name in ('last_temperature', 'last_humidity'):
+            combined[name] = new[name] if new[name] is not None else old[name]
+        return combined
+
+
+class _FirstElement(Func):
+    template = '(%(expressions)s)[1]'
+    output_field = FloatField()
+
+
+def _last_value(field, order_by=('-created_at', '-id')):
+    """Последнее непустое значение поля среди строк группы"""
+    return _FirstElement(ArrayAgg(field, filter=Q(**{f'{field}__isnull': False}), order_by=order_by))
+
+
+class PendingSensorStates:
+    """Изменения сводки датчиков за загрузку в одной транзакции, записываются в её конце.
+
+    Если обновлять SensorState после каждой порции, строки сводки остаются заблокированными
+    до конца всей загрузки: параллельные загрузки тех же датчиков ждут друг друга, а при
+    разном порядке датчиков в порциях получают взаимоблокировку. apply() пишет все строки
+    разом и по возрастанию sensor_id, перед самым коммитом.
+    """
+
+    def __init__(self):
+        self.rows = dict[int, tuple]()
+
+    def add(self, events, created_at):
+        for row in SensorStateService.deltas(events, created_at):
+            old = self.rows.get(row[0])
+            self.rows[row[0]] = row if old is None else SensorStateService.merge(old, row)
+
+    def apply(self):
+        SensorStateService.write(self.rows.values())
+        self.rows.clear()
+
+
+class EventAggregationService:
+    BUCKETS = ('minute', 'hour', 'day')
+    FIELDS = ('temperature', 'humidity')
+
+    @staticmethod
+    def aggregate(queryset, bucket, rollups=None):
+        """Count/min/max/avg/last по временным интервалам, считается одним запросом в БД.
+
+        С rollups (queryset EventRollup) к событиям добавляются свёрнутые старые события.
+        Их интервалы не мельче EVENTS_ROLLUP_INTERVAL: при более мелком bucket каждый
+        агрегат попадает в интервал, с которого начинается.
+        """
+        aggregates = {'count': Count('id')}
+        for field in EventAggregationService.FIELDS:
+            aggregates[f'{field}_count'] = Count(field)
+            aggregates[f'{field}_min'] = Min(field)
+            aggregates[f'{field}_max'] = Max(field)
+            aggregates[f'{field}_avg'] = Avg(field)
+            aggregates[f'{field}_last'] = _last_value(field)
+        buckets = (
+            queryset.order_by()
+            .annotate(bucket=Trunc('created_at', bucket))
+            .values('bucket')
+            .annotate(**aggregates)
+            .order_by('bucket')
+        )
+        if rollups is None:
+            return buckets
+        return EventAggregationService._merge(EventAggregationService.aggregate_rollups(rollups, bucket), buckets)
+
+    @staticmethod
+    def aggregate_rollups(rollups, bucket):
+        """Те же агрегаты по интервалам из EventRollup"""
+        aggregates = {'count': Sum('count')}
+        for field in EventAggregationService.FIELDS:
+            aggregates[f'{field}_count'] = Sum(f'{field}_count')
+            aggregates[f'{field}_sum'] = Sum(f'{field}_sum')
+            aggregates[f'{field}_min'] = Min(f'{field}_min')
+            aggregates[f'{field}_max'] = Max(f'{field}_max')
+            aggregates[f'{field}_last'] = _last_value(f'{field}_last', order_by=(f'-{field}_last_at',))
+        rows = (
+            rollups.order_by()
+            .annotate(interval=Trunc('bucket', bucket))
+            .values('interval')
+            .annotate(**aggregates)
+            .order_by('interval')
+        )
+        return [
             {
-                'sensor_id': sensor_id,
-                'name': name_str,
-                'temperature': temperature,
-                'humidity': humidity,
+                'bucket': row['interval'],
+                **row,
+                **{
+                    f'{field}_avg': row[f'{field}_sum'] / row[f'{field}_count'] if row[f'{field}_count'] else None
+                    for field in EventAggregationService.FIELDS
+                },
             }
+            for row in rows
+        ]
+
+    @staticmethod
+    def _merge(rolled, buckets):
+        """Сливает агрегаты свёрнутых и сырых событий по интервалам; сырые события всегда новее"""
+        merged = {row['bucket']: row for row in rolled}
+        for row in buckets:
+            old = merged.get(row['bucket'])
+            if old is None:
+                merged[row['bucket']] = row
+                continue
+            combined = {'bucket': row['bucket'], 'count': old['count'] + row['count']}
+            for field in EventAggregationService.FIELDS:
+                old_count, new_count = old[f'{field}_count'], row[f'{field}_count']
+                count = old_count + new_count
+                values = [value for value in (old[f'{field}_min'], row[f'{field}_min']) if value is not None]
+                combined[f'{field}_count'] = count
+                combined[f'{field}_min'] = min(values, default=None)
+                values = [value for value in (old[f'{field}_max'], row[f'{field}_max']) if value is not None]
+                combined[f'{field}_max'] = max(values, default=None)
+                combined[f'{field}_avg'] = (
+                    ((old[f'{field}_avg'] or 0) * old_count + (row[f'{field}_avg'] or 0) * new_count) / count
+                    if count
+                    else None
+                )
+                last = row[f'{field}_last']
+                combined[f'{field}_last'] = last if last is not None else old[f'{field}_last']
+            merged[row['bucket']] = combined
+        return [merged[key] for key in sorted(merged)]
+
+
+class EventLoader:
+    """Загрузка событий из JSON файла порциями фиксированного размера.
+
+    По умолчанию весь файл грузится в одной транзакции. С atomic=False каждая порция
+    коммитится отдельно, а on_progress вызывается внутри её транзакции - так фоновые
+    задачи видят прогресс, согласованный с уже записанными событиями. С auto_create_sensors
+    недостающие датчики создаются с типом EVENTS_AUTO_CREATE_SENSOR_TYPE, а не пропускаются.
+    """
+
+    def __init__(self, chunk_size=None, atomic=True, on_progress=None, auto_create_sensors=False, offset=0):
+        self.chunk_size = chunk_size or settings.EVENTS_LOAD_CHUNK_SIZE
+        # сколько элементов файла предшествует загружаемым - для номеров #idx в ошибках
+        self.offset = offset
+        self.atomic = atomic
+        self.on_progress = on_progress
+        self.auto_create_sensors = auto_create_sensors
+        # соединение для создания датчиков, одно на всю загрузку
+        self.sensor_connection = None
+        # в общей транзакции сводка датчиков пишется один раз в конце, а не после каждой порции
+        self.pending_states = PendingSensorStates() if atomic else None
+        self.sensors_created = 0
+        self.duplicates = 0
+        self.total_input = 0
+        self.valid_events = 0
+        self.created = 0
+        self.parse_errors = []
+        self.sensor_errors = []
+
+    @property
+    def rows_failed(self):
+        return len(self.parse_errors) + len(self.sensor_errors)
+
+    def load_json_file(self, file):
+        return self.load_items(EventDataParser.iter_json_array(file))
+
+    def load_ndjson_file(self, file):
+        return self.load_items(EventDataParser.iter_ndjson(file))
+
+    @property
+    def position(self):
+        """Сколько первых элементов файла обработано - с этого места загрузку можно продолжить"""
+        return self.offset + self.total_input
+
+    def load_path(self, path, ndjson=False, skip=0):
+        """Загрузка файла с диска (.gz распаковывается), первые skip элементов пропускаются"""
+        self.offset = skip
+        with EventDataParser.open_path(path) as file:
+            items = EventDataParser.iter_ndjson(file) if ndjson else EventDataParser.iter_json_array(file)
+            return self.load_items(islice(items, skip, None))
+
+    def load_items(self, items):
+        with SensorService.side_connection() if self.auto_create_sensors else nullcontext() as sensor_connection:
+            self.sensor_connection = sensor_connection
+            try:
+                with transaction.atomic() if self.atomic else nullcontext():
+                    self._load(items)
+                    if self.pending_states is not None:
+                        self.pending_states.apply()
+            finally:
+                self.sensor_connection = None
+        return self.result()
+
+    def _load(self, items):
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= self.chunk_size:
+                self._flush(chunk)
+                chunk = []
+        if chunk:
+            self._flush(chunk)
+
+    def _flush(self, raw_events):
+        events, errors = EventDataValidator.validate_events(raw_events, start=self.offset + self.total_input + 1)
+        self.total_input += len(raw_events)
+        self.parse_errors.extend(errors)
+        with transaction.atomic():
+            if events:
+                self.valid_events += len(events)
+                sensor_ids = {event['sensor_id'] for event in events}
+                if self.auto_create_sensors:
+                    existing_ids = self._create_sensors(sensor_ids)
+                else:
+                    existing_ids = sensor_id_cache.existing(sensor_ids)
+                created_count, sensor_errors, duplicates = EventService.bulk_create_events(
+                    events, existing_ids, self.pending_states
+                )
+                self.created += created_count
+                self.duplicates += duplicates
+                self.sensor_errors.extend(sensor_errors)
+            if self.on_progress:
+                self.on_progress(self)
+
+    def _create_sensors(self, sensor_ids):
+        created_ids = SensorService.get_or_create_sensors(
+            sensor_ids, settings.EVENTS_AUTO_CREATE_SENSOR_TYPE, self.sensor_connection
         )
-    return result, errors
+        self.sensors_created += len(created_ids)
+        return set(sensor_ids)
+
+    def result(self):
+        return {
+            'total_input': self.total_input,
+            'valid_events': self.valid_events,
+            'created': self.created,
+            'sensors_created': self.sensors_created,
+            'duplicates': self.duplicates,
+            'skipped_events_to_missing_sensor': len(self.sensor_errors),
+            'parse_errors': len(self.parse_errors),
+            'error_details': self.parse_errors + self.sensor_errors,
+        }
+
+
+@contextmanager
+def checked_transaction():
+    """transaction.atomic(), в конце которого проверены внешние ключи.
+
+    Django создаёт внешние ключи отложенными до коммита, поэтому в точке сохранения
+    внутри внешней транзакции они проверяются явно, иначе ошибка всплыла бы только при
+    коммите всей транзакции.
+    """
+    nested = connection.in_atomic_block
+    with transaction.atomic():
+        yield
+        if nested:
+            connection.check_constraints()
+
+
+def is_foreign_key_violation(error):
+    return isinstance(error.__cause__, errors.ForeignKeyViolation)
+
+
+def parse_json_events(data):
+    return EventDataValidator.validate_events(data)
@@ -55,3 +55,14 @@ def valid_events_json():
 def invalid_events_json():
     """Невалидный JSON файл"""
     return SimpleUploadedFile('events.json', b'invalid json content', content_type='application/json')
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Кэши ответов и ID датчиков в памяти процесса не должны переживать тест"""
+    from django.core.cache import cache
+
+    from sensors.app.cache import sensor_id_cache
+
+    cache.clear()
+    sensor_id_cache.clear()
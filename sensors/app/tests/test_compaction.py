@@ -0,0 +1,118 @@
+import io
+
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from sensors.app.compaction import EventCompactionService
+from sensors.app.models import Event, EventRollup, SensorState
+from sensors.app.services import EventService, SensorStateService
+
+
+NOW = datetime(2026, 3, 1, tzinfo=UTC)
+
+
+@pytest.mark.django_db
+class TestEventCompaction:
+    @pytest.fixture
+    def events(self, sensor, sensor_2):
+        rows = [
+            (sensor, '2026-01-01T10:05', 10.0, 50.0),
+            (sensor, '2026-01-01T10:40', 20.0, None),
+            (sensor, '2026-01-01T11:10', 30.0, 70.0),
+            (sensor, '2026-01-02T09:00', None, 60.0),
+            (sensor_2, '2026-01-01T10:20', 40.0, 10.0),
+            (sensor, '2026-02-28T12:00', 25.0, 40.0),
+        ]
+        EventService.bulk_create_events(
+            [
+                {'sensor_id': owner.id, 'name': created_at, 'temperature': temperature, 'humidity': humidity}
+                for owner, created_at, temperature, humidity in rows
+            ],
+            {sensor.id, sensor_2.id},
+        )
+        for event in Event.objects.all():
+            Event.objects.filter(id=event.id).update(created_at=f'{event.name}Z')
+
+    def aggregates(self, api_client, url, **params):
+        response = api_client.get(url, params)
+        assert response.status_code == 200
+        return response.data
+
+    @pytest.mark.parametrize('batch_size', [None, 1, 2])
+    def test_rolls_up_old_events(self, sensor, events, batch_size):
+        compacted, _ = EventCompactionService.compact(timedelta(days=30), batch_size=batch_size, now=NOW)
+
+        assert compacted == 5
+        assert EventRollup.objects.count() == 4
+        assert list(Event.objects.values_list('name', flat=True)) == ['2026-02-28T12:00']
+        rollup = EventRollup.objects.get(sensor=sensor, bucket=datetime(2026, 1, 1, 10, tzinfo=UTC))
+        assert rollup.count == 2
+        assert rollup.first_at == datetime(2026, 1, 1, 10, 5, tzinfo=UTC)
+        assert rollup.last_at == datetime(2026, 1, 1, 10, 40, tzinfo=UTC)
+        assert (rollup.temperature_count, rollup.temperature_sum, rollup.temperature_last) == (2, 30.0, 20.0)
+        assert (rollup.temperature_min, rollup.temperature_max) == (10.0, 20.0)
+        assert (rollup.humidity_count, rollup.humidity_sum, rollup.humidity_last) == (1, 50.0, 50.0)
+        assert rollup.humidity_last_at == datetime(2026, 1, 1, 10, 5, tzinfo=UTC)
+        # сводка датчика уже учитывает свёрнутые события
+        assert SensorState.objects.get(sensor=sensor).event_count == 5
+
+    @pytest.mark.parametrize('bucket', ['hour', 'day'])
+    def test_aggregates_do_not_change(self, api_client, sensor, events, bucket):
+        urls = [reverse('events-aggregate'), reverse('sensors-aggregate', kwargs={'pk': sensor.id})]
+        before = [self.aggregates(api_client, url, bucket=bucket) for url in urls]
+
+        EventCompactionService.compact(timedelta(days=30), now=NOW)
+
+        assert [self.aggregates(api_client, url, bucket=bucket) for url in urls] == before
+
+    def test_day_bucket_merges_rollups_and_raw_events(self, api_client, sensor, events):
+        url = reverse('sensors-aggregate', kwargs={'pk': sensor.id})
+        before = self.aggregates(api_client, url, bucket='day')
+
+        # 1 января до 11:00 свёрнуто, событие 11:10 осталось сырым
+        EventCompactionService.compact(timedelta(days=30), now=datetime(2026, 1, 31, 11, 5, tzinfo=UTC))
+
+        assert Event.objects.filter(sensor=sensor).count() == 3
+        assert self.aggregates(api_client, url, bucket='day') == before
+
+    def test_time_filters_apply_to_rollups(self, api_client, events):
+        EventCompactionService.compact(timedelta(days=30), now=NOW)
+        url = reverse('events-aggregate')
+
+        data = self.aggregates(
+            api_client, url, bucket='day', created_after='2026-01-01T11:00:00Z', created_before='2026-02-01T00:00:00Z'
+        )
+
+        assert [(row['bucket'], row['count']) for row in data] == [
+            ('2026-01-01T00:00:00Z', 1),
+            ('2026-01-02T00:00:00Z', 1),
+        ]
+
+    def test_value_filters_skip_rollups(self, api_client, events):
+        EventCompactionService.compact(timedelta(days=30), now=NOW)
+
+        data = self.aggregates(api_client, reverse('events-aggregate'), bucket='day', temperature_min=0)
+
+        assert [(row['bucket'], row['count']) for row in data] == [('2026-02-28T00:00:00Z', 1)]
+
+    def test_rebuild_keeps_compacted_events(self, sensor, events):
+        before = SensorState.objects.filter(sensor=sensor).values().get()
+        EventCompactionService.compact(timedelta(days=30), now=NOW)
+
+        SensorStateService.rebuild([sensor.id])
+
+        after = SensorState.objects.filter(sensor=sensor).values().get()
+        assert after['event_count'] == 5
+        assert after['first_seen'] == datetime(2026, 1, 1, 10, 5, tzinfo=UTC)
+        assert (after['temperature_min'], after['temperature_max']) == (before['temperature_min'], 30.0)
+        assert after['last_temperature'] == 25.0
+
+    def test_command(self, events):
+        out = io.StringIO()
+        call_command('compact_events', '--older-than-days', '1', '--batch-size', '2', stdout=out)
+
+        assert 'Свёрнуто событий: 6' in out.getvalue()
+        assert not Event.objects.exists()
+        assert EventRollup.objects.count() == 5
@@ -0,0 +1,119 @@
+import gzip
+import io
+
+from datetime import UTC, datetime
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from sensors.app.filters import EventFilter
+from sensors.app.models import Event, EventKey, SensorState
+from sensors.app.partitions import EventPartitionService
+from sensors.app.services import EventService
+
+
+def at(year, month, day=15):
+    return datetime(year, month, day, tzinfo=UTC)
+
+
+@pytest.mark.django_db
+class TestEventPartitions:
+    def partition_of(self, event):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT tableoid::regclass::text FROM app_event WHERE id = %s', [event.id])
+            return cursor.fetchone()[0]
+
+    def test_migration_partitions_events(self):
+        assert EventPartitionService.is_partitioned()
+        assert EventPartitionService.partitions()
+
+    def test_maintain_creates_partitions_and_moves_default_rows(self, event):
+        Event.objects.filter(id=event.id).update(created_at=at(2030, 2))
+        event.refresh_from_db()
+        assert self.partition_of(event) == 'app_event_default'
+
+        created, dropped = EventPartitionService.maintain(ahead_months=2, now=at(2030, 1))
+
+        assert created == ['app_event_p2030_01', 'app_event_p2030_02', 'app_event_p2030_03']
+        assert dropped == []
+        assert self.partition_of(event) == 'app_event_p2030_02'
+        assert EventPartitionService.maintain(ahead_months=2, now=at(2030, 1)) == ([], [])
+
+    def test_retention_drops_and_archives_old_partitions(self, sensor, settings, tmp_path):
+        settings.EVENTS_COPY_MIN_BATCH = None
+        EventPartitionService.maintain(ahead_months=2, now=at(2030, 1))
+        rows = [{'sensor_id': sensor.id, 'name': f'Event {i}', 'temperature': 20.0, 'humidity': None} for i in range(3)]
+        EventService.bulk_create_events(rows, {sensor.id})
+        Event.objects.filter(name='Event 0').update(created_at=at(2030, 1))
+        Event.objects.filter(name__in=['Event 1', 'Event 2']).update(created_at=at(2030, 3))
+        EventKey.objects.bulk_create([EventKey(sensor=sensor, key='old'), EventKey(sensor=sensor, key='new')])
+        EventKey.objects.filter(key='old').update(created_at=at(2030, 1))
+        EventKey.objects.filter(key='new').update(created_at=at(2030, 3))
+        # отложенные проверки FK от переноса строк не дают удалить партицию в той же транзакции
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+        EventPartitionService.maintain(ahead_months=0, retention_months=1, archive_dir=str(tmp_path), now=at(2030, 3))
+
+        assert list(Event.objects.order_by('name').values_list('name', flat=True)) == ['Event 1', 'Event 2']
+        assert SensorState.objects.get(sensor=sensor).event_count == 2
+        assert list(EventKey.objects.values_list('key', flat=True)) == ['new']
+        with gzip.open(tmp_path / 'app_event_p2030_01.csv.gz', 'rt') as archive:
+            lines = archive.read().splitlines()
+        assert len(lines) == 2 and 'Event 0' in lines[1]
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('event_partitions', ahead=24, stdout=out)
+        assert 'Создана партиция' in out.getvalue()
+
+        out = io.StringIO()
+        call_command('event_partitions', ahead=24, stdout=out)
+        assert out.getvalue().strip() == 'Партиции в актуальном состоянии'
+
+    def test_time_range_filter_prunes_partitions(self):
+        EventPartitionService.maintain(ahead_months=2, now=at(2030, 1))
+        filterset = EventFilter(
+            {'created_after': '2030-02-01T00:00:00Z', 'created_before': '2030-03-01T00:00:00Z'},
+            queryset=Event.objects.all(),
+        )
+        plan = filterset.qs.explain()
+        assert 'app_event_p2030_02' in plan
+        assert 'app_event_p2030_01' not in plan
+        assert 'app_event_p2030_03' not in plan
+
+    @pytest.fixture
+    def january(self, sensor, sensor_2):
+        """Январь 2030: 100 тысяч событий sensor_2 каждые 10 секунд и 100 событий sensor"""
+        EventPartitionService.maintain(ahead_months=0, now=at(2030, 1))
+        with connection.cursor() as cursor:
+            for owner, count, step in ((sensor_2, 100_000, '10 seconds'), (sensor, 100, '6 hours')):
+                cursor.execute(
+                    'INSERT INTO app_event (sensor_id, name, temperature, humidity, created_at) '
+                    "SELECT %s, 'Event', 20, 50, %s::timestamptz + n * %s::interval "
+                    'FROM generate_series(1, %s) AS n',
+                    [owner.id, at(2030, 1, 1), step, count],
+                )
+            cursor.execute('ANALYZE app_event')
+
+    def test_brin_index_is_small(self, january):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT indexdef LIKE '%%USING brin%%', pg_relation_size(indexname::regclass) FROM pg_indexes "
+                "WHERE tablename = 'app_event_p2030_01' AND indexdef LIKE '%%(created_at%%'"
+            )
+            sizes = dict(cursor.fetchall())
+        assert sizes[True] * 10 < sizes[False]
+
+    def test_time_window_uses_brin_index(self, january):
+        filterset = EventFilter(
+            {'created_after': '2030-01-03T00:00:00Z', 'created_before': '2030-01-04T00:00:00Z'},
+            queryset=Event.objects.all(),
+        )
+        plan = filterset.qs.order_by().explain()
+        assert 'Bitmap Index Scan on app_event_p2030_01_created_at_idx' in plan
+
+    def test_sensor_events_use_keyset_index(self, sensor, january):
+        plan = sensor.events.order_by('-created_at', '-id')[:20].explain()
+        assert 'Index Scan using app_event_p2030_01_sensor_id_created_at_id_idx' in plan
+        assert 'Sort' not in plan.replace('Sort Key', '')
@@ -0,0 +1,562 @@
+import gzip
+import io
+import json
+import threading
+
+from contextlib import contextmanager
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from sensors.app.exceptions import ParseError
+from sensors.app.models import Event, Sensor, SensorState
+from sensors.app.parallel import ParallelEventLoader
+from sensors.app.services import (
+    EventDataParser,
+    EventDataValidator,
+    EventLoader,
+    EventService,
+    SensorService,
+    SensorStateService,
+)
+
+
+def stream(text):
+    return io.BytesIO(text.encode('utf-8'))
+
+
+class TestIterJsonArray:
+    def test_items_match_json_load(self):
+        data = [{'sensor_id': i, 'name': f'Событие {i}', 'temperature': i / 3} for i in range(200)]
+        text = json.dumps(data, indent=2, ensure_ascii=False)
+        items = list(EventDataParser.iter_json_array(stream(text), read_size=7))
+        assert items == data
+
+    def test_number_split_by_read_boundary(self):
+        items = list(EventDataParser.iter_json_array(stream('[123456789, 2]'), read_size=4))
+        assert items == [123456789, 2]
+
+    @pytest.mark.parametrize('read_size', [1, 2, 3, 5])
+    def test_values_split_at_any_read_size(self, read_size):
+        text = '[12.5, -0.25e-3 , 1E10,\n 7, {"t": 1.5e2}, 3.0 ,100 ]'
+        items = list(EventDataParser.iter_json_array(stream(text), read_size=read_size))
+        assert items == json.loads(text)
+
+    @pytest.mark.parametrize('read_size', [7, 64, 4096])
+    @pytest.mark.parametrize(
+        'tricky',
+        ['"name": "}, {\\"sensor_id\\": 1}, {"', '"sensor_id": 10000000000000000000000', '"temperature": NaN'],
+    )
+    def test_objects_decoded_in_batches_match_json(self, read_size, tricky):
+        # граница объектов внутри строки, целое вне int64 и NaN разбираются запасным путём
+        items = [f'{{"sensor_id": {i}, "name": "Event {i}", "temperature": 1.5}}' for i in range(50)]
+        items[20] = f'{{{tricky}}}'
+        text = f'[{", ".join(items)}]'
+        parsed = list(EventDataParser.iter_json_array(stream(text), read_size=read_size))
+        assert repr(parsed) == repr(json.loads(text))
+
+    def test_empty_array(self):
+        assert list(EventDataParser.iter_json_array(stream(' [ ] '))) == []
+
+    @pytest.mark.parametrize(
+        'text',
+        ['', '  ', 'x', '[', '[1,', '[1 2]', '[1,]', '[1] x', '[{"a": 1}', '[1', '[1,\n  {"a": tru}\n]'],
+    )
+    def test_errors_match_json_load(self, text):
+        with pytest.raises(json.JSONDecodeError) as expected:
+            json.loads(text)
+        with pytest.raises(ParseError) as actual:
+            list(EventDataParser.iter_json_array(stream(text), read_size=2))
+        assert str(actual.value) == f'Невалидный JSON: {expected.value}'
+
+    def test_not_array(self):
+        with pytest.raises(ParseError, match='JSON должен быть массивом'):
+            list(EventDataParser.iter_json_array(stream('{"sensor_id": 1}')))
+
+    def test_file_is_not_closed(self):
+        file = stream('[1]')
+        list(EventDataParser.iter_json_array(file))
+        assert not file.closed
+
+
+class TestEventDataValidator:
+    def test_validate_event_matches_validate_events(self):
+        raw = [
+            {'sensor_id': 1, 'name': 'ok', 'temperature': '25.5'},
+            {'sensor_id': 0, 'name': 'no sensor', 'temperature': 1},
+            'not a dict',
+            {'sensor_id': 2, 'name': 'hot', 'temperature': 500},
+        ]
+        valid, errors = EventDataValidator.validate_events(raw)
+        singles = [EventDataValidator.validate_event(idx, item) for idx, item in enumerate(raw, start=1)]
+        assert valid == [event for event, _ in singles if event]
+        assert errors == [error for _, error in singles if error]
+
+
+@pytest.mark.django_db
+class TestEventLoader:
+    @pytest.mark.parametrize('copy_min_batch', [None, 1])
+    def test_chunked_load_matches_single_pass(self, sensor, settings, copy_min_batch):
+        settings.EVENTS_COPY_MIN_BATCH = copy_min_batch
+        data = [{'sensor_id': sensor.id, 'name': f'Event {i}', 'temperature': 20.0} for i in range(7)]
+        data += [{'sensor_id': 999, 'name': 'Missing', 'temperature': 20.0}, {'name': 'No sensor'}]
+        text = json.dumps(data)
+
+        result = EventLoader(chunk_size=3).load_json_file(stream(text))
+
+        valid, parse_errors = EventDataValidator.validate_events(data)
+        assert result['total_input'] == len(valid) + len(parse_errors) == 9
+        assert result['valid_events'] == len(valid) == 8
+        assert result['created'] == 7
+        assert result['skipped_events_to_missing_sensor'] == 1
+        assert result['parse_errors'] == 1
+        assert result['error_details'][0] == parse_errors[0]
+        assert Event.objects.count() == 7
+
+    def test_parse_error_rolls_back_flushed_chunks(self, sensor):
+        text = json.dumps([{'sensor_id': sensor.id, 'name': 'Event', 'temperature': 20.0}] * 5)[:-1] + ', oops]'
+        with pytest.raises(ParseError):
+            EventLoader(chunk_size=2).load_json_file(stream(text))
+        assert Event.objects.count() == 0
+
+
+# датчики создаются на отдельном соединении и коммитятся мимо транзакции теста
+@pytest.mark.django_db(transaction=True)
+class TestSensorService:
+    def test_creates_only_missing_sensors(self, sensor):
+        created = SensorService.get_or_create_sensors({sensor.id, 500, 501}, Sensor.SensorType.TYPE_2)
+        assert created == {500, 501}
+        assert Sensor.objects.get(id=500).name == 'auto_sensor_500'
+        assert Sensor.objects.get(id=501).sensor_type == Sensor.SensorType.TYPE_2
+        assert SensorService.get_or_create_sensors({500, 501}, Sensor.SensorType.TYPE_2) == set()
+        # последовательность сдвинута за явные ID
+        assert Sensor.objects.create(name='New', sensor_type=Sensor.SensorType.TYPE_1).id > 501
+
+    def test_sequence_only_moves_forward(self):
+        SensorService.get_or_create_sensors({900}, Sensor.SensorType.TYPE_1)
+        SensorService.get_or_create_sensors({500}, Sensor.SensorType.TYPE_1)
+        assert Sensor.objects.create(name='New', sensor_type=Sensor.SensorType.TYPE_1).id > 900
+
+    def test_loader_creates_missing_sensors(self, sensor):
+        data = [
+            {'sensor_id': sensor_id, 'name': 'Event', 'temperature': 20.0} for sensor_id in (sensor.id, 700, 700, 701)
+        ]
+        result = EventLoader(auto_create_sensors=True).load_json_file(stream(json.dumps(data)))
+        assert result['created'] == 4
+        assert result['sensors_created'] == 2
+        assert result['skipped_events_to_missing_sensor'] == 0
+        assert SensorState.objects.get(sensor_id=700).event_count == 2
+
+    def test_loader_reuses_one_connection(self, monkeypatch):
+        opened = []
+        side_connection = SensorService.side_connection
+
+        @contextmanager
+        def tracked():
+            with side_connection() as side:
+                opened.append(side)
+                yield side
+
+        monkeypatch.setattr(SensorService, 'side_connection', tracked)
+        data = [{'sensor_id': sensor_id, 'name': 'Event', 'temperature': 20.0} for sensor_id in range(600, 610)]
+        result = EventLoader(chunk_size=2, auto_create_sensors=True).load_items(data)
+
+        assert result['sensors_created'] == 10
+        assert len(opened) == 1
+        assert opened[0].connection is None
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_loads_create_sensors_once():
+    data = [{'sensor_id': sensor_id, 'name': 'Event', 'temperature': 20.0} for sensor_id in range(900, 950)]
+    barrier = threading.Barrier(4)
+    results = []
+
+    def load():
+        try:
+            barrier.wait()
+            results.append(EventLoader(chunk_size=10, auto_create_sensors=True).load_items(data))
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=load) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [result['created'] for result in results] == [50] * 4
+    assert sum(result['sensors_created'] for result in results) == 50
+    assert Sensor.objects.filter(id__range=(900, 949)).count() == 50
+    assert Event.objects.count() == 200
+
+
+@pytest.mark.django_db(transaction=True)
+def test_overlapping_loads_create_same_new_sensors():
+    # обе загрузки в одной транзакции создают датчики 800 и 801, но в обратном порядке
+    barrier = threading.Barrier(2, timeout=10)
+    results, errors = [], []
+
+    def items(first, second):
+        yield from ({'sensor_id': first, 'name': 'Event', 'temperature': 1.0} for _ in range(2))
+        barrier.wait()
+        yield from ({'sensor_id': second, 'name': 'Event', 'temperature': 2.0} for _ in range(2))
+
+    def load(first, second):
+        try:
+            results.append(EventLoader(chunk_size=2, auto_create_sensors=True).load_items(items(first, second)))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=load, args=(800, 801)), threading.Thread(target=load, args=(801, 800))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert [result['created'] for result in results] == [4, 4]
+    assert sum(result['sensors_created'] for result in results) == 2
+    assert Event.objects.count() == 8
+
+
+@pytest.mark.django_db(transaction=True)
+def test_overlapping_loads_update_states_without_deadlock(sensor, sensor_2):
+    # первая загрузка пишет сначала sensor, потом sensor_2, вторая - наоборот; порции обеих
+    # записаны до того, как любая из них перейдёт ко второму датчику
+    barrier = threading.Barrier(2, timeout=10)
+    results, errors = [], []
+
+    def items(first, second):
+        yield from ({'sensor_id': first.id, 'name': 'Event', 'temperature': 1.0} for _ in range(2))
+        barrier.wait()
+        yield from ({'sensor_id': second.id, 'name': 'Event', 'temperature': 2.0} for _ in range(2))
+
+    def load(first, second):
+        try:
+            results.append(EventLoader(chunk_size=2).load_items(items(first, second)))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    threads = [
+        threading.Thread(target=load, args=(sensor, sensor_2)),
+        threading.Thread(target=load, args=(sensor_2, sensor)),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert [result['created'] for result in results] == [4, 4]
+    states = SensorState.objects.filter(sensor__in=[sensor, sensor_2])
+    assert sorted(states.values_list('event_count', flat=True)) == [4, 4]
+
+
+def test_pending_states_merge_like_upsert():
+    from datetime import UTC, datetime
+
+    first, second = datetime(2026, 1, 1, tzinfo=UTC), datetime(2026, 1, 2, tzinfo=UTC)
+    old = (1, 2, first, first, 20.0, 50.0, 10.0, 20.0, 40.0, 50.0)
+    new = (1, 3, second, second, None, 30.0, 5.0, None, None, 60.0)
+
+    assert SensorStateService.merge(old, new) == (1, 5, first, second, 20.0, 30.0, 5.0, 20.0, 40.0, 60.0)
+
+
+@pytest.mark.django_db
+class TestEventDeduplication:
+    def events(self, sensor, keys):
+        return [
+            {'sensor_id': sensor.id, 'name': f'Event {i}', 'temperature': 20.0, 'humidity': None, 'event_key': key}
+            for i, key in enumerate(keys)
+        ]
+
+    @pytest.mark.parametrize('copy_min_batch', [None, 1])
+    def test_retry_is_deduplicated(self, sensor, settings, copy_min_batch):
+        settings.EVENTS_COPY_MIN_BATCH = copy_min_batch
+        text = json.dumps(self.events(sensor, ['a', 'b', 'a', None, 'c']))
+
+        result = EventLoader(chunk_size=2).load_json_file(stream(text))
+        assert (result['created'], result['duplicates']) == (4, 1)
+
+        retry = EventLoader(chunk_size=2).load_json_file(stream(text))
+        assert (retry['created'], retry['duplicates']) == (1, 4)
+        assert Event.objects.count() == 5
+        assert SensorState.objects.get(sensor=sensor).event_count == 5
+
+    def test_keys_are_per_sensor(self, sensor, sensor_2):
+        events = self.events(sensor, ['a']) + self.events(sensor_2, ['a'])
+        created, _, duplicates = EventService.bulk_create_events(events, {sensor.id, sensor_2.id})
+        assert (created, duplicates) == (2, 0)
+
+    def test_rolled_back_load_releases_keys(self, sensor):
+        text = json.dumps(self.events(sensor, ['a', 'b']))[:-1] + ', oops]'
+        with pytest.raises(ParseError):
+            EventLoader(chunk_size=1).load_json_file(stream(text))
+        result = EventLoader().load_json_file(stream(json.dumps(self.events(sensor, ['a', 'b']))))
+        assert (result['created'], result['duplicates']) == (2, 0)
+
+
+@pytest.mark.django_db(transaction=True)
+class TestParallelEventLoader:
+    @pytest.fixture(autouse=True)
+    def small_tasks(self, monkeypatch):
+        monkeypatch.setattr(ParallelEventLoader, 'RANGE_SIZE', 200)
+        monkeypatch.setattr(ParallelEventLoader, 'TASK_ROWS', 3)
+
+    def events(self, sensor):
+        data = [{'sensor_id': sensor.id, 'name': f'Event {i}', 'temperature': 20.0 + i} for i in range(20)]
+        data[7] = {'sensor_id': 999, 'name': 'Missing', 'humidity': 50.0}
+        data[13] = {'name': 'No sensor'}
+        return data
+
+    def write_ndjson(self, path, data):
+        lines = [json.dumps(item) for item in data]
+        lines[5:5] = ['', '   ']
+        path.write_text('\n'.join(lines) + '\n')
+
+    def test_ndjson_matches_serial_load(self, sensor, tmp_path):
+        path = tmp_path / 'events.ndjson'
+        self.write_ndjson(path, self.events(sensor))
+
+        serial = EventLoader(chunk_size=4, atomic=False).load_path(path, ndjson=True)
+        parallel = ParallelEventLoader(2, chunk_size=4).load_path(path, ndjson=True)
+
+        assert parallel == serial
+        assert parallel['created'] == 18
+        assert parallel['error_details'][0] == '#14: отсутствует поле sensor_id'
+        assert Event.objects.count() == 36
+        assert SensorState.objects.get(sensor=sensor).event_count == 36
+
+    def test_json_matches_serial_load(self, sensor, tmp_path):
+        path = tmp_path / 'events.json'
+        path.write_text(json.dumps(self.events(sensor)))
+
+        serial = EventLoader(chunk_size=4, atomic=False).load_path(path)
+        parallel = ParallelEventLoader(2, chunk_size=4).load_path(path)
+
+        assert parallel == serial
+        assert Event.objects.count() == 36
+
+    def test_parse_error_line_is_global(self, sensor, tmp_path):
+        path = tmp_path / 'events.ndjson'
+        data = self.events(sensor)
+        self.write_ndjson(path, data)
+        with path.open('a') as file:
+            file.write('{"sensor_id": oops}\n')
+
+        with pytest.raises(ParseError) as serial:
+            EventLoader(atomic=False).load_path(path, ndjson=True)
+        with pytest.raises(ParseError) as parallel:
+            ParallelEventLoader(2).load_path(path, ndjson=True)
+        assert str(parallel.value) == str(serial.value)
+        assert f'строка {len(data) + 3}' in str(parallel.value)
+
+    def test_command(self, sensor, tmp_path):
+        path = tmp_path / 'events.ndjson'
+        self.write_ndjson(path, self.events(sensor))
+        out = io.StringIO()
+        call_command(
+            'load_events', str(path), '--workers', '2', '--auto-create-sensors', stdout=out, stderr=io.StringIO()
+        )
+        assert 'записано 19' in out.getvalue()
+        assert Sensor.objects.filter(id=999).exists()
+
+    @pytest.mark.parametrize('name', ['events.ndjson', 'events.ndjson.gz', 'events.json'])
+    def test_skip_matches_serial_load(self, sensor, tmp_path, name):
+        path = tmp_path / name
+        data = self.events(sensor)
+        text = json.dumps(data) if name == 'events.json' else '\n'.join(json.dumps(item) for item in data)
+        path.write_bytes(gzip.compress(text.encode()) if name.endswith('.gz') else text.encode())
+
+        serial = EventLoader(chunk_size=4, atomic=False)
+        serial_result = serial.load_path(path, ndjson='ndjson' in name, skip=9)
+        parallel = ParallelEventLoader(2, chunk_size=4)
+        parallel_result = parallel.load_path(path, ndjson='ndjson' in name, skip=9)
+
+        assert parallel_result == serial_result
+        assert parallel_result['total_input'] == 11
+        assert parallel_result['error_details'] == ['#14: отсутствует поле sensor_id']
+        assert serial.position == parallel.position == 20
+
+
+@pytest.mark.django_db(transaction=True)
+class TestLoadEventsCommand:
+    def events(self, sensor, start, count):
+        return [
+            {'sensor_id': sensor.id, 'name': f'Event {i}', 'temperature': 20.0} for i in range(start, start + count)
+        ]
+
+    def load(self, *args):
+        out = io.StringIO()
+        call_command('load_events', *map(str, args), stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    def test_directory_with_gzip_and_nested_files(self, sensor, tmp_path):
+        (tmp_path / 'nested').mkdir()
+        (tmp_path / 'a.json').write_text(json.dumps(self.events(sensor, 0, 3)))
+        lines = '\n'.join(json.dumps(event) for event in self.events(sensor, 3, 4))
+        (tmp_path / 'nested' / 'b.ndjson.gz').write_bytes(gzip.compress(lines.encode()))
+        (tmp_path / 'notes.txt').write_text('не события')
+
+        out = self.load(tmp_path, '--chunk-size', 2)
+
+        assert 'Итого файлов 2: строк 7, записано 7' in out
+        assert Event.objects.count() == 7
+
+    def test_glob_pattern(self, sensor, tmp_path):
+        for i in range(3):
+            (tmp_path / f'day{i}.json').write_text(json.dumps(self.events(sensor, i * 2, 2)))
+        (tmp_path / 'other.json').write_text(json.dumps(self.events(sensor, 10, 5)))
+
+        self.load(tmp_path / 'day*.json')
+
+        assert Event.objects.count() == 6
+
+    def test_glob_without_matches(self, tmp_path):
+        with pytest.raises(CommandError, match='нет подходящих файлов'):
+            self.load(tmp_path / '*.json')
+
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_checkpoint_resumes_after_failure(self, sensor, tmp_path, monkeypatch, workers):
+        monkeypatch.setattr(ParallelEventLoader, 'RANGE_SIZE', 200)
+        monkeypatch.setattr(ParallelEventLoader, 'MIN_RANGE_SIZE', 200)
+        path = tmp_path / 'events.ndjson'
+        lines = [json.dumps(event) for event in self.events(sensor, 0, 20)]
+        path.write_text('\n'.join([*lines, '{"sensor_id": oops}', '']))
+        checkpoint = tmp_path / 'checkpoint.json'
+        options = ('--checkpoint', checkpoint, '--chunk-size', 4, '--workers', workers)
+
+        with pytest.raises(CommandError, match='строка 21'):
+            self.load(path, *options)
+        entry = json.loads(checkpoint.read_text())[str(path)]
+        assert not entry['done']
+        assert 0 < entry['items'] <= 20
+        assert Event.objects.count() == entry['items']
+
+        # файл исправили - запись контрольной точки к нему больше не относится
+        path.write_text('\n'.join([*lines, '']))
+        self.load(path, *options)
+        assert Event.objects.count() == 20 + entry['items']
+
+    def test_checkpoint_skips_done_and_resumes_position(self, sensor, tmp_path):
+        path = tmp_path / 'events.ndjson'
+        path.write_text('\n'.join(json.dumps(event) for event in self.events(sensor, 0, 10)))
+        checkpoint = tmp_path / 'checkpoint.json'
+        stat = path.stat()
+        entry = {'done': False, 'items': 6, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+        checkpoint.write_text(json.dumps({str(path): entry}))
+
+        out = self.load(path, '--checkpoint', checkpoint)
+
+        assert 'продолжение со строки 7' in out
+        assert list(Event.objects.order_by('id').values_list('name', flat=True)) == [f'Event {i}' for i in range(6, 10)]
+        assert json.loads(checkpoint.read_text())[str(path)]['done']
+        assert 'уже загружен, пропущен' in self.load(path, '--checkpoint', checkpoint)
+        assert Event.objects.count() == 4
+
+
+@pytest.mark.django_db
+class TestEventServiceCopy:
+    def rows(self, sensor, count):
+        return [
+            {'sensor_id': sensor.id, 'name': f'Event\t{i}\\n\n', 'temperature': 20.5, 'humidity': None}
+            for i in range(count)
+        ]
+
+    def test_copy_path_for_big_batches(self, sensor, settings):
+        settings.EVENTS_COPY_MIN_BATCH = 3
+        assert EventService.can_copy(3)
+
+        created, errors, duplicates = EventService.bulk_create_events(self.rows(sensor, 3), {sensor.id})
+
+        assert (created, errors, duplicates) == (3, [], 0)
+        events = list(Event.objects.order_by('id'))
+        assert [event.name for event in events] == [f'Event\t{i}\\n\n' for i in range(3)]
+        assert all(event.temperature == 20.5 and event.humidity is None for event in events)
+        assert all(event.created_at is not None and event.sensor_id == sensor.id for event in events)
+
+    def test_orm_fallback_for_small_batches(self, sensor, settings):
+        settings.EVENTS_COPY_MIN_BATCH = 3
+        assert not EventService.can_copy(2)
+        settings.EVENTS_COPY_MIN_BATCH = None
+        assert not EventService.can_copy(10_000)
+
+        created, _, _ = EventService.bulk_create_events(self.rows(sensor, 2), {sensor.id})
+        assert created == Event.objects.count() == 2
+
+    def test_copy_from_validated_rows(self, sensor, settings):
+        settings.EVENTS_COPY_MIN_BATCH = 1
+        raw = [
+            {'sensor_id': sensor.id, 'name': 'a\\b', 'temperature': 0, 'humidity': 55.5},
+            {'sensor_id': 999, 'name': 'missing', 'temperature': 1.0},
+        ]
+        events, _ = EventDataValidator.validate_events(raw)
+
+        created, errors, _ = EventService.bulk_create_events(events, {sensor.id})
+
+        assert created == 1
+        assert errors == ["Датчик ID 999 не существует. Событие 'missing' пропущено."]
+        event = Event.objects.get()
+        assert (event.name, event.temperature, event.humidity) == ('a\\b', 0.0, 55.5)
+
+    def test_copy_respects_check_constraints(self, sensor, settings):
+        from django.db import IntegrityError
+
+        settings.EVENTS_COPY_MIN_BATCH = 1
+        rows = [{'sensor_id': sensor.id, 'name': 'Hot', 'temperature': 500.0, 'humidity': None}]
+        with pytest.raises(IntegrityError):
+            EventService.bulk_create_events(rows, {sensor.id})
+
+
+@pytest.mark.django_db
+class TestSensorStateService:
+    FIELDS = SensorStateService.STATE_FIELDS
+
+    def state(self, sensor):
+        return SensorState.objects.filter(sensor=sensor).values(*self.FIELDS).get()
+
+    @pytest.mark.parametrize('copy_min_batch', [None, 1])
+    def test_incremental_matches_rebuild(self, sensor, sensor_2, settings, copy_min_batch):
+        settings.EVENTS_COPY_MIN_BATCH = copy_min_batch
+        batches = [
+            [
+                {'sensor_id': sensor.id, 'name': 'a', 'temperature': 10.0, 'humidity': None},
+                {'sensor_id': sensor.id, 'name': 'b', 'temperature': -5.0, 'humidity': 40.0},
+                {'sensor_id': sensor_2.id, 'name': 'c', 'temperature': None, 'humidity': 70.0},
+            ],
+            [
+                {'sensor_id': sensor.id, 'name': 'd', 'temperature': 30.0, 'humidity': None},
+                {'sensor_id': sensor_2.id, 'name': 'e', 'temperature': 1.5, 'humidity': None},
+            ],
+        ]
+        for batch in batches:
+            EventService.bulk_create_events(batch, {sensor.id, sensor_2.id})
+
+        state = self.state(sensor)
+        assert state['event_count'] == 3
+        assert (state['last_temperature'], state['last_humidity']) == (30.0, 40.0)
+        assert (state['temperature_min'], state['temperature_max']) == (-5.0, 30.0)
+        assert (state['humidity_min'], state['humidity_max']) == (40.0, 40.0)
+
+        incremental = [self.state(sensor), self.state(sensor_2)]
+        SensorStateService.rebuild({sensor.id, sensor_2.id})
+        rebuilt = [self.state(sensor), self.state(sensor_2)]
+        for before, after in zip(incremental, rebuilt, strict=True):
+            # время пачки берётся до вставки и может на микросекунды отличаться от created_at
+            for field in ('first_seen', 'last_seen'):
+                assert abs(before.pop(field) - after.pop(field)).total_seconds() < 1
+            assert before == after
+
+    def test_rebuild_drops_state_without_events(self, sensor, event):
+        SensorStateService.rebuild({sensor.id})
+        assert self.state(sensor)['event_count'] == 1
+
+        event.delete()
+        SensorStateService.rebuild({sensor.id})
+        assert not SensorState.objects.filter(sensor=sensor).exists()
@@ -1,5 +1,18 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import threading
+
 import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
 from django.urls import reverse
+from sensors.app import metrics
+from sensors.app.buffer import EventWriteBuffer
+from sensors.app.profiling import explain_query, get_profile_buffer
+from sensors.app.models import Event, Sensor, SensorState
 
 
 @pytest.mark.django_db
@@ -107,3 +120,976 @@ class TestLoadEventsAPIView:
         assert response.status_code == 400
         assert 'skipped_events_to_missing_sensor' in response.data
         assert response.data['skipped_events_to_missing_sensor'] == 2
+
+    def test_load_events_retry_is_idempotent(self, api_client, sensor):
+        url = reverse('load-events')
+        data = [
+            {'sensor_id': sensor.id, 'name': f'Event {i}', 'temperature': 20.0, 'event_key': str(i)} for i in range(3)
+        ]
+
+        def upload():
+            content = json.dumps(data).encode('utf-8')
+            json_file = SimpleUploadedFile('events.json', content, content_type='application/json')
+            return api_client.post(url, {'json_file': json_file}, format='multipart')
+
+        assert upload().status_code == 201
+        response = upload()
+        assert response.status_code == 200
+        assert (response.data['created'], response.data['duplicates']) == (0, 3)
+        assert Event.objects.count() == 3
+
+    @pytest.mark.django_db(transaction=True)
+    def test_load_events_auto_create_sensors(self, api_client, valid_events_json):
+        url = reverse('load-events')
+        data = {'json_file': valid_events_json, 'auto_create_sensors': True}
+        response = api_client.post(url, data, format='multipart')
+        assert response.status_code == 201
+        assert response.data['created'] == 2
+        assert response.data['sensors_created'] == 2
+        assert SensorState.objects.get(sensor_id=1).event_count == 1
+
+    def test_load_events_no_size_limit_by_default(self, api_client, sensor, settings):
+        import json
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        settings.EVENTS_LOAD_CHUNK_SIZE = 100
+        data = [{'sensor_id': sensor.id, 'name': 'x' * 200, 'temperature': 20.0}] * 30000
+        upload = SimpleUploadedFile('events.json', json.dumps(data).encode('utf-8'))
+        assert upload.size > 5 * 1024 * 1024
+
+        url = reverse('load-events')
+        response = api_client.post(url, {'json_file': upload}, format='multipart')
+        assert response.status_code == 201
+        assert response.data['created'] == 30000
+
+    def test_load_events_size_limit(self, api_client, valid_events_json, settings):
+        settings.EVENTS_UPLOAD_MAX_SIZE = 10
+        url = reverse('load-events')
+        response = api_client.post(url, {'json_file': valid_events_json}, format='multipart')
+        assert response.status_code == 400
+        assert response.data['json_file'] == ['Файл слишком большой (макс. 10 байт)']
+
+    @pytest.mark.parametrize('max_size, text', [(1536, '1.5KB'), (5 * 1024 * 1024, '5MB')])
+    def test_load_events_size_limit_message(self, api_client, settings, max_size, text):
+        settings.EVENTS_UPLOAD_MAX_SIZE = max_size
+        upload = SimpleUploadedFile('events.json', b'[' + b' ' * max_size + b']')
+        response = api_client.post(reverse('load-events'), {'json_file': upload}, format='multipart')
+        assert response.data['json_file'] == [f'Файл слишком большой (макс. {text})']
+
+
+@pytest.mark.django_db(transaction=True)
+class TestImportJobs:
+    def upload(self, data):
+        import json
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        return SimpleUploadedFile('events.json', json.dumps(data).encode('utf-8'))
+
+    def wait_for_job(self, api_client, job_id):
+        import time
+
+        url = reverse('load-events-job', kwargs={'job_id': job_id})
+        for _ in range(100):
+            response = api_client.get(url)
+            assert response.status_code == 200
+            if response.data['state'] in ('done', 'failed'):
+                return response.data
+            time.sleep(0.05)
+        raise AssertionError('job did not finish')
+
+    def test_background_load_matches_sync_result(self, api_client, sensor, settings, tmp_path):
+        settings.EVENTS_IMPORT_SPOOL_DIR = str(tmp_path)
+        settings.EVENTS_LOAD_CHUNK_SIZE = 2
+        data = [{'sensor_id': sensor.id, 'name': f'Event {i}', 'temperature': 20.0} for i in range(5)]
+        data += [{'sensor_id': 999, 'name': 'Missing', 'humidity': 50.0}, {'name': 'Invalid'}]
+        url = reverse('load-events')
+
+        sync_response = api_client.post(url, {'json_file': self.upload(data)}, format='multipart')
+        response = api_client.post(url, {'json_file': self.upload(data), 'background': True}, format='multipart')
+
+        assert response.status_code == 202
+        assert response.data['state'] == 'pending'
+        job = self.wait_for_job(api_client, response.data['id'])
+        assert job['state'] == 'done'
+        assert job['result'] == sync_response.data
+        assert job['rows_processed'] == 7
+        assert job['rows_failed'] == 2
+        assert job['rows_per_second'] is not None
+        assert Event.objects.count() == 10
+        assert list(tmp_path.iterdir()) == []
+
+    def test_background_load_with_workers(self, api_client, sensor, settings, tmp_path, monkeypatch):
+        from sensors.app.parallel import ParallelEventLoader
+
+        monkeypatch.setattr(ParallelEventLoader, 'TASK_ROWS', 2)
+        settings.EVENTS_IMPORT_SPOOL_DIR = str(tmp_path)
+        settings.EVENTS_IMPORT_MAX_PROCESSES = 2
+        data = [{'sensor_id': sensor.id, 'name': f'Event {i}', 'temperature': 20.0} for i in range(5)]
+        data += [{'sensor_id': 999, 'name': 'Missing', 'humidity': 50.0}, {'name': 'Invalid'}]
+        url = reverse('load-events')
+
+        assert (
+            api_client.post(url, {'json_file': self.upload(data), 'workers': 2}, format='multipart').status_code == 400
+        )
+        assert (
+            api_client.post(url, {'json_file': self.upload(data), 'workers': 3}, format='multipart').status_code == 400
+        )
+        sync_response = api_client.post(url, {'json_file': self.upload(data)}, format='multipart')
+        response = api_client.post(
+            url, {'json_file': self.upload(data), 'background': True, 'workers': 2}, format='multipart'
+        )
+
+        job = self.wait_for_job(api_client, response.data['id'])
+        assert job['state'] == 'done'
+        assert job['workers'] == 2
+        assert job['result'] == sync_response.data
+        assert job['rows_failed'] == 2
+        assert Event.objects.count() == 10
+
+    def test_background_load_parse_error(self, api_client, settings, tmp_path):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        settings.EVENTS_IMPORT_SPOOL_DIR = str(tmp_path)
+        upload = SimpleUploadedFile('events.json', b'invalid json content')
+        url = reverse('load-events')
+        response = api_client.post(url, {'json_file': upload, 'background': True}, format='multipart')
+
+        job = self.wait_for_job(api_client, response.data['id'])
+        assert job['state'] == 'failed'
+        assert job['detail'].startswith('Невалидный JSON')
+        assert job['result'] is None
+
+    def test_restart_fails_interrupted_jobs(self, api_client, tmp_path):
+        from django.core.management import call_command
+        from sensors.app.models import ImportJob
+
+        files = [tmp_path / f'{state}.json' for state in ('pending', 'running', 'done')]
+        for path in files:
+            path.write_text('[]')
+        pending, running, done = [
+            ImportJob.objects.create(state=state, file_path=str(path))
+            for state, path in zip(('pending', 'running', 'done'), files, strict=False)
+        ]
+        out = io.StringIO()
+
+        call_command('recover_import_jobs', stdout=out)
+
+        assert 'Прерванных задач: 2' in out.getvalue()
+        for job in (pending, running):
+            data = api_client.get(reverse('load-events-job', kwargs={'job_id': job.id})).data
+            assert data['state'] == 'failed'
+            assert data['detail'] == 'Загрузка прервана перезапуском сервера'
+        assert [path.exists() for path in files] == [False, False, True]
+        done.refresh_from_db()
+        assert (done.state, done.detail) == ('done', None)
+
+    def test_unknown_job(self, api_client):
+        import uuid
+
+        response = api_client.get(reverse('load-events-job', kwargs={'job_id': uuid.uuid4()}))
+        assert response.status_code == 404
+
+
+@pytest.mark.django_db
+class TestEventAggregation:
+    @pytest.fixture
+    def events(self, sensor, sensor_2):
+        rows = [
+            (sensor, '2026-01-01T10:05', 10.0, 50.0),
+            (sensor, '2026-01-01T10:40', 20.0, None),
+            (sensor, '2026-01-01T11:10', 30.0, 70.0),
+            (sensor_2, '2026-01-01T10:20', 40.0, 10.0),
+        ]
+        for owner, created_at, temperature, humidity in rows:
+            event = Event.objects.create(sensor=owner, name='Event', temperature=temperature, humidity=humidity)
+            Event.objects.filter(id=event.id).update(created_at=f'{created_at}Z')
+
+    def test_sensor_hourly_buckets(self, api_client, sensor, events):
+        url = reverse('sensors-aggregate', kwargs={'pk': sensor.id})
+        response = api_client.get(url, {'bucket': 'hour'})
+        assert response.status_code == 200
+        assert response.data == [
+            {
+                'bucket': '2026-01-01T10:00:00Z',
+                'count': 2,
+                'temperature_min': 10.0,
+                'temperature_max': 20.0,
+                'temperature_avg': 15.0,
+                'temperature_last': 20.0,
+                'humidity_min': 50.0,
+                'humidity_max': 50.0,
+                'humidity_avg': 50.0,
+                'humidity_last': 50.0,
+            },
+            {
+                'bucket': '2026-01-01T11:00:00Z',
+                'count': 1,
+                'temperature_min': 30.0,
+                'temperature_max': 30.0,
+                'temperature_avg': 30.0,
+                'temperature_last': 30.0,
+                'humidity_min': 70.0,
+                'humidity_max': 70.0,
+                'humidity_avg': 70.0,
+                'humidity_last': 70.0,
+            },
+        ]
+
+    def test_events_aggregate_uses_event_filter(self, api_client, events):
+        url = reverse('events-aggregate')
+        response = api_client.get(url, {'bucket': 'day', 'temperature_min': 15})
+        assert response.status_code == 200
+        assert [(row['count'], row['temperature_min']) for row in response.data] == [(3, 20.0)]
+
+        response = api_client.get(url, {'bucket': 'minute', 'created_after': '2026-01-01T10:30:00Z'})
+        assert [row['bucket'] for row in response.data] == ['2026-01-01T10:40:00Z', '2026-01-01T11:10:00Z']
+
+    def test_invalid_bucket(self, api_client):
+        response = api_client.get(reverse('events-aggregate'), {'bucket': 'week'})
+        assert response.status_code == 400
+
+
+@pytest.mark.django_db
+class TestEventCursorPagination:
+    @pytest.fixture
+    def events(self, sensor):
+        Event.objects.bulk_create(
+            [Event(sensor=sensor, name=f'Event {i}', temperature=20.0) for i in range(5)],
+        )
+        # одинаковое время у пачки - порядок держится на id
+        Event.objects.update(created_at='2026-01-01T00:00:00Z')
+        return list(Event.objects.order_by('-id').values_list('id', flat=True))
+
+    def walk(self, api_client, url, params):
+        ids = []
+        response = api_client.get(url, params)
+        while True:
+            assert response.status_code == 200
+            assert 'count' not in response.data
+            ids += [row['id'] for row in response.data['results']]
+            if not response.data['next']:
+                return ids, response
+            response = api_client.get(response.data['next'])
+
+    def test_walk_all_pages(self, api_client, events):
+        ids, last = self.walk(api_client, reverse('events-list'), {'pagination': 'cursor', 'page_size': 2})
+        assert ids == events
+
+        previous = api_client.get(last.data['previous'])
+        assert [row['id'] for row in previous.data['results']] == events[2:4]
+        assert previous.data['next']
+
+    def test_ascending_ordering(self, api_client, events):
+        params = {'pagination': 'cursor', 'page_size': 2, 'ordering': 'created_at'}
+        ids, last = self.walk(api_client, reverse('events-list'), params)
+        assert ids == events[::-1]
+
+        previous = api_client.get(last.data['previous'])
+        assert [row['id'] for row in previous.data['results']] == events[::-1][2:4]
+
+    @pytest.mark.parametrize('ordering', ['temperature', '-id', 'created_at,-id'])
+    def test_conflicting_ordering(self, api_client, events, ordering):
+        response = api_client.get(reverse('events-list'), {'pagination': 'cursor', 'ordering': ordering})
+        assert response.status_code == 400
+        assert 'ordering' in response.data
+
+        response = api_client.get(reverse('events-list'), {'ordering': ordering})
+        assert response.status_code == 200
+
+    def test_sensor_events_cursor(self, api_client, sensor, events, settings):
+        settings.EVENTS_PAGINATION = 'cursor'
+        ids, _ = self.walk(api_client, reverse('sensors-events', kwargs={'pk': sensor.id}), {'page_size': 3})
+        assert ids == events
+
+    def test_page_mode_keeps_count(self, api_client, events):
+        response = api_client.get(reverse('events-list'), {'page_size': 2})
+        assert response.data['count'] == 5
+        assert [row['id'] for row in response.data['results']] == events[:2]
+
+    def test_invalid_cursor_and_mode(self, api_client):
+        url = reverse('events-list')
+        assert api_client.get(url, {'pagination': 'cursor', 'cursor': 'broken'}).status_code == 404
+        assert api_client.get(url, {'pagination': 'offset'}).status_code == 400
+
+
+@pytest.mark.django_db
+class TestSensorState:
+    def create_event(self, api_client, sensor, temperature):
+        data = {'sensor': sensor.id, 'name': 'Event', 'temperature': temperature}
+        response = api_client.post(reverse('events-list'), data)
+        assert response.status_code == 201
+        return response.data['id']
+
+    def test_state_follows_event_changes(self, api_client, sensor, django_capture_on_commit_callbacks):
+        first = self.create_event(api_client, sensor, 10.0)
+        second = self.create_event(api_client, sensor, 30.0)
+
+        state = api_client.get(reverse('sensors-detail', kwargs={'pk': sensor.id})).data['state']
+        assert state['event_count'] == 2
+        assert state['last_temperature'] == 30.0
+        assert (state['temperature_min'], state['temperature_max']) == (10.0, 30.0)
+
+        # кэш ответа датчика сбрасывается после коммита записи
+        with django_capture_on_commit_callbacks(execute=True):
+            api_client.delete(reverse('events-detail', kwargs={'pk': second}))
+            api_client.patch(reverse('events-detail', kwargs={'pk': first}), {'temperature': 15.0})
+        state = api_client.get(reverse('sensors-detail', kwargs={'pk': sensor.id})).data['state']
+        assert state['event_count'] == 1
+        assert state['last_temperature'] == state['temperature_max'] == 15.0
+
+    def test_sensor_without_events(self, api_client, sensor):
+        assert api_client.get(reverse('sensors-detail', kwargs={'pk': sensor.id})).data['state'] is None
+
+    def test_summary(self, api_client, sensor, sensor_2, django_assert_num_queries):
+        self.create_event(api_client, sensor, 20.0)
+        self.create_event(api_client, sensor_2, 25.0)
+
+        with django_assert_num_queries(1):
+            response = api_client.get(reverse('sensors-summary'))
+        assert response.status_code == 200
+        assert [(row['sensor_id'], row['name'], row['last_temperature']) for row in response.data] == [
+            (sensor.id, sensor.name, 20.0),
+            (sensor_2.id, sensor_2.name, 25.0),
+        ]
+
+    def test_sensor_list_reads_state_in_one_query(self, api_client, sensor, sensor_2, django_assert_num_queries):
+        with django_assert_num_queries(2):
+            response = api_client.get(reverse('sensors-list'))
+        assert response.data['count'] == 2
+
+
+@pytest.mark.django_db
+class TestResponseCache:
+    def test_repeated_list_served_from_cache(self, api_client, event, django_assert_num_queries):
+        url = reverse('events-list')
+        first = api_client.get(url, {'sensor_id': event.sensor_id, 'ordering': 'id'})
+        with django_assert_num_queries(0):
+            second = api_client.get(url, {'ordering': 'id', 'temperature_min': '', 'sensor_id': event.sensor_id})
+        assert second.status_code == 200
+        assert second.data == first.data
+        assert second['ETag'] == first['ETag']
+
+    def test_not_modified(self, api_client, sensor, django_assert_num_queries):
+        url = reverse('sensors-detail', kwargs={'pk': sensor.id})
+        etag = api_client.get(url)['ETag']
+        with django_assert_num_queries(0):
+            response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert response['ETag'] == etag
+        assert api_client.get(reverse('sensors-list'), HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+    def test_writes_invalidate(self, api_client, sensor, django_capture_on_commit_callbacks):
+        url = reverse('events-list')
+        etag = api_client.get(url)['ETag']
+
+        with django_capture_on_commit_callbacks(execute=True):
+            api_client.post(url, {'sensor': sensor.id, 'name': 'Event', 'temperature': 20.0})
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response.data['count'] == 1
+
+        etag = response['ETag']
+        data = json.dumps([{'sensor_id': sensor.id, 'name': 'Loaded', 'temperature': 21.0}]).encode('utf-8')
+        with django_capture_on_commit_callbacks(execute=True):
+            api_client.post(
+                reverse('load-events'),
+                {'json_file': SimpleUploadedFile('events.json', data)},
+                format='multipart',
+            )
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response.data['count'] == 2
+
+    def test_disabled(self, api_client, sensor, settings):
+        settings.RESPONSE_CACHE_TIMEOUT = 0
+        response = api_client.get(reverse('sensors-detail', kwargs={'pk': sensor.id}))
+        assert response.status_code == 200
+        assert 'ETag' not in response
+
+
+@pytest.mark.django_db
+class TestFastSerialization:
+    @pytest.fixture(autouse=True)
+    def events(self, sensor, settings):
+        settings.RESPONSE_CACHE_TIMEOUT = 0
+        Event.objects.create(sensor=sensor, name='Событие\u2028', temperature=25.5, humidity=None)
+        Event.objects.create(sensor=sensor, name=None, temperature=-3.25, humidity=60.0)
+
+    def fetch_both(self, api_client, settings, url, params):
+        settings.EVENTS_FAST_SERIALIZATION = False
+        slow = api_client.get(url, params)
+        settings.EVENTS_FAST_SERIALIZATION = True
+        fast = api_client.get(url, params)
+        assert fast.status_code == slow.status_code == 200
+        return slow, fast
+
+    @pytest.mark.parametrize('pagination', ['page', 'cursor'])
+    def test_event_list_matches_serializer(self, api_client, settings, pagination):
+        params = {'pagination': pagination, 'page_size': 1}
+        slow, fast = self.fetch_both(api_client, settings, reverse('events-list'), params)
+        assert fast.content == slow.content
+
+        next_page = json.loads(fast.content)['next']
+        slow, fast = self.fetch_both(api_client, settings, next_page, {})
+        assert fast.content == slow.content
+
+    def test_sensor_events_match_serializer(self, api_client, settings, sensor):
+        slow, fast = self.fetch_both(api_client, settings, reverse('sensors-events', kwargs={'pk': sensor.id}), {})
+        assert fast.content == slow.content
+        assert len(json.loads(fast.content)['results']) == 2
+
+
+@pytest.mark.django_db
+class TestEventExport:
+    @pytest.fixture(autouse=True)
+    def events(self, sensor, sensor_2, settings):
+        settings.EVENTS_EXPORT_CHUNK_SIZE = 2
+        for i in range(5):
+            Event.objects.create(sensor=sensor, name=f'Event {i}', temperature=20.0 + i, humidity=None)
+        Event.objects.create(sensor=sensor_2, name='Other', temperature=None, humidity=50.0)
+
+    def test_ndjson(self, api_client, sensor):
+        response = api_client.get(reverse('events-export'), {'format': 'ndjson', 'sensor_id': sensor.id})
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'application/x-ndjson'
+        assert response.streaming
+        lines = b''.join(response.streaming_content).splitlines()
+        events = [json.loads(line) for line in lines]
+        listed = api_client.get(reverse('events-list'), {'sensor_id': sensor.id, 'page_size': 10}).data['results']
+        assert events == json.loads(json.dumps(listed))
+
+    def test_csv(self, api_client):
+        response = api_client.get(reverse('events-export'), {'ordering': 'id'}, HTTP_ACCEPT='text/csv')
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'text/csv; charset=utf-8'
+        assert 'events.csv' in response['Content-Disposition']
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+        assert [row['name'] for row in rows] == ['Event 0', 'Event 1', 'Event 2', 'Event 3', 'Event 4', 'Other']
+        assert rows[0]['temperature'] == '20.0' and rows[0]['humidity'] == ''
+
+    def test_invalid_filter(self, api_client):
+        response = api_client.get(reverse('events-export'), {'format': 'csv', 'created_after': 'вчера'})
+        assert response.status_code == 400
+        assert response.content.decode('utf-8').startswith('field,detail\ncreated_after,')
+
+
+@pytest.mark.django_db(transaction=True)
+def test_event_export_under_asgi(sensor):
+    from asgiref.sync import async_to_sync
+    from django.test import AsyncClient
+
+    Event.objects.create(sensor=sensor, name='Event', temperature=20.0)
+
+    async def export():
+        response = await AsyncClient().get(reverse('events-export'), {'format': 'ndjson'})
+        assert response.is_async
+        return [chunk async for chunk in response.streaming_content]
+
+    chunks = async_to_sync(export)()
+    assert [json.loads(line)['name'] for line in b''.join(chunks).splitlines()] == ['Event']
+
+
+# запросы идут в потоках пула со своими соединениями и не видят транзакцию теста
+@pytest.mark.django_db(transaction=True)
+class TestAsyncViews:
+    def get(self, url, params=None):
+        from asgiref.sync import async_to_sync
+        from django.test import AsyncClient
+
+        return async_to_sync(AsyncClient().get)(url, params or {})
+
+    @pytest.fixture(autouse=True)
+    def cache_off(self, settings):
+        settings.RESPONSE_CACHE_TIMEOUT = 0
+
+    @pytest.mark.parametrize('params', [{}, {'pagination': 'cursor', 'page_size': 1}, {'ordering': 'temperature'}])
+    def test_event_list_matches_sync(self, api_client, event, event_2, params):
+        response = self.get(reverse('async-events-list'), params)
+        assert response.status_code == 200
+        # ссылки пагинации ведут на тот же async-эндпоинт
+        expected = api_client.get(reverse('events-list'), params).content
+        assert response.content.replace(b'/async/', b'/') == expected
+
+    def test_sensor_detail_and_events_match_sync(self, api_client, sensor, event):
+        for name in ('sensors-detail', 'sensors-events'):
+            response = self.get(reverse(f'async-{name}', kwargs={'pk': sensor.id}))
+            assert response.status_code == 200
+            assert json.loads(response.content) == api_client.get(reverse(name, kwargs={'pk': sensor.id})).data
+
+    def test_errors(self, event):
+        assert self.get(reverse('async-sensors-detail', kwargs={'pk': event.sensor_id + 100})).status_code == 404
+        assert self.get(reverse('async-sensors-events', kwargs={'pk': event.sensor_id + 100})).status_code == 404
+        response = self.get(reverse('async-events-list'), {'created_after': 'вчера'})
+        assert response.status_code == 400
+        assert 'created_after' in json.loads(response.content)
+
+    def test_load_events(self, sensor):
+        from asgiref.sync import async_to_sync
+        from django.test import AsyncClient
+
+        data = json.dumps([{'sensor_id': sensor.id, 'name': 'Event', 'temperature': 20.0}]).encode('utf-8')
+        upload = SimpleUploadedFile('events.json', data)
+        response = async_to_sync(AsyncClient().post)(reverse('async-load-events'), {'json_file': upload})
+        assert response.status_code == 201
+        assert json.loads(response.content)['created'] == 1
+        assert Event.objects.filter(sensor=sensor).count() == 1
+
+    def test_db_work_runs_in_parallel(self):
+        from asgiref.sync import async_to_sync
+        from django.db import connection
+        from sensors.app.async_views import in_db_thread
+
+        # выполняй пул вызовы по очереди, первый так и ждал бы второго у барьера
+        barrier = threading.Barrier(2, timeout=5)
+
+        @in_db_thread
+        def backend_pid():
+            barrier.wait()
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_backend_pid()')
+                return cursor.fetchone()[0]
+
+        async def both():
+            return await asyncio.gather(backend_pid(), backend_pid())
+
+        assert len(set(async_to_sync(both)())) == 2
+
+
+@pytest.mark.django_db
+class TestEventIngest:
+    def post(self, api_client, body, content_type, **headers):
+        return api_client.generic('POST', reverse('events-ingest'), body, content_type=content_type, **headers)
+
+    def events(self, sensor, count):
+        return [{'sensor_id': sensor.id, 'name': f'Event {i}', 'temperature': 20.0 + i} for i in range(count)]
+
+    def test_json_array(self, api_client, sensor):
+        response = self.post(api_client, json.dumps(self.events(sensor, 3)), 'application/json')
+        assert response.status_code == 201
+        assert response.data['created'] == 3
+        assert SensorState.objects.get(sensor=sensor).event_count == 3
+
+    def test_gzip_ndjson(self, api_client, sensor, sensor_2, settings):
+        settings.EVENTS_LOAD_CHUNK_SIZE = 2
+        lines = [json.dumps(event) for event in self.events(sensor, 4)]
+        lines[2:2] = ['', '{"sensor_id": 999999, "name": "Чужой", "humidity": 10}', '[1, 2]']
+        body = gzip.compress('\n'.join(lines).encode('utf-8'))
+        response = self.post(api_client, body, 'application/x-ndjson', HTTP_CONTENT_ENCODING='gzip')
+        assert response.status_code == 201
+        assert response.data['total_input'] == 6
+        assert response.data['created'] == 4
+        assert response.data['skipped_events_to_missing_sensor'] == 1
+        assert response.data['error_details'][0] == '#4: элемент не объект'
+
+    @pytest.mark.django_db(transaction=True)
+    def test_auto_create_sensors(self, api_client):
+        events = [{'sensor_id': 4242, 'name': 'Event', 'temperature': 20.0}]
+        url = reverse('events-ingest') + '?auto_create_sensors=true'
+        response = api_client.generic('POST', url, json.dumps(events), content_type='application/json')
+        assert response.status_code == 201
+        assert response.data['sensors_created'] == 1
+        assert Event.objects.get().sensor_id == 4242
+
+    def test_errors(self, api_client, sensor, settings):
+        body = json.dumps(self.events(sensor, 1))
+        assert self.post(api_client, body, 'text/plain').status_code == 415
+        assert self.post(api_client, body, 'application/json', HTTP_CONTENT_ENCODING='br').status_code == 415
+        response = self.post(api_client, body, 'application/json', HTTP_CONTENT_ENCODING='gzip')
+        assert response.status_code == 400
+        assert response.data['detail'].startswith('Невалидный gzip')
+
+        response = self.post(api_client, '{"sensor_id": 1}\n{oops', 'application/x-ndjson')
+        assert response.status_code == 400
+        assert response.data['detail'].startswith('Невалидный JSON: строка 2')
+        assert not Event.objects.exists()
+
+        settings.EVENTS_UPLOAD_MAX_SIZE = 10
+        assert self.post(api_client, body, 'application/json').status_code == 413
+
+
+@pytest.mark.django_db
+class TestEventWriteBehind:
+    @pytest.fixture
+    def buffer(self, settings, monkeypatch):
+        settings.EVENTS_WRITE_BEHIND = True
+        buffer = EventWriteBuffer(batch_size=10, interval=0.01, max_size=2)
+        monkeypatch.setattr('sensors.app.buffer._buffer', buffer)
+        return buffer
+
+    def post(self, api_client, sensor_id, name):
+        return api_client.post(reverse('events-list'), {'sensor': sensor_id, 'name': name, 'temperature': 21.5})
+
+    def test_post_is_written_on_flush(self, api_client, sensor, buffer):
+        response = self.post(api_client, sensor.id, 'Event 1')
+        assert response.status_code == 202
+        assert response.data == {'name': 'Event 1', 'temperature': 21.5, 'humidity': None, 'sensor': sensor.id}
+        assert not Event.objects.exists()
+
+        buffer.flush()
+        assert Event.objects.get().name == 'Event 1'
+        assert SensorState.objects.get(sensor=sensor).event_count == 1
+
+    def test_full_queue_is_throttled(self, api_client, sensor, buffer):
+        assert self.post(api_client, sensor.id, 'Event 1').status_code == 202
+        assert self.post(api_client, sensor.id, 'Event 2').status_code == 202
+        response = self.post(api_client, sensor.id, 'Event 3')
+        assert response.status_code == 429
+        assert response['Retry-After'] == '1'
+
+    def test_deleted_sensor_is_dropped(self, api_client, sensor, sensor_2, buffer):
+        assert self.post(api_client, 999999, 'Чужое').status_code == 400
+        assert self.post(api_client, sensor.id, 'Своё').status_code == 202
+        assert self.post(api_client, sensor_2.id, 'Удалённое').status_code == 202
+        sensor_2.delete()
+        buffer.flush()
+        assert list(Event.objects.values_list('name', flat=True)) == ['Своё']
+
+    def test_invalid_event(self, api_client, buffer):
+        response = api_client.post(reverse('events-list'), {'sensor': 1, 'name': 'Event', 'temperature': 'жарко'})
+        assert response.status_code == 400
+        assert 'temperature' in response.data
+        assert buffer.queue.empty()
+
+
+@pytest.mark.django_db
+class TestSensorIdCache:
+    def post(self, api_client, sensor_id):
+        return api_client.post(reverse('events-list'), {'sensor': sensor_id, 'name': 'Event', 'temperature': 21.5})
+
+    def test_event_create_skips_sensor_lookup(self, api_client, sensor, django_assert_num_queries):
+        assert self.post(api_client, sensor.id).status_code == 201
+        # savepoint, вставка события, обновление состояния датчика, проверка внешних ключей, release
+        with django_assert_num_queries(6) as captured:
+            assert self.post(api_client, sensor.id).status_code == 201
+        assert not [query for query in captured.captured_queries if 'FROM "app_sensor"' in query['sql']]
+
+    def test_created_and_deleted_sensors(self, api_client, django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks(execute=True):
+            response = api_client.post(reverse('sensors-list'), {'name': 'New Sensor', 'sensor_type': 2})
+        sensor_id = response.data['id']
+        assert self.post(api_client, sensor_id).status_code == 201
+
+        assert api_client.delete(reverse('sensors-detail', kwargs={'pk': sensor_id})).status_code == 204
+        response = self.post(api_client, sensor_id)
+        assert response.status_code == 400
+        assert response.data['sensor'] == [f'Датчик с ID {sensor_id} не существует']
+
+    @pytest.fixture
+    def stale_sensor(self, sensor):
+        """Датчик, удалённый другим процессом: в кэше этого процесса он ещё есть"""
+        from sensors.app.cache import sensor_id_cache
+
+        sensor_id = sensor.id
+        sensor.delete()
+        sensor_id_cache.store({sensor_id})
+        return sensor_id
+
+    def test_event_to_deleted_sensor(self, api_client, stale_sensor):
+        from sensors.app.cache import sensor_id_cache
+
+        response = self.post(api_client, stale_sensor)
+
+        assert response.status_code == 400
+        assert response.data['sensor'] == [f'Датчик с ID {stale_sensor} не существует']
+        assert stale_sensor not in sensor_id_cache.entries
+        assert not Event.objects.exists()
+
+    def test_load_skips_deleted_sensor(self, api_client, stale_sensor, sensor_2):
+        from sensors.app.cache import sensor_id_cache
+
+        data = [
+            {'sensor_id': stale_sensor, 'name': 'Event 1', 'temperature': 25.5},
+            {'sensor_id': sensor_2.id, 'name': 'Event 2', 'temperature': 20.0},
+        ]
+        upload = SimpleUploadedFile('events.json', json.dumps(data).encode('utf-8'))
+
+        response = api_client.post(reverse('load-events'), {'json_file': upload}, format='multipart')
+
+        assert response.status_code == 201
+        assert (response.data['created'], response.data['skipped_events_to_missing_sensor']) == (1, 1)
+        assert list(Event.objects.values_list('sensor_id', flat=True)) == [sensor_2.id]
+        assert SensorState.objects.get(sensor=sensor_2).event_count == 1
+        assert stale_sensor not in sensor_id_cache.entries
+
+
+@pytest.mark.django_db
+class TestMetrics:
+    @pytest.fixture(autouse=True)
+    def clear_metrics(self, settings):
+        settings.RESPONSE_CACHE_TIMEOUT = 0
+        for metric in metrics.REGISTRY:
+            metric.clear()
+
+    def scrape(self, api_client):
+        response = api_client.get('/metrics')
+        assert response.status_code == 200
+        assert response['Content-Type'].startswith('text/plain; version=0.0.4')
+        return {
+            name: float(value)
+            for name, _, value in (line.rpartition(' ') for line in response.content.decode().splitlines())
+            if not name.startswith('#')
+        }
+
+    def test_request_latency_and_queries(self, api_client, event):
+        assert api_client.get(reverse('events-list'), {'sensor_id': event.sensor_id}).status_code == 200
+        assert api_client.get('/no-such-page/').status_code == 404
+
+        samples = self.scrape(api_client)
+        assert samples['sensors_http_requests_total{view="events-list",method="GET",status="200"}'] == 1
+        assert samples['sensors_http_requests_total{view="unmatched",method="GET",status="404"}'] == 1
+        assert samples['sensors_http_request_duration_seconds_count{view="events-list",method="GET"}'] == 1
+        assert samples['sensors_http_request_duration_seconds_bucket{view="events-list",method="GET",le="+Inf"}'] == 1
+        # COUNT(*) страницы и сами события
+        assert samples['sensors_http_request_db_queries_sum{view="events-list",method="GET"}'] == 2
+        assert samples['sensors_http_request_db_duration_seconds_sum{view="events-list",method="GET"}'] > 0
+
+    @pytest.mark.django_db(transaction=True)
+    def test_async_view_queries(self, api_client, event):
+        from asgiref.sync import async_to_sync
+        from django.test import AsyncClient
+
+        response = async_to_sync(AsyncClient().get)(reverse('async-sensors-detail', kwargs={'pk': event.sensor_id}))
+        assert response.status_code == 200
+
+        samples = self.scrape(api_client)
+        assert samples['sensors_http_request_db_queries_sum{view="async-sensors-detail",method="GET"}'] >= 1
+
+    def test_load_counters(self, api_client, sensor):
+        data = [
+            {'sensor_id': sensor.id, 'name': 'Event 1', 'temperature': 25.5},
+            {'sensor_id': sensor.id, 'name': 'Event 2', 'temperature': 500.0},
+            {'sensor_id': 999, 'name': 'Event 3', 'humidity': 40.0},
+        ]
+        upload = SimpleUploadedFile('events.json', json.dumps(data).encode('utf-8'))
+        assert api_client.post('/load-events/', {'json_file': upload}, format='multipart').status_code == 201
+        upload = SimpleUploadedFile('events.json', b'[{"sensor_id": oops}]')
+        assert api_client.post('/load-events/', {'json_file': upload}, format='multipart').status_code == 400
+
+        samples = self.scrape(api_client)
+        assert samples['sensors_events_loads_total{source="upload",outcome="ok"}'] == 1
+        assert samples['sensors_events_loads_total{source="upload",outcome="failed"}'] == 1
+        assert samples['sensors_events_rows_parsed_total{source="upload"}'] == 3
+        assert samples['sensors_events_rows_rejected_total{source="upload"}'] == 2
+        assert samples['sensors_events_rows_inserted_total{source="upload"}'] == 1
+        assert samples['sensors_events_last_load_rows_per_second{source="upload"}'] > 0
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('test_seconds', 'Тест', ('view',), buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value, 'a"b')
+
+        assert histogram.render()[2:] == [
+            'test_seconds_bucket{view="a\\"b",le="0.1"} 2',
+            'test_seconds_bucket{view="a\\"b",le="1"} 3',
+            'test_seconds_bucket{view="a\\"b",le="+Inf"} 4',
+            'test_seconds_sum{view="a\\"b"} 5.65',
+            'test_seconds_count{view="a\\"b"} 4',
+        ]
+
+
+@pytest.mark.django_db
+class TestSlowRequestProfiler:
+    @pytest.fixture(autouse=True)
+    def profiling(self, settings):
+        settings.PROFILING_ENABLED = True
+        settings.PROFILING_THRESHOLD_MS = 0
+        settings.PROFILING_SAMPLE_RATE = 0
+        settings.RESPONSE_CACHE_TIMEOUT = 0
+        get_profile_buffer().clear()
+        yield
+        get_profile_buffer().clear()
+
+    @pytest.fixture
+    def admin_client(self, api_client):
+        from django.contrib.auth.models import User
+
+        api_client.force_authenticate(User.objects.create_user('admin', is_staff=True))
+        return api_client
+
+    def test_slow_request_sql_explain_and_profile(self, admin_client, event, settings):
+        settings.PROFILING_EXPLAIN_ANALYZE = True
+        params = {'sensor_id': event.sensor_id, 'ordering': '-temperature'}
+        assert admin_client.get(reverse('events-list'), params).status_code == 200
+
+        response = admin_client.get(reverse('slow-requests'))
+        assert response.status_code == 200
+        [entry] = response.data
+        assert entry['view'] == 'events-list'
+        assert entry['path'].startswith('/events/?')
+        assert entry['status'] == 200
+        assert entry['slow']
+        select = next(query for query in entry['queries'] if 'ORDER BY' in query['sql'])
+        assert select['params'] == [str(event.sensor_id)]
+        assert 'actual time' in select['explain']
+        assert 'Execution Time' in select['explain']
+        assert 'function calls' in entry['profile']
+
+    def test_plain_explain_by_default(self, admin_client, event):
+        assert admin_client.get(reverse('events-list'), {'sensor_id': event.sensor_id}).status_code == 200
+
+        [entry] = admin_client.get(reverse('slow-requests')).data
+        select = next(query for query in entry['queries'] if 'ORDER BY' in query['sql'])
+        assert 'cost=' in select['explain']
+        assert 'actual time' not in select['explain']
+
+    def test_locking_selects_are_not_explained(self, sensor):
+        table = Sensor._meta.db_table
+        for clause in ('FOR UPDATE', 'for no key update skip locked', 'FOR SHARE', 'FOR KEY SHARE NOWAIT'):
+            assert explain_query('default', f'SELECT id FROM {table} WHERE id = %s {clause}', [sensor.id]) is None
+        assert explain_query('default', f'SELECT id FROM {table} WHERE id = %s', [sensor.id])
+
+    def test_writes_are_not_explained(self, admin_client, sensor):
+        response = admin_client.post(reverse('events-list'), {'sensor': sensor.id, 'name': 'Event', 'temperature': 1})
+        assert response.status_code == 201
+
+        [entry] = admin_client.get(reverse('slow-requests')).data
+        insert = next(query for query in entry['queries'] if query['sql'].startswith('INSERT'))
+        assert insert['explain'] is None
+        assert Event.objects.count() == 1
+
+    def test_fast_requests_are_skipped(self, admin_client, event, settings):
+        settings.PROFILING_THRESHOLD_MS = 60_000
+        assert admin_client.get(reverse('events-list')).status_code == 200
+        assert admin_client.get(reverse('slow-requests')).data == []
+
+        settings.PROFILING_SAMPLE_RATE = 1
+        assert admin_client.get(reverse('events-list')).status_code == 200
+        [entry] = admin_client.get(reverse('slow-requests')).data
+        assert not entry['slow']
+
+    def test_async_view_has_sql_without_python_profile(self, admin_client, event):
+        from asgiref.sync import async_to_sync
+        from django.test import AsyncClient
+
+        response = async_to_sync(AsyncClient().get)(reverse('async-events-list'), {'sensor_id': event.sensor_id})
+        assert response.status_code == 200
+
+        [entry] = admin_client.get(reverse('slow-requests')).data
+        assert entry['view'] == 'async-events-list'
+        assert any(query['explain'] for query in entry['queries'])
+        assert entry['profile'] is None
+
+    def test_admin_only(self, admin_client):
+        from django.contrib.auth.models import User
+        from rest_framework.test import APIClient
+
+        assert APIClient().get(reverse('slow-requests')).status_code == 403
+        user_client = APIClient()
+        user_client.force_authenticate(User.objects.create_user('user'))
+        assert user_client.get(reverse('slow-requests')).status_code == 403
+        assert admin_client.get(reverse('slow-requests')).status_code == 200
+        assert admin_client.delete(reverse('slow-requests')).status_code == 204
+        assert admin_client.get(reverse('slow-requests')).data == []
+
+    def test_buffer_is_bounded(self, admin_client, settings, monkeypatch):
+        from sensors.app import profiling
+
+        settings.PROFILING_BUFFER_SIZE = 2
+        monkeypatch.setattr(profiling, '_buffer', None)
+        for _ in range(3):
+            admin_client.get(reverse('sensors-list'))
+        entries = admin_client.get(reverse('slow-requests')).data
+        assert [entry['id'] for entry in entries] == [3, 2]
+
+
+# без транзакции вокруг теста: внутри транзакции роутер всегда читает с основной БД
+@pytest.mark.django_db(transaction=True)
+class TestReplicaRouting:
+    @pytest.fixture(autouse=True)
+    def replicas(self, settings):
+        settings.DATABASE_REPLICAS = ['replica_1']
+        settings.REPLICA_STICKY_SECONDS = 5
+        settings.RESPONSE_CACHE_TIMEOUT = 0
+
+    def reads(self, view, method='get', cookies=None):
+        """Ответ middleware и БД, которые выбирал роутер для чтения внутри представления"""
+        from django.test import RequestFactory
+        from sensors.app.middleware import ReplicaRoutingMiddleware
+
+        request = getattr(RequestFactory(), method)('/events/')
+        request.COOKIES.update(cookies or {})
+        databases = list[str]()
+        response = ReplicaRoutingMiddleware(lambda request: view(databases) or HttpResponse())(request)
+        return response, databases
+
+    def test_safe_requests_read_from_replica(self):
+        from django.db import router, transaction
+
+        def view(databases):
+            databases.append(router.db_for_read(Event))
+            with transaction.atomic():
+                databases.append(router.db_for_read(Event))
+
+        response, databases = self.reads(view)
+
+        assert databases == ['replica_1', 'default']
+        assert 'read_primary' not in response.cookies
+        # вне запросов чтение идёт с основной БД
+        assert router.db_for_read(Event) == 'default'
+
+    def test_writes_stick_client_to_primary(self):
+        from django.db import router
+
+        def view(databases):
+            databases.append(router.db_for_read(Event))
+
+        response, databases = self.reads(view, method='post')
+        assert databases == ['default']
+        assert response.cookies['read_primary']['max-age'] == 5
+
+        response, databases = self.reads(view, cookies={'read_primary': '1'})
+        assert databases == ['default']
+
+    def test_write_in_safe_request_pins_primary(self):
+        from django.db import router
+
+        def view(databases):
+            databases.append(router.db_for_read(Event))
+            databases.append(router.db_for_write(Event))
+            databases.append(router.db_for_read(Event))
+
+        response, databases = self.reads(view)
+
+        assert databases == ['replica_1', 'default', 'default']
+        assert 'read_primary' in response.cookies
+
+    def test_client_reads_own_writes(self, api_client, sensor):
+        response = api_client.post(reverse('events-list'), {'sensor': sensor.id, 'name': 'Event', 'temperature': 1})
+        assert response.status_code == 201
+        assert 'read_primary' in response.cookies
+
+        # cookie возвращается клиентом, поэтому чтение идёт с основной БД, а не с отстающей реплики
+        response = api_client.get(reverse('events-list'))
+        assert response.status_code == 200
+        assert [event['name'] for event in response.data['results']] == ['Event']
+
+    def test_replica_reads_are_not_cached(self, api_client, sensor, settings):
+        from rest_framework.test import APIClient
+
+        # "реплика" - та же БД, а отставание изображает изменение без сброса версии кэша
+        settings.DATABASE_REPLICAS = ['default']
+        settings.RESPONSE_CACHE_TIMEOUT = 60
+
+        url = reverse('sensors-detail', kwargs={'pk': sensor.id})
+        response = api_client.get(url)
+        assert response.status_code == 200
+        assert 'ETag' not in response
+
+        Sensor.objects.filter(id=sensor.id).update(name='Primary')
+        writer = APIClient()
+        writer.cookies['read_primary'] = '1'
+        response = writer.get(url)
+        assert response.data['name'] == 'Primary'
+        assert 'ETag' in response
+
+        # ответ, собранный на основной БД, кэшируется и отдаётся всем
+        Sensor.objects.filter(id=sensor.id).update(name='Uncached')
+        assert api_client.get(url).data['name'] == 'Primary'
+
+    def test_disabled_without_replicas(self, settings):
+        from django.core.exceptions import MiddlewareNotUsed
+        from sensors.app.middleware import ReplicaRoutingMiddleware
+
+        settings.DATABASE_REPLICAS = []
+        with pytest.raises(MiddlewareNotUsed):
+            ReplicaRoutingMiddleware(lambda request: HttpResponse())
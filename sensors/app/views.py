@@ -1,88 +1,323 @@
+import gzip
+import io
 import logging
+import math
+import time
+import zlib
 
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db import transaction
+from django.http import HttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import generics
+from rest_framework import permissions
 from rest_framework import status
 from rest_framework import viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import Throttled
+from rest_framework.exceptions import UnsupportedMediaType
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import BooleanField
 from rest_framework.filters import OrderingFilter
 from rest_framework.filters import SearchFilter
 from rest_framework.parsers import MultiPartParser
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from sensors.app import metrics
+from sensors.app.buffer import get_write_buffer
+from sensors.app.cache import cache_response
+from sensors.app.cache import sensor_id_cache
 from sensors.app.exceptions import ParseError
+from sensors.app.export import EventExportService
 from sensors.app.filters import EventFilter
+from sensors.app.filters import EventRollupFilter
+from sensors.app.jobs import ImportJobService
 from sensors.app.models import Event
+from sensors.app.models import EventRollup
+from sensors.app.models import ImportJob
 from sensors.app.models import Sensor
+from sensors.app.models import SensorState
+from sensors.app.pagination import EventPagination
+from sensors.app.profiling import get_profile_buffer
+from sensors.app.renderers import CSVRenderer
+from sensors.app.renderers import NDJSONRenderer
+from sensors.app.renderers import ORJSONRenderer
+from sensors.app.serializers import EventAggregateQuerySerializer
+from sensors.app.serializers import EventBucketSerializer
+from sensors.app.serializers import EventRowSerializer
 from sensors.app.serializers import EventSerializer
+from sensors.app.serializers import ImportJobSerializer
 from sensors.app.serializers import LoadEventsSerializer
+from sensors.app.serializers import QueuedEventSerializer
 from sensors.app.serializers import SensorSerializer
-from sensors.app.services import EventDataParser
-from sensors.app.services import EventService
+from sensors.app.serializers import SensorSummarySerializer
+from sensors.app.services import EventAggregationService
+from sensors.app.services import EventLoader
+from sensors.app.services import SensorStateService
+from sensors.app.services import checked_transaction
+from sensors.app.services import is_foreign_key_violation
 
 
 logger = logging.getLogger(__name__)
 
 
+def aggregate_events_response(request, queryset, rollups):
+    """Агрегаты событий вместе со свёрнутыми старыми событиями, если фильтры к ним применимы"""
+    query = EventAggregateQuerySerializer(data=request.query_params)
+    query.is_valid(raise_exception=True)
+    if EventRollupFilter.applies(request.query_params):
+        rollups = EventRollupFilter(request.query_params, queryset=rollups).qs
+    else:
+        rollups = None
+    buckets = EventAggregationService.aggregate(queryset, query.validated_data['bucket'], rollups)
+    return Response(EventBucketSerializer(buckets, many=True).data)
+
+
+def load_status(result):
+    """201 - что-то записано, 200 - повтор уже загруженных событий, 400 - записывать нечего"""
+    if result['created'] > 0:
+        return status.HTTP_201_CREATED
+    if result['duplicates'] > 0:
+        return status.HTTP_200_OK
+    return status.HTTP_400_BAD_REQUEST
+
+
+def load_events(request_data):
+    """Загрузка файла из multipart-формы: (данные ответа, код статуса)"""
+    serializer = LoadEventsSerializer(data=request_data)
+    serializer.is_valid(raise_exception=True)
+
+    upload = serializer.validated_data['json_file']
+    auto_create_sensors = serializer.validated_data['auto_create_sensors']
+    if serializer.validated_data['background']:
+        job = ImportJobService.submit(
+            upload,
+            auto_create_sensors=auto_create_sensors,
+            workers=serializer.validated_data['workers'],
+        )
+        return ImportJobSerializer(job).data, status.HTTP_202_ACCEPTED
+
+    started = time.perf_counter()
+    try:
+        result = EventLoader(auto_create_sensors=auto_create_sensors).load_json_file(upload.file)
+        metrics.record_load('upload', result, time.perf_counter() - started)
+        status_code = load_status(result)
+        return result, status_code
+
+    except ParseError as e:
+        metrics.record_failed_load('upload')
+        return {'detail': str(e)}, status.HTTP_400_BAD_REQUEST
+    except Exception as e:
+        metrics.record_failed_load('upload')
+        logger.error(f'Ошибка загрузки: {e!s}')
+        return {'detail': 'Внутренняя ошибка'}, status.HTTP_500_INTERNAL_SERVER_ERROR
+
+
+class _RequestBody(io.RawIOBase):
+    """Тело HttpRequest как поток io для TextIOWrapper и GzipFile"""
+
+    def __init__(self, http_request):
+        self.http_request = http_request
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.http_request.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+
+INGEST_FORMATS = {
+    'application/json': EventLoader.load_json_file,
+    'application/x-ndjson': EventLoader.load_ndjson_file,
+    'application/jsonl': EventLoader.load_ndjson_file,
+}
+
+
+def ingest_events(http_request, auto_create_sensors=False):
+    """Загрузка событий из тела запроса: (данные ответа, код статуса)"""
+    load = INGEST_FORMATS.get(http_request.content_type)
+    if load is None:
+        raise UnsupportedMediaType(http_request.content_type)
+    encoding = http_request.headers.get('Content-Encoding', 'identity').lower()
+    if encoding not in ('identity', 'gzip'):
+        return {'detail': f'Неподдерживаемое сжатие: {encoding}'}, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+    max_size = settings.EVENTS_UPLOAD_MAX_SIZE
+    if max_size is not None and int(http_request.headers.get('Content-Length') or 0) > max_size:
+        return {'detail': f'Тело запроса больше {max_size} байт'}, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+    stream = io.BufferedReader(_RequestBody(http_request))
+    body = gzip.GzipFile(fileobj=stream, mode='rb') if encoding == 'gzip' else stream
+    started = time.perf_counter()
+    try:
+        result = load(EventLoader(auto_create_sensors=auto_create_sensors), body)
+    except ParseError as e:
+        metrics.record_failed_load('ingest')
+        return {'detail': str(e)}, status.HTTP_400_BAD_REQUEST
+    except (OSError, EOFError, zlib.error) as e:
+        metrics.record_failed_load('ingest')
+        return {'detail': f'Невалидный gzip: {e}'}, status.HTTP_400_BAD_REQUEST
+    metrics.record_load('ingest', result, time.perf_counter() - started)
+    status_code = load_status(result)
+    return result, status_code
+
+
+@contextmanager
+def deleted_sensor_error(serializer):
+    """Транзакция записи события; датчик, удалённый после проверки по кэшу, - ошибка 400, а не 500"""
+    try:
+        with checked_transaction():
+            yield
+    except IntegrityError as e:
+        sensor = serializer.validated_data.get('sensor')
+        if sensor is None or not is_foreign_key_violation(e):
+            raise
+        sensor_id_cache.discard({sensor.pk})
+        message = serializer.fields['sensor'].error_messages['does_not_exist'].format(pk_value=sensor.pk)
+        raise ValidationError({'sensor': [message]}) from None
+
+
 class SensorViewSet(viewsets.ModelViewSet):
-    queryset = Sensor.objects.all().order_by('id')
+    queryset = Sensor.objects.select_related('state').order_by('id')
     serializer_class = SensorSerializer
     filter_backends = [SearchFilter, OrderingFilter]
     search_fields = ['name']
     ordering_fields = ['id', 'name', 'created_at']
 
-    @action(detail=True, methods=['get'])
+    @cache_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(detail=True, methods=['get'], renderer_classes=[ORJSONRenderer, BrowsableAPIRenderer])
     def events(self, request, pk=None):
         sensor = self.get_object()
-        events = sensor.events.all().order_by('-created_at')
-        page = self.paginate_queryset(events)
+        events = sensor.events.all().order_by('-created_at', '-id')
+        paginator = EventPagination()
+        if settings.EVENTS_FAST_SERIALIZATION:
+            page = paginator.paginate_queryset(EventRowSerializer.queryset(events), request, view=self)
+            return paginator.get_paginated_response(EventRowSerializer.data(page))
+        page = paginator.paginate_queryset(events, request, view=self)
         serializer = EventSerializer(page, many=True)
-        return self.get_paginated_response(serializer.data)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def aggregate(self, request, pk=None):
+        sensor = self.get_object()
+        filterset = EventFilter(request.query_params, queryset=sensor.events.all())
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        return aggregate_events_response(request, filterset.qs, sensor.rollups.all())
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """Сводка по всем датчикам одним запросом к таблице состояний"""
+        states = SensorState.objects.select_related('sensor').order_by('sensor_id')
+        return Response(SensorSummarySerializer(states, many=True).data)
 
 
 class EventViewSet(viewsets.ModelViewSet):
-    queryset = Event.objects.all().order_by('-created_at')
+    queryset = Event.objects.all().order_by('-created_at', '-id')
     serializer_class = EventSerializer
+    pagination_class = EventPagination
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_class = EventFilter
     ordering_fields = ['created_at', 'temperature', 'humidity', 'id']
 
+    @cache_response
+    def list(self, request, *args, **kwargs):
+        if not settings.EVENTS_FAST_SERIALIZATION:
+            return super().list(request, *args, **kwargs)
+        queryset = EventRowSerializer.queryset(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(EventRowSerializer.data(page))
+
+    @action(detail=False, methods=['get'])
+    def aggregate(self, request):
+        return aggregate_events_response(request, self.filter_queryset(self.get_queryset()), EventRollup.objects.all())
+
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        """Выгрузка всех отфильтрованных событий потоком, формат - ?format=ndjson|csv или Accept"""
+        return EventExportService.response(
+            request._request, self.filter_queryset(self.get_queryset()), request.accepted_renderer
+        )
+
+    @action(detail=False, methods=['post'], parser_classes=[])
+    def ingest(self, request):
+        """Пакет событий в теле запроса: JSON массив или NDJSON, можно со сжатием gzip.
+
+        Тело читается потоком и пишется порциями в одной транзакции, как загрузка файла.
+        С ?auto_create_sensors=true неизвестные датчики создаются, а не пропускаются.
+        """
+        auto_create_sensors = request.query_params.get('auto_create_sensors', '') in BooleanField.TRUE_VALUES
+        data, status_code = ingest_events(request._request, auto_create_sensors=auto_create_sensors)
+        return Response(data, status=status_code)
+
+    def create(self, request, *args, **kwargs):
+        if not settings.EVENTS_WRITE_BEHIND:
+            return super().create(request, *args, **kwargs)
+        serializer = QueuedEventSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if not get_write_buffer().put(serializer.to_row()):
+            raise Throttled(wait=math.ceil(settings.EVENTS_WRITE_BEHIND_INTERVAL), detail='Очередь записи заполнена')
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+    def perform_create(self, serializer):
+        with deleted_sensor_error(serializer):
+            SensorStateService.apply_event(serializer.save())
+
+    def perform_update(self, serializer):
+        old_sensor_id = serializer.instance.sensor_id
+        with deleted_sensor_error(serializer):
+            event = serializer.save()
+            SensorStateService.rebuild({old_sensor_id, event.sensor_id})
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        sensor_id = instance.sensor_id
+        instance.delete()
+        SensorStateService.rebuild({sensor_id})
+
 
 class LoadEventsAPIView(APIView):
     parser_classes = (MultiPartParser,)
     serializer_class = LoadEventsSerializer
 
     def post(self, request, *args, **kwargs):
-        serializer = self.serializer_class(data=request.data)
-        serializer.is_valid(raise_exception=True)
+        data, status_code = load_events(request.data)
+        return Response(data, status=status_code)
+
+
+class ImportJobAPIView(generics.RetrieveAPIView):
+    queryset = ImportJob.objects.all()
+    serializer_class = ImportJobSerializer
+    lookup_url_kwarg = 'job_id'
+
+
+def metrics_view(request):
+    """Метрики процесса для Prometheus"""
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class SlowRequestProfileAPIView(APIView):
+    """Профили медленных запросов этого процесса, новые первыми (только для администраторов)"""
+
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_profile_buffer().list())
 
-        upload = serializer.validated_data['json_file']
-        try:
-            valid_events, parse_errors = EventDataParser.parse_json_file(upload.file)
-
-            sensor_ids = {event['sensor_id'] for event in valid_events}
-            existing_sensors = Sensor.objects.filter(id__in=sensor_ids)
-            existing_sensors_map = {sensor.id: sensor for sensor in existing_sensors}
-
-            created_count, sensor_errors = EventService.bulk_create_events(valid_events, existing_sensors_map)
-            all_errors = parse_errors + sensor_errors
-
-            status_code = status.HTTP_201_CREATED if created_count > 0 else status.HTTP_400_BAD_REQUEST
-
-            return Response(
-                {
-                    'total_input': len(valid_events) + len(parse_errors),
-                    'valid_events': len(valid_events),
-                    'created': created_count,
-                    'skipped_events_to_missing_sensor': len(sensor_errors),
-                    'parse_errors': len(parse_errors),
-                    'error_details': all_errors,
-                },
-                status=status_code,
-            )
-
-        except ParseError as e:
-            return Response({'detail': str(e)}, status=400)
-        except Exception as e:
-            logger.error(f'Ошибка загрузки: {e!s}')
-            return Response({'detail': 'Внутренняя ошибка'}, status=500)
+    def delete(self, request, *args, **kwargs):
+        get_profile_buffer().clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,17 @@
+import django
+
+from django.conf import settings
+
+
+# модуль без импорта моделей: spawn загружает инициализатор процесса до django.setup()
+
+
+def settings_snapshot():
+    """Настройки для процессов пула как есть сейчас, с изменениями на лету (например, тестовая БД)"""
+    return {name: getattr(settings, name) for name in dir(settings) if name.isupper() and name != 'SETTINGS_MODULE'}
+
+
+def init_worker(values):
+    """Инициализатор процесса пула: spawn начинает с чистого интерпретатора без Django"""
+    settings.configure(**values)
+    django.setup()
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from pathlib import Path
 
@@ -36,6 +37,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'sensors.app.middleware.MetricsMiddleware',
+    'sensors.app.profiling.SlowRequestProfiler',
+    'sensors.app.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,6 +86,33 @@ DATABASES = {
     },
 }
 
+# Реплики только для чтения: DATABASE_REPLICAS=host1:5432,host2 с теми же пользователем и
+# базой, что у основной БД. Безопасные запросы API читают с них, запись, транзакции,
+# команды и фоновые задачи работают с основной БД. После записи клиент
+# REPLICA_STICKY_SECONDS секунд читает с основной БД, чтобы видеть свои изменения
+DATABASE_REPLICAS = []
+for _index, _address in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')), start=1):
+    _host, _, _port = _address.strip().partition(':')
+    DATABASES[f'replica_{_index}'] = {
+        **DATABASES['default'],
+        'HOST': _host,
+        'PORT': _port or DATABASES['default']['PORT'],
+    }
+    DATABASE_REPLICAS.append(f'replica_{_index}')
+DATABASE_ROUTERS = ['sensors.app.routers.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+# Сколько потоков с отдельными соединениями к БД выполняют запросы async-эндпоинтов /api/async/
+ASYNC_DB_THREADS = int(os.environ.get('ASYNC_DB_THREADS', 16))
+
+# Кэш: по умолчанию в памяти процесса. При нескольких процессах-воркерах нужен общий
+# бэкенд (Redis, Memcached, БД), иначе сброс кэша после записи виден только одному из них
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', ''),
+    },
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
@@ -94,6 +125,89 @@ REST_FRAMEWORK = {
 }
 
 
+# Загрузка событий из файлов
+# Размер порции, которой события валидируются и пишутся в БД
+EVENTS_LOAD_CHUNK_SIZE = int(os.environ.get('EVENTS_LOAD_CHUNK_SIZE', 5000))
+# С какого размера пачки события вставляются через COPY FROM STDIN (только PostgreSQL + psycopg2),
+# пустое значение - всегда через ORM bulk_create
+EVENTS_COPY_MIN_BATCH = (
+    int(os.environ.get('EVENTS_COPY_MIN_BATCH', 500)) if os.environ.get('EVENTS_COPY_MIN_BATCH', '500') else None
+)
+# Максимальный размер загружаемого файла в байтах, пустое значение - без ограничения
+EVENTS_UPLOAD_MAX_SIZE = int(os.environ['EVENTS_UPLOAD_MAX_SIZE']) if os.environ.get('EVENTS_UPLOAD_MAX_SIZE') else None
+# Тип датчиков, которые загрузка с auto_create_sensors создаёт для неизвестных sensor_id
+EVENTS_AUTO_CREATE_SENSOR_TYPE = int(os.environ.get('EVENTS_AUTO_CREATE_SENSOR_TYPE', 1))
+# Партиции событий (команда event_partitions): на сколько месяцев вперёд создавать,
+# сколько месяцев хранить (пусто - без удаления) и куда выгружать удаляемые партиции
+EVENTS_PARTITION_AHEAD_MONTHS = int(os.environ.get('EVENTS_PARTITION_AHEAD_MONTHS', 3))
+EVENTS_RETENTION_MONTHS = (
+    int(os.environ['EVENTS_RETENTION_MONTHS']) if os.environ.get('EVENTS_RETENTION_MONTHS') else None
+)
+EVENTS_ARCHIVE_DIR = os.environ.get('EVENTS_ARCHIVE_DIR') or None
+# Пагинация списков событий по умолчанию: page - страницы с номерами и count,
+# cursor - keyset по (created_at, id) без COUNT(*). Меняется параметром ?pagination=
+EVENTS_PAGINATION = os.environ.get('EVENTS_PAGINATION', 'page')
+# Свёртка старых событий (команда compact_events): события старше COMPACT_AFTER_DAYS дней
+# заменяются агрегатами EventRollup по датчику и интервалу ROLLUP_INTERVAL (minute, hour, day),
+# за одну транзакцию удаляется не больше COMPACT_BATCH_SIZE событий
+EVENTS_COMPACT_AFTER_DAYS = int(os.environ.get('EVENTS_COMPACT_AFTER_DAYS', 30))
+EVENTS_ROLLUP_INTERVAL = os.environ.get('EVENTS_ROLLUP_INTERVAL', 'hour')
+EVENTS_COMPACT_BATCH_SIZE = int(os.environ.get('EVENTS_COMPACT_BATCH_SIZE', 10_000))
+# Фоновые задачи загрузки: число потоков-обработчиков и каталог для сохранённых файлов
+EVENTS_IMPORT_WORKERS = int(os.environ.get('EVENTS_IMPORT_WORKERS', 2))
+# Сколько процессов может запросить одна фоновая загрузка (поле workers)
+EVENTS_IMPORT_MAX_PROCESSES = int(os.environ.get('EVENTS_IMPORT_MAX_PROCESSES', os.cpu_count() or 1))
+EVENTS_IMPORT_SPOOL_DIR = os.environ.get(
+    'EVENTS_IMPORT_SPOOL_DIR',
+    os.path.join(tempfile.gettempdir(), 'sensors-imports'),
+)
+# Выгрузка событий /api/events/export/: сколько строк читается из курсора и отправляется за раз
+EVENTS_EXPORT_CHUNK_SIZE = int(os.environ.get('EVENTS_EXPORT_CHUNK_SIZE', 2000))
+# Списки событий без ModelSerializer: строки values_list и рендеринг через orjson, 0 - через DRF
+EVENTS_FAST_SERIALIZATION = os.environ.get('EVENTS_FAST_SERIALIZATION', '1') == '1'
+
+# Отложенная запись POST /api/events/: события копятся в памяти процесса и пишутся пачками
+# до BATCH_SIZE или раз в INTERVAL секунд, ответ 202 приходит до записи в БД. Это выбор
+# пропускной способности против надёжности: при падении процесса теряется содержимое очереди
+# (не больше MAX_QUEUE событий), при заполненной очереди клиент получает 429.
+# 0 - каждое событие пишется в БД до ответа 201
+EVENTS_WRITE_BEHIND = os.environ.get('EVENTS_WRITE_BEHIND', '0') == '1'
+EVENTS_WRITE_BEHIND_BATCH_SIZE = int(os.environ.get('EVENTS_WRITE_BEHIND_BATCH_SIZE', 1000))
+EVENTS_WRITE_BEHIND_INTERVAL = float(os.environ.get('EVENTS_WRITE_BEHIND_INTERVAL', 0.5))
+EVENTS_WRITE_BEHIND_MAX_QUEUE = int(os.environ.get('EVENTS_WRITE_BEHIND_MAX_QUEUE', 50_000))
+
+# Кэш ответов списков и карточек датчиков и событий: алиас из CACHES и время жизни
+# записи в секундах, 0 - без кэша. Записи датчиков и событий сбрасывают его сразу
+RESPONSE_CACHE_ALIAS = os.environ.get('RESPONSE_CACHE_ALIAS', 'default')
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get('RESPONSE_CACHE_TIMEOUT', 60))
+
+# Кэш существующих ID датчиков для проверки событий: время жизни записи в секундах
+# (0 - проверять в БД каждый раз), размер LRU в памяти процесса и необязательный алиас
+# из CACHES, общий для процессов, чтобы удаление датчика было видно всем сразу
+SENSOR_ID_CACHE_TTL = int(os.environ.get('SENSOR_ID_CACHE_TTL', 60))
+SENSOR_ID_CACHE_MAX_SIZE = int(os.environ.get('SENSOR_ID_CACHE_MAX_SIZE', 100_000))
+SENSOR_ID_CACHE_ALIAS = os.environ.get('SENSOR_ID_CACHE_ALIAS') or None
+
+# Метрики /metrics в формате Prometheus: время ответа, SQL-запросы по маршрутам и счётчики
+# загрузок. Считаются в памяти процесса, 0 - middleware не подключается
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+
+# Профилирование медленных запросов (включается на время расследования): SQL, EXPLAIN
+# самых долгих SELECT и cProfile представления для запросов дольше
+# THRESHOLD_MS или доли SAMPLE_RATE. Последние BUFFER_SIZE профилей процесса отдаёт
+# /debug/slow-requests/ администраторам
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '0') == '1'
+PROFILING_THRESHOLD_MS = float(os.environ.get('PROFILING_THRESHOLD_MS', 500))
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_BUFFER_SIZE = int(os.environ.get('PROFILING_BUFFER_SIZE', 50))
+# Сколько SQL-запросов одного запроса запоминать и для скольких самых долгих делать EXPLAIN
+PROFILING_MAX_QUERIES = int(os.environ.get('PROFILING_MAX_QUERIES', 200))
+PROFILING_EXPLAIN_QUERIES = int(os.environ.get('PROFILING_EXPLAIN_QUERIES', 3))
+PROFILING_EXPLAIN_TIMEOUT_MS = int(os.environ.get('PROFILING_EXPLAIN_TIMEOUT_MS', 5000))
+# EXPLAIN (ANALYZE, BUFFERS) вместо EXPLAIN: фактическое время, но запрос выполняется ещё раз до ответа
+PROFILING_EXPLAIN_ANALYZE = os.environ.get('PROFILING_EXPLAIN_ANALYZE', '0') == '1'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
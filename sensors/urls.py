@@ -5,9 +5,13 @@ from drf_yasg.views import get_schema_view
 from rest_framework import permissions
 from rest_framework.routers import DefaultRouter
 
+from sensors.app import async_views
 from sensors.app.views import EventViewSet
+from sensors.app.views import ImportJobAPIView
 from sensors.app.views import LoadEventsAPIView
 from sensors.app.views import SensorViewSet
+from sensors.app.views import SlowRequestProfileAPIView
+from sensors.app.views import metrics_view
 
 
 schema_view = get_schema_view(
@@ -37,4 +41,16 @@ urlpatterns = [
         LoadEventsAPIView.as_view(),
         name='load-events',
     ),
+    path(
+        'load-events/<uuid:job_id>/',
+        ImportJobAPIView.as_view(),
+        name='load-events-job',
+    ),
+    path('metrics', metrics_view, name='metrics'),
+    path('debug/slow-requests/', SlowRequestProfileAPIView.as_view(), name='slow-requests'),
+    # async-версии горячих эндпоинтов для Uvicorn
+    path('async/events/', async_views.event_list, name='async-events-list'),
+    path('async/sensors/<int:pk>/', async_views.sensor_detail, name='async-sensors-detail'),
+    path('async/sensors/<int:pk>/events/', async_views.sensor_events, name='async-sensors-events'),
+    path('async/load-events/', async_views.load_events, name='async-load-events'),
 ]